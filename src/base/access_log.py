@@ -0,0 +1,180 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.utils.functional import empty
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AccessLogWriter:
+    """
+    Writes access log records as JSON lines from a background thread.
+
+    `put` never blocks the request: records go to a bounded queue and are dropped, and counted, when it is full.
+    The thread writes them in batches of up to `ACCESS_LOG_BATCH_SIZE` records, at least every
+    `ACCESS_LOG_FLUSH_INTERVAL` seconds, and reports the records dropped since the previous batch with a
+    `access_log.dropped` record.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.dropped = 0
+        self._unreported = 0
+        self._lock = threading.Lock()
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def put(self, record: Dict[str, Any]) -> None:
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._unreported += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Also restarts the thread in a forked worker, threads do not survive a fork.
+            self._queue = queue.Queue(maxsize=settings.ACCESS_LOG_QUEUE_SIZE)
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name='access-log', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """ Writes the queued records and stops the thread. """
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self, records: queue.Queue) -> None:
+        stream = sys.stdout if self.path == '-' else open(self.path, 'a', encoding='utf-8')
+        stopped = False
+        while not stopped:
+            batch = [records.get()]
+            deadline = time.monotonic() + settings.ACCESS_LOG_FLUSH_INTERVAL
+            while len(batch) < settings.ACCESS_LOG_BATCH_SIZE and batch[-1] is not _STOP:
+                try:
+                    batch.append(records.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stopped = True
+            self._write(stream, batch)
+        if stream is not sys.stdout:
+            stream.close()
+
+    def _write(self, stream, batch: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            unreported, self._unreported = self._unreported, 0
+        if unreported:
+            batch.append({'time': time.time(), 'event': 'access_log.dropped', 'count': unreported})
+        lines = []
+        for record in batch:
+            record['time'] = datetime.fromtimestamp(record['time'], timezone.utc).isoformat(timespec='milliseconds')
+            lines.append(json.dumps(record, separators=(',', ':'), default=str))
+        if not lines:
+            return
+        try:
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
+        except (OSError, ValueError) as error:
+            with self._lock:
+                self.dropped += len(lines)
+            logger.warning('Dropped %s access log records: %s', len(lines), error)
+
+
+_writers: Dict[str, AccessLogWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path: str) -> AccessLogWriter:
+    """ Returns the writer of the path, one per process, flushed when the process exits. """
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = AccessLogWriter(path)
+            atexit.register(writer.close)
+    return writer
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class AccessLogMiddleware:
+    """
+    Logs every request as a JSON record with the user id, URL name, status, latency and number of database queries,
+    to the `ACCESS_LOG` file, or stdout for "-". Not used when `ACCESS_LOG` is empty.
+
+    Must come first in `MIDDLEWARE` so that the latency covers the other middleware.
+    """
+
+    def __init__(self, get_response) -> None:
+        if not settings.ACCESS_LOG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.writer = get_writer(settings.ACCESS_LOG)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        started = time.time()
+        started_counter = time.perf_counter()
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        latency = time.perf_counter() - started_counter
+
+        resolver_match = request.resolver_match
+        record = {
+            'time': started,
+            'method': request.method,
+            'path': request.path,
+            'url_name': resolver_match.url_name if resolver_match else None,
+            'status': response.status_code,
+            'latency_ms': round(latency * 1000, 2),
+            'queries': counter.count,
+            'user_id': self.user_id(request),
+        }
+        shed_reason = getattr(response, 'shed_reason', None)
+        if shed_reason:
+            record['shed'] = shed_reason
+        self.writer.put(record)
+        return response
+
+    def user_id(self, request: HttpRequest) -> Optional[int]:
+        """ The id of the user when the request already loaded it, loading it here would cost queries. """
+        user = getattr(request, 'user', None)
+        if user is None or getattr(user, '_wrapped', None) is empty:
+            return None
+        return user.id
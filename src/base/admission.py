@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+AUTH = 'auth'
+READS = 'reads'
+WRITES = 'writes'
+
+AUTH_URL_NAMES = {
+    'login', 'logout', 'register', 'change_password', 'google_login', 'google_login_redirect', 'google_login_callback',
+}
+# Long-lived connections, they would hold a slot for as long as the client stays connected.
+EXEMPT_URL_NAMES = {'event_stream'}
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class AdmissionController:
+    """
+    Counts the requests in flight in the process, per endpoint class and in total, and refuses new ones over the
+    `ADMISSION_CLASS_LIMITS` and `ADMISSION_MAX_CONCURRENCY` limits. The last `ADMISSION_READ_RESERVE` slots of the
+    total are kept for reads, so cheap reads are still served when writes or logins pile up.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.in_flight: Counter = Counter()
+        self.admitted: Counter = Counter()
+        self.shed: Counter = Counter()
+        self._unreported: Counter = Counter()
+        self._reported_at = time.monotonic()
+
+    def acquire(self, endpoint_class: str) -> Optional[str]:
+        """ Takes a slot, returns None when admitted or the reason the request is shed. """
+        with self._lock:
+            total = sum(self.in_flight.values())
+            limit = settings.ADMISSION_MAX_CONCURRENCY
+            if endpoint_class != READS:
+                limit -= settings.ADMISSION_READ_RESERVE
+            if total >= limit:
+                return self._shed(endpoint_class, 'concurrency')
+            if self.in_flight[endpoint_class] >= settings.ADMISSION_CLASS_LIMITS.get(endpoint_class, limit):
+                return self._shed(endpoint_class, 'class_limit')
+            self.in_flight[endpoint_class] += 1
+            self.admitted[endpoint_class] += 1
+            return None
+
+    def release(self, endpoint_class: str) -> None:
+        with self._lock:
+            self.in_flight[endpoint_class] -= 1
+
+    def shed_late(self, endpoint_class: str) -> str:
+        with self._lock:
+            return self._shed(endpoint_class, 'deadline')
+
+    def _shed(self, endpoint_class: str, reason: str) -> str:
+        self.shed[(endpoint_class, reason)] += 1
+        self._unreported[(endpoint_class, reason)] += 1
+        now = time.monotonic()
+        if now - self._reported_at >= settings.ADMISSION_REPORT_INTERVAL:
+            counts = {f'{name}/{why}': count for (name, why), count in sorted(self._unreported.items())}
+            logger.warning('Shed %s requests in %.0fs: %s', sum(counts.values()), now - self._reported_at, counts)
+            self._unreported.clear()
+            self._reported_at = now
+        return reason
+
+    def metrics(self) -> dict:
+        """ Snapshot of the counters of the process """
+        with self._lock:
+            return {
+                'in_flight': dict(self.in_flight),
+                'admitted': dict(self.admitted),
+                'shed': {f'{name}/{reason}': count for (name, reason), count in sorted(self.shed.items())},
+            }
+
+
+controller = AdmissionController()
+
+
+def endpoint_class(request: HttpRequest) -> Optional[str]:
+    """ auth, reads or writes, None for the endpoints exempt from admission control """
+    try:
+        url_name = resolve(request.path_info).url_name
+    except Resolver404:
+        url_name = None
+    if url_name in EXEMPT_URL_NAMES:
+        return None
+    if url_name in AUTH_URL_NAMES:
+        return AUTH
+    return READS if request.method in READ_METHODS else WRITES
+
+
+def queued_for(request: HttpRequest) -> float:
+    """
+    Seconds the request waited in front of the app, from the `X-Request-Start` header a proxy may set
+    (`t=<seconds>`, milliseconds or microseconds since the epoch, as nginx and Heroku do). 0 without the header.
+    """
+    value = request.headers.get('X-Request-Start', '').removeprefix('t=')
+    try:
+        started = float(value)
+    except ValueError:
+        return 0.0
+    now = time.time()
+    while started > now * 10:
+        started /= 1000
+    return max(now - started, 0.0)
+
+
+def shed_response(reason: str) -> JsonResponse:
+    response = JsonResponse(
+        {'message': 'The server is overloaded, retry later'},
+        status=503,
+        headers={'Retry-After': str(settings.ADMISSION_RETRY_AFTER)},
+    )
+    response.shed_reason = reason
+    return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Answers with a fast 503 and `Retry-After` the requests the worker should not start: over the concurrency limits
+    of the process or of their endpoint class (see `AdmissionController`), or already queued for longer than
+    `ADMISSION_QUEUE_TIMEOUT` seconds. Not used when `ADMISSION_MAX_CONCURRENCY` is 0.
+
+    Comes right after the access log in `MIDDLEWARE`, so that shed requests cost neither a session nor a query.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        if not settings.ADMISSION_MAX_CONCURRENCY:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def admit(self, request: HttpRequest) -> tuple[Optional[str], Optional[HttpResponse]]:
+        name = endpoint_class(request)
+        if name is None:
+            return None, None
+        if settings.ADMISSION_QUEUE_TIMEOUT and queued_for(request) > settings.ADMISSION_QUEUE_TIMEOUT:
+            return None, shed_response(controller.shed_late(name))
+        reason = controller.acquire(name)
+        if reason is not None:
+            return None, shed_response(reason)
+        return name, None
+
+    def __call__(self, request: HttpRequest):
+        if self.async_mode:
+            return self.__acall__(request)
+        name, response = self.admit(request)
+        if response is not None:
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            if name is not None:
+                controller.release(name)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        name, response = self.admit(request)
+        if response is not None:
+            return response
+        try:
+            return await self.get_response(request)
+        finally:
+            if name is not None:
+                controller.release(name)
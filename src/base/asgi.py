@@ -3,6 +3,9 @@ ASGI config for base project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project with this callable to enable the Server-Sent Events stream (``teams_app.streams``),
+which keeps one idle connection per dashboard instead of polling.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
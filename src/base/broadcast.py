@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Bounded event buffer of a single streaming connection.
+
+    Events may be pushed from any thread; they are handed to the connection's event loop. When the consumer is
+    too slow and the buffer is full, the oldest event is dropped and the consumer is told to resync.
+    """
+
+    def __init__(self, user_id: int, maxsize: int) -> None:
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def push(self, event: Dict[str, Any]) -> None:
+        """ Schedule the event on the connection's loop. """
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: Dict[str, Any]) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.overflowed = True
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """ Wait for the next event, returns None on timeout. """
+        if self.overflowed:
+            self.overflowed = False
+            return {'type': 'resync', 'data': {}}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broadcaster:
+    """ In-process fan-out of events to the subscriptions of each user. """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[int, set] = defaultdict(set)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        try:
+            # A process serving only streams never publishes, it must still listen to the events of the others.
+            get_backend()
+        except Exception as error:
+            logger.warning(
+                'Failed to start the events backend, only the events of this process are streamed: %s', error,
+            )
+        subscription = Subscription(user_id, settings.EVENTS_BUFFER_SIZE)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def deliver(self, user_id: int, event: Dict[str, Any]) -> None:
+        """ Push the event to every local subscription of the user. """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        self._push(subscriptions, event)
+
+    def deliver_to_all(self, event: Dict[str, Any]) -> None:
+        """ Push the event to every local subscription. """
+        with self._lock:
+            subscriptions = [subscription for user in self._subscriptions.values() for subscription in user]
+        self._push(subscriptions, event)
+
+    def _push(self, subscriptions: list, event: Dict[str, Any]) -> None:
+        for subscription in subscriptions:
+            try:
+                subscription.push(event)
+            except RuntimeError:
+                # The connection's loop is already closed.
+                self.unsubscribe(subscription)
+
+
+class LocalBackend:
+    """ Delivers events to the connections of the current process only. """
+
+    def __init__(self, broadcaster: Broadcaster) -> None:
+        self.broadcaster = broadcaster
+
+    def publish(self, user_id: int, event: Dict[str, Any]) -> None:
+        self.broadcaster.deliver(user_id, event)
+
+
+class RedisBackend:
+    """
+    Relays events through Redis pub/sub, so that every process sees the events published by the others.
+
+    Requires the optional `redis` package and the `EVENTS_REDIS_URL` setting. When the subscription to Redis is lost,
+    it is made again with an exponential backoff (`EVENTS_REDIS_RECONNECT_BACKOFF` up to
+    `EVENTS_REDIS_RECONNECT_BACKOFF_MAX` seconds) and the local connections are told to resync, they may have missed
+    events in between.
+    """
+
+    channel_prefix = 'teams_app:events:'
+
+    def __init__(self, broadcaster: Broadcaster) -> None:
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBackend requires the "redis" package.')
+        if not settings.EVENTS_REDIS_URL:
+            raise ImproperlyConfigured('RedisBackend requires the EVENTS_REDIS_URL setting.')
+
+        self.broadcaster = broadcaster
+        self.client = redis.Redis.from_url(settings.EVENTS_REDIS_URL)
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def publish(self, user_id: int, event: Dict[str, Any]) -> None:
+        self.client.publish(f'{self.channel_prefix}{user_id}', json.dumps(event))
+
+    def _listen(self) -> None:
+        delay = settings.EVENTS_REDIS_RECONNECT_BACKOFF
+        reconnecting = False
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                try:
+                    pubsub.psubscribe(f'{self.channel_prefix}*')
+                    if reconnecting:
+                        logger.info('Subscribed to the Redis events again.')
+                        self.broadcaster.deliver_to_all({'type': 'resync', 'data': {}})
+                    delay, reconnecting = settings.EVENTS_REDIS_RECONNECT_BACKOFF, False
+                    for message in pubsub.listen():
+                        self._deliver(message)
+                finally:
+                    pubsub.close()
+            except Exception as error:
+                # Any error of the connection, the thread must outlive Redis restarts.
+                logger.warning('Lost the Redis events subscription, reconnecting in %.1fs: %s', delay, error)
+            reconnecting = True
+            time.sleep(delay)
+            delay = min(delay * 2, settings.EVENTS_REDIS_RECONNECT_BACKOFF_MAX)
+
+    def _deliver(self, message: Dict[str, Any]) -> None:
+        try:
+            user_id = int(message['channel'].decode().removeprefix(self.channel_prefix))
+            self.broadcaster.deliver(user_id, json.loads(message['data']))
+        except (ValueError, KeyError) as error:
+            logger.warning('Ignoring malformed event message: %s', error)
+
+
+broadcaster = Broadcaster()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """ Returns the configured `EVENTS_BACKEND`, created on first use. """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.EVENTS_BACKEND)(broadcaster)
+    return _backend
+
+
+def publish(user_id: int, event_type: str, data: Dict[str, Any]) -> None:
+    """ Publishes an event to the streaming connections of the given user. """
+    try:
+        get_backend().publish(user_id, {'type': event_type, 'data': data})
+    except Exception as error:
+        # Streaming is best effort and must never break the write that triggered it.
+        logger.warning('Failed to publish "%s" event: %s', event_type, error)
@@ -0,0 +1,99 @@
+import threading
+import time
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """ Runs a function once per key at a time, concurrent callers with the same key share its outcome. """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = func()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+
+flights = SingleFlight()
+
+
+def _lock_key(key: str) -> str:
+    return f'{key}:lock'
+
+
+def _store(key: str, value: Any, timeout: int) -> None:
+    entry = {'value': value, 'refresh_at': time.time() + timeout}
+    cache.set(key, entry, timeout + settings.COALESCE_STALE_TIMEOUT)
+
+
+def _fetch(key: str, compute: Callable[[], Any], timeout: int, cacheable: Callable[[Any], bool]) -> Any:
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['refresh_at'] > time.time():
+            return entry['value']
+        if not cache.add(_lock_key(key), 1, settings.COALESCE_LOCK_TIMEOUT):
+            # Another process is refreshing the entry, the stale value is good enough meanwhile.
+            return entry['value']
+    else:
+        deadline = time.monotonic() + settings.COALESCE_WAIT_TIMEOUT
+        while not cache.add(_lock_key(key), 1, settings.COALESCE_LOCK_TIMEOUT):
+            time.sleep(settings.COALESCE_POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['value']
+            if time.monotonic() > deadline:
+                # The holder is too slow or died, stop waiting for it.
+                return compute()
+
+    try:
+        value = compute()
+        if cacheable(value):
+            _store(key, value, timeout)
+    finally:
+        cache.delete(_lock_key(key))
+    return value
+
+
+def coalesce(key: str, compute: Callable[[], Any], timeout: int, cacheable: Callable[[Any], bool] = bool) -> Any:
+    """
+    Returns the value cached under the key, computing it at most once at a time.
+
+    Concurrent callers of the process share one computation. Across processes a cache lock elects the caller
+    that computes, the others wait for its result for up to `COALESCE_WAIT_TIMEOUT` seconds. After `timeout`
+    seconds the entry is refreshed by one caller while the others keep getting the previous value for up to
+    `COALESCE_STALE_TIMEOUT` more seconds, so an expiring entry never causes a stampede.
+
+    Values rejected by `cacheable` are shared with the concurrent callers but not cached.
+    """
+    return flights.do(key, lambda: _fetch(key, compute, timeout, cacheable))
@@ -0,0 +1,46 @@
+#!/bin/sh
+# Production entrypoint: prepares the release once, then hands over to the multi-worker server.
+#
+# collectstatic, migrate and the OpenAPI schema generation only run when their inputs changed since the
+# last successful run, tracked with checksum stamps. The collectstatic stamp lives in the static volume
+# itself, the others in $STAMP_DIR. The migrate stamp also covers the shard list and the identity of the
+# SQLite files, any other database must be migrated with FORCE_SETUP=1 after it is replaced.
+set -e
+
+cd "$(dirname "$0")/../.."
+
+STAMP_DIR="${STAMP_DIR:-.stamps}"
+mkdir -p "$STAMP_DIR"
+
+checksum() {
+    # Checksum of the content of the files matched by find(1) arguments.
+    find "$@" -type f -not -path '*/__pycache__/*' | LC_ALL=C sort | xargs cat | sha256sum | cut -d ' ' -f 1
+}
+
+run_if_changed() {
+    stamp="$1"
+    sum="$2"
+    shift 2
+    if [ "${FORCE_SETUP:-0}" != "1" ] && [ "$(cat "$stamp" 2>/dev/null)" = "$sum" ]; then
+        echo "Skipping $*, nothing changed."
+        return
+    fi
+    "$@"
+    echo "$sum" > "$stamp"
+}
+
+packages_sum="$(pip freeze | sha256sum | cut -d ' ' -f 1)"
+static_sum="$( (echo "$packages_sum"; checksum . -path '*/static/*' -not -path './static/*') | sha256sum | cut -d ' ' -f 1)"
+migrations_sum="$( (checksum . -path '*/migrations/*.py'; echo "${SHARD_DATABASES:-}"; ls -i ./*.sqlite3 2>/dev/null || true) | sha256sum | cut -d ' ' -f 1)"
+source_sum="$( (echo "$packages_sum"; checksum . -name '*.py') | sha256sum | cut -d ' ' -f 1)"
+
+mkdir -p static
+run_if_changed static/.collectstatic.stamp "$static_sum" python manage.py collectstatic --noinput
+run_if_changed "$STAMP_DIR/migrate" "$migrations_sum" python manage.py migrate_shards --noinput
+run_if_changed "$STAMP_DIR/openapi" "$source_sum" python manage.py generate_openapi_schema
+python manage.py create_admin
+
+# Structured access log of the app on stdout, see ACCESS_LOG in the settings.
+export ACCESS_LOG="${ACCESS_LOG:--}"
+
+exec gunicorn --config base/gunicorn.conf.py
@@ -0,0 +1,62 @@
+"""
+Measures the throughput of a running server, e.g. to compare the production server with `runserver`:
+
+    python base/docker/throughput.py http://127.0.0.1:8000/swagger/ --concurrency 16 --duration 10
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def hammer(url: str, deadline: float, results: list, lock: threading.Lock) -> None:
+    """ Sends requests over one keep-alive connection until the deadline. """
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    done = errors = 0
+    while time.monotonic() < deadline:
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors += 1
+            done += 1
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+    with lock:
+        results.append((done, errors))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    results, lock = [], threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=hammer, args=(args.url, deadline, results, lock))
+        for _ in range(args.concurrency)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    requests = sum(done for done, _ in results)
+    errors = sum(failed for _, failed in results)
+    print(f'{requests} requests in {elapsed:.1f}s, {requests / elapsed:.1f} req/s, {errors} errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Gunicorn configuration of the production server.
+
+Every option can be overridden with an environment variable:
+
+- SERVER_MODE: ``wsgi`` (default) runs threaded sync workers on ``base.wsgi``, ``asgi`` runs uvicorn workers
+  on ``base.asgi`` and is required by the event stream.
+- WEB_CONCURRENCY: number of worker processes, defaults to ``2 * CPUs + 1``.
+- GUNICORN_THREADS: threads per worker in ``wsgi`` mode.
+- GUNICORN_PRELOAD: import the application once in the master before forking workers.
+- GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER: recycle workers after that many requests.
+- GUNICORN_TIMEOUT / GUNICORN_GRACEFUL_TIMEOUT: seconds before a stuck worker is killed
+  and seconds workers get to finish their requests on shutdown or reload.
+- GUNICORN_WARMUP: warm every worker up (``base.startup.warm_up``) before it accepts requests, on by default.
+"""
+import multiprocessing
+import os
+
+server_mode = os.environ.get('SERVER_MODE', 'wsgi')
+
+if server_mode == 'asgi':
+    wsgi_app = 'base.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'base.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', None)
+errorlog = '-'
+
+warmup = os.environ.get('GUNICORN_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+
+
+def post_worker_init(worker):
+    """ Runs in every new worker once the app is loaded, so that its first request is not slower than the others. """
+    if warmup:
+        from base.startup import open_connections_in, warm_up
+
+        warm_up()
+        # gthread workers serve the requests from a thread pool, every thread has its own database connections.
+        if getattr(worker, 'tpool', None) is not None:
+            open_connections_in(worker.tpool, worker.cfg.threads)
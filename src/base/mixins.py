@@ -1,21 +1,110 @@
-from rest_framework import status
+import hashlib
+from typing import Callable
+
+from django.conf import settings
+from rest_framework import serializers, status
 from rest_framework.request import Request
 from rest_framework.response import Response
 
+from .coalescing import coalesce
+
 
 class ListMixin:
-    """ Add pagination to the list """
+    """
+    Add pagination to the list
+
+    Views with a `read_serializer_class` (a `base.serializers.ValuesSerializer`) serialize `values()` rows with it
+    instead of model instances with the `serializer_class`.
+    """
+    read_serializer_class = None
+
     def list(self: Request, request, *args, **kwargs) -> Response:
         """ Add pagination to the list """
         queryset = self.filter_queryset(self.get_queryset())
+        if self.read_serializer_class is not None:
+            queryset = self.read_serializer_class.values(queryset)
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
             response_data = {
                 "pages": (queryset.count() + self.pagination_class.page_size - 1) // self.pagination_class.page_size,
-                "data": serializer.data,
+                "data": self.serialize_list(page),
             }
             return Response(response_data, status=status.HTTP_200_OK)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(self.serialize_list(queryset), status=status.HTTP_200_OK)
+
+    def serialize_list(self, objects) -> list:
+        """ Serialize the objects of the list """
+        if self.read_serializer_class is not None:
+            return self.read_serializer_class(context=self.get_serializer_context()).serialize(objects)
+        return self.get_serializer(objects, many=True).data
+
+
+class MultiGetMixin:
+    """
+    Retrieve the objects of the comma separated `ids` query parameter, at most `MULTI_GET_MAX_IDS` of them, in one
+    `IN` query on `get_queryset()`, serialized in the requested order by the `read_serializer_class`. The ids that
+    are not found are listed in `missing` instead of failing the whole batch.
+    """
+    read_serializer_class = None
+
+    class InputSerializer(serializers.Serializer):
+        ids = serializers.CharField()
+
+        def validate_ids(self, value: str) -> list[int]:
+            try:
+                ids = [int(item) for item in value.split(',') if item.strip()]
+            except ValueError:
+                raise serializers.ValidationError('Expected comma separated ids.')
+            ids = list(dict.fromkeys(ids))
+            if not ids:
+                raise serializers.ValidationError('Expected comma separated ids.')
+            if len(ids) > settings.MULTI_GET_MAX_IDS:
+                raise serializers.ValidationError(f'At most {settings.MULTI_GET_MAX_IDS} ids are allowed.')
+            if not all(0 < pk < 2 ** 63 for pk in ids):
+                raise serializers.ValidationError('Ids must be positive integers.')
+            return ids
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        """ Retrieve the objects of the requested ids """
+        input_serializer = self.InputSerializer(data=request.GET)
+        input_serializer.is_valid(raise_exception=True)
+        ids = input_serializer.validated_data['ids']
+
+        rows = self.read_serializer_class.values(self.get_queryset().filter(pk__in=ids))
+        serializer = self.read_serializer_class(context=self.get_serializer_context())
+        objects = {item['id']: item for item in serializer.serialize(rows)}
+        response_data = {
+            'data': [objects[pk] for pk in ids if pk in objects],
+            'missing': [pk for pk in ids if pk not in objects],
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+class CoalescedReadMixin:
+    """
+    Share the response of identical GET requests, see `base.coalescing.coalesce`.
+
+    Responses are keyed by user, URL and `data_version(user)`, which must change on every write that could change
+    them, so a shared response is never older than the user's last write.
+    """
+    data_version: Callable = None
+    coalesce_timeout = settings.COALESCE_CACHE_TIMEOUT
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        """ Compute the response once for all identical requests """
+        if not request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        url_hash = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+        version = self.data_version(request.user)
+        key = f'coalesce:{request.resolver_match.url_name}:{request.user.id}:{version}:{url_hash}'
+
+        def compute() -> tuple[int, dict]:
+            response = super(CoalescedReadMixin, self).get(request, *args, **kwargs)
+            return response.status_code, response.data
+
+        status_code, data = coalesce(
+            key, compute, self.coalesce_timeout, cacheable=lambda result: result[0] == status.HTTP_200_OK,
+        )
+        return Response(data, status=status_code)
@@ -0,0 +1,112 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.http import HttpRequest, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+_replica_reads: ContextVar[set | None] = ContextVar('replica_reads', default=None)
+_down_until: dict[str, float] = {}
+
+
+def primary_of(alias: str) -> str:
+    """ Returns the primary database of a replica alias, or the alias itself. """
+    for primary, replicas in settings.DATABASE_REPLICAS.items():
+        if alias in replicas:
+            return primary
+    return alias
+
+
+def is_replica(alias: str) -> bool:
+    return primary_of(alias) != alias
+
+
+def pick_replica(primary: str) -> str:
+    """
+    Returns a healthy replica of the primary when replica reads are enabled for the current context, else the
+    primary itself.
+    """
+    used = _replica_reads.get()
+    if used is None:
+        return primary
+    now = time.monotonic()
+    replicas = [alias for alias in settings.DATABASE_REPLICAS.get(primary, []) if _down_until.get(alias, 0) <= now]
+    if not replicas:
+        return primary
+    alias = random.choice(replicas)
+    used.add(alias)
+    return alias
+
+
+def mark_down(aliases: set) -> None:
+    """ Stops routing reads to the replicas for `REPLICA_RETRY_AFTER` seconds. """
+    until = time.monotonic() + settings.REPLICA_RETRY_AFTER
+    for alias in aliases:
+        _down_until[alias] = until
+
+
+@contextmanager
+def replica_reads() -> Iterator[set]:
+    """ Routes the reads made in the block to replicas, yields the replicas picked so far. """
+    used = set()
+    token = _replica_reads.set(used)
+    try:
+        yield used
+    finally:
+        _replica_reads.reset(token)
+
+
+def is_pinned(request: HttpRequest) -> bool:
+    """ Tells whether the client wrote recently enough to be kept on the primary. """
+    try:
+        return float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaReadMiddleware:
+    """
+    Serves the views flagged with `replica_reads = True` from the replicas and keeps clients that wrote on the
+    primary for `REPLICA_PIN_SECONDS`, so that they read their own writes.
+
+    A view that fails on a replica is run again on the primaries and the replicas it used are skipped for a while.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        response = self.get_response(request)
+        if settings.DATABASE_REPLICAS and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            pin_until = time.time() + settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, f'{pin_until:.3f}', max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+            )
+        return response
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs) -> HttpResponse | None:
+        view_class = getattr(view_func, 'view_class', None)
+        if (
+            not settings.DATABASE_REPLICAS
+            or request.method not in ('GET', 'HEAD')
+            or not getattr(view_class, 'replica_reads', False)
+            or is_pinned(request)
+        ):
+            return None
+        if hasattr(request, 'user'):
+            # Load the session and the user from the primary, a lagging replica must not log the client out.
+            request.user.is_authenticated
+        with replica_reads() as used:
+            try:
+                return view_func(request, *view_args, **view_kwargs)
+            except DatabaseError as error:
+                logger.warning('Replica read failed on %s, falling back to the primary: %s', sorted(used), error)
+                mark_down(used)
+        # Let Django call the view again, this time on the primaries.
+        return None
@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, models, router
+
+from .replicas import is_replica, pick_replica, primary_of
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach) of an integer key into `buckets` buckets.
+
+    When a bucket is appended, only the keys that move to the new bucket change their bucket.
+    """
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) % 2 ** 64
+        candidate = int((bucket + 1) * (2 ** 31 / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for_owner(owner_id: int) -> str:
+    """ Returns the database alias holding the teams and members of the given owner. """
+    shards = settings.SHARD_DATABASES
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return shards[jump_hash(int(owner_id), len(shards))]
+
+
+def all_databases() -> list[str]:
+    """ Returns the default database followed by the shards, without duplicates. """
+    return list(dict.fromkeys([DEFAULT_DB_ALIAS, *settings.SHARD_DATABASES]))
+
+
+class OwnerShardRouter:
+    """
+    Places the teams, members, change feed, audit log and idempotency keys of every user on one of the
+    `SHARD_DATABASES`.
+
+    The shard is picked from the owner found in the `instance` hint, which Django passes for related managers
+    (`request.user.teams`), for related objects and for saves and deletes. Every other app lives on the default
+    database. The router is a no-op while `SHARD_DATABASES` is empty.
+    """
+
+    sharded_apps = {'teams_app'}
+    owner_fields = {
+        'teams_app.team': 'owner_id',
+        'teams_app.member': 'user_id',
+        'teams_app.change': 'owner_id',
+        'teams_app.auditevent': 'owner_id',
+        'teams_app.idempotencykey': 'user_id',
+    }
+
+    def _owner_id(self, instance: models.Model | None) -> int | None:
+        if instance is None:
+            return None
+        if isinstance(instance, get_user_model()):
+            return instance.pk
+        field = self.owner_fields.get(instance._meta.label_lower)
+        return getattr(instance, field, None) if field else None
+
+    def _route(self, model, **hints) -> str | None:
+        if not settings.SHARD_DATABASES:
+            return None
+        if model._meta.app_label not in self.sharded_apps:
+            return DEFAULT_DB_ALIAS
+        owner_id = self._owner_id(hints.get('instance'))
+        return shard_for_owner(owner_id) if owner_id is not None else None
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1: models.Model, obj2: models.Model, **hints) -> bool | None:
+        """ Owners live on the default database, their rows on a shard. """
+        if settings.SHARD_DATABASES and self.sharded_apps & {obj1._meta.app_label, obj2._meta.app_label}:
+            return True
+        return None
+
+    def allow_migrate(self, db: str, app_label: str, model_name: str | None = None, **hints) -> bool | None:
+        """
+        Sharded apps are migrated on every database, other apps on the default one only.
+
+        The default database keeps (empty) sharded tables, so that cascades collected there find nothing to do.
+        """
+        if not settings.SHARD_DATABASES:
+            return None
+        if app_label in self.sharded_apps:
+            return db in all_databases()
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of `base.replicas.replica_reads()` blocks to a replica of the database picked by the other
+    routers, and every write back to the primary. Must come first in `DATABASE_ROUTERS`. The router is a no-op
+    while `DATABASE_REPLICAS` is empty.
+    """
+
+    def _primary(self, method: str, model, **hints) -> str:
+        for other in router.routers:
+            if other is self or not hasattr(other, method):
+                continue
+            chosen = getattr(other, method)(model, **hints)
+            if chosen:
+                return primary_of(chosen)
+        instance = hints.get('instance')
+        return primary_of(instance._state.db if instance is not None and instance._state.db else DEFAULT_DB_ALIAS)
+
+    def db_for_read(self, model, **hints) -> str | None:
+        if not settings.DATABASE_REPLICAS:
+            return None
+        return pick_replica(self._primary('db_for_read', model, **hints))
+
+    def db_for_write(self, model, **hints) -> str | None:
+        if not settings.DATABASE_REPLICAS:
+            return None
+        return self._primary('db_for_write', model, **hints)
+
+    def allow_relation(self, obj1: models.Model, obj2: models.Model, **hints) -> bool | None:
+        """ Objects read from a replica may be related to objects of its primary. """
+        if settings.DATABASE_REPLICAS and primary_of(obj1._state.db) == primary_of(obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db: str, app_label: str, model_name: str | None = None, **hints) -> bool | None:
+        """ Replicas are copies of their primary and are never migrated directly. """
+        if is_replica(db):
+            return False
+        return None
+
+
+class OwnerShardedQuerySet(models.QuerySet):
+    """ QuerySet that writes new rows to the shard of their owner. """
+
+    def create(self, **kwargs):
+        """ `Model.objects.create()` carries no instance hint, so route the new row explicitly. """
+        if self._db is None and settings.SHARD_DATABASES:
+            db = router.db_for_write(self.model, instance=self.model(**kwargs))
+            return super(OwnerShardedQuerySet, self.using(db)).create(**kwargs)
+        return super().create(**kwargs)
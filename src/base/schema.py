@@ -0,0 +1,132 @@
+import functools
+import hashlib
+import logging
+import os
+import threading
+from importlib import metadata
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseNotModified
+from django.views.decorators.http import require_safe
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+CODECS = {
+    'json': (OpenAPICodecJson, 'application/json'),
+    'yaml': (OpenAPICodecYaml, 'application/yaml'),
+}
+
+# Libraries whose version changes the generated schema.
+SCHEMA_PACKAGES = ('Django', 'djangorestframework', 'drf-yasg')
+
+logger = logging.getLogger(__name__)
+
+_artifacts: dict[str, tuple[bytes, str]] = {}
+_lock = threading.Lock()
+
+
+def generate_schema():
+    """ Introspects every API view and serializer into an OpenAPI schema, independent of any request. """
+    from .yasg import api_info
+
+    generator = OpenAPISchemaGenerator(api_info)
+    return generator.get_schema(request=None, public=True)
+
+
+def render_schema(schema, format: str) -> bytes:
+    """ Encodes the schema in the given format. """
+    codec_class, _ = CODECS[format]
+    return codec_class(validators=[]).encode(schema)
+
+
+def artifact_path(format: str) -> Path:
+    return Path(settings.OPENAPI_SCHEMA_DIR) / f'schema.{format}'
+
+
+def fingerprint_path() -> Path:
+    return Path(settings.OPENAPI_SCHEMA_DIR) / 'schema.fingerprint'
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint() -> str:
+    """ Checksum of the code the schema is generated from: the project sources and the schema library versions. """
+    digest = hashlib.sha256()
+    for package in SCHEMA_PACKAGES:
+        digest.update(f'{package}=={metadata.version(package)}\n'.encode())
+    base_dir = Path(settings.BASE_DIR)
+    sources = []
+    for directory, subdirectories, files in os.walk(base_dir):
+        subdirectories[:] = [name for name in subdirectories if not name.startswith(('.', '__pycache__'))]
+        sources.extend(Path(directory, name) for name in files if name.endswith('.py'))
+    for source in sorted(sources):
+        digest.update(source.relative_to(base_dir).as_posix().encode())
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def write_artifacts() -> list[Path]:
+    """
+    Generates the schema once and stores it on disk in every format, along with the fingerprint of the code it was
+    generated from. The fingerprint is written last, so an interrupted run leaves a stale artifact.
+    """
+    schema = generate_schema()
+    paths = []
+    for format in CODECS:
+        path = artifact_path(format)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(render_schema(schema, format))
+        paths.append(path)
+    fingerprint_path().write_text(code_fingerprint())
+    return paths
+
+
+def read_artifact(format: str) -> Optional[bytes]:
+    """ Returns the stored schema, or None when there is none or it was generated from other code. """
+    path = artifact_path(format)
+    try:
+        fingerprint = fingerprint_path().read_text().strip()
+        content = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    if fingerprint != code_fingerprint():
+        logger.warning('The OpenAPI schema in %s is stale, run `manage.py generate_openapi_schema`', path)
+        return None
+    return content
+
+
+def get_artifact(format: str) -> tuple[bytes, str]:
+    """
+    Returns the encoded schema and its ETag.
+
+    The schema is read from the artifact written by `generate_openapi_schema` when it was generated from the
+    current code, otherwise it is generated on the first request. Either way it is kept in memory for the life of
+    the process. In DEBUG the schema is generated on every request, so that it follows the code being edited.
+    """
+    if settings.DEBUG:
+        content = render_schema(generate_schema(), format)
+        return content, f'"{hashlib.sha256(content).hexdigest()}"'
+    if format not in _artifacts:
+        with _lock:
+            if format not in _artifacts:
+                content = read_artifact(format)
+                if content is None:
+                    content = render_schema(generate_schema(), format)
+                _artifacts[format] = content, f'"{hashlib.sha256(content).hexdigest()}"'
+    return _artifacts[format]
+
+
+@require_safe
+def schema_artifact_view(request: HttpRequest, format: str) -> HttpResponse:
+    """ Serve the precomputed schema (the live one in DEBUG), answering conditional requests with 304. """
+    if format not in CODECS:
+        raise Http404(f'Unsupported schema format "{format}".')
+    content, etag = get_artifact(format)
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=CODECS[format][1])
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, no-cache'
+    return response
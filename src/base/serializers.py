@@ -0,0 +1,40 @@
+from operator import itemgetter
+from typing import Any, Iterable
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer building the output straight from `QuerySet.values()` rows, without model instances.
+
+    `fields` maps every output key, in output order, to the `values()` lookup it is copied from, or to None for a
+    key computed by a `get_<key>(row)` method. `extra_lookups` are fetched for the methods only. The accessors are
+    resolved once per serializer, so a row costs one dict build.
+    """
+
+    fields: dict[str, str | None] = {}
+    extra_lookups: tuple[str, ...] = ()
+
+    def __init__(self, context: dict | None = None) -> None:
+        self.context = context or {}
+        self._accessors = tuple(
+            (name, itemgetter(lookup) if lookup else getattr(self, f'get_{name}'))
+            for name, lookup in self.fields.items()
+        )
+
+    @classmethod
+    def values(cls, queryset):
+        """ Returns the queryset as rows holding the lookups the serializer needs. """
+        lookups = [lookup for lookup in cls.fields.values() if lookup]
+        return queryset.values(*dict.fromkeys([*lookups, *cls.extra_lookups]))
+
+    def prepare(self, rows: list[dict]) -> None:
+        """ Hook to load the related data of a whole page of rows at once. """
+
+    def to_representation(self, row: dict) -> dict[str, Any]:
+        return {name: accessor(row) for name, accessor in self._accessors}
+
+    def serialize(self, rows: Iterable[dict]) -> list[dict[str, Any]]:
+        rows = list(rows)
+        self.prepare(rows)
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
@@ -25,21 +25,25 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 
     'rest_framework',
-    'drf_yasg',
     'django_filters',
 
     'users',
     'teams_app',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'base.access_log.AccessLogMiddleware',
+    'base.admission.AdmissionControlMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'teams_app.audit.AuditActorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'base.replicas.ReplicaReadMiddleware',
 ]
 
 ROOT_URLCONF = 'base.urls'
@@ -85,6 +89,13 @@ AUTH_PASSWORD_VALIDATORS = [
 # DRF
 
 PAGINATION_PAGE_SIZE = 10
+TEAM_MEMBERS_PREVIEW_SIZE = 10
+CHANGE_FEED_MAX_LIMIT = 1000
+MULTI_GET_MAX_IDS = 100
+MEMBER_BULK_UPDATE_MAX_ITEMS = 100
+MEMBER_IMPORT_MAX_ITEMS = 10000
+STATS_TOP_SIZE = 10
+STATS_CACHE_TIMEOUT = 60 * 60
 
 
 REST_FRAMEWORK = {
@@ -93,6 +104,27 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
 }
 
+# OpenAPI
+
+# Swagger and ReDoc routes, drf_yasg is not even imported without them.
+API_DOCS_ENABLED = env.bool("API_DOCS_ENABLED", default=True)
+if API_DOCS_ENABLED:
+    INSTALLED_APPS.append('drf_yasg')
+
+OPENAPI_SCHEMA_DIR = env.str("OPENAPI_SCHEMA_DIR", default=os.path.join(BASE_DIR, "openapi"))
+OPENAPI_UI_CACHE_TIMEOUT = 60 * 60
+
+SWAGGER_SETTINGS = {
+    "SPEC_URL": "/swagger.json/",
+}
+REDOC_SETTINGS = {
+    "SPEC_URL": "/swagger.json/",
+}
+
+# Admin
+
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100_000
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
@@ -110,17 +142,119 @@ RETRY_MAX_ATTEMPTS = 3
 RETRY_WAIT_FIXED = 1000
 REQUEST_TIMEOUT = 5
 
+# Database connections
+
+# Seconds a thread keeps its database connections open between requests, the worker warm-up opens them.
+CONN_MAX_AGE = env.int("CONN_MAX_AGE", default=60)
+
+# Sharding
+
+# Database aliases holding the teams and members, every owner is placed on one of them by `base.routers`.
+# Appending a shard moves only a part of the owners, run `rebalance_shards` afterwards.
+SHARD_DATABASES = env.list("SHARD_DATABASES", default=[])
+DATABASE_ROUTERS = ["base.routers.ReplicaRouter", "base.routers.OwnerShardRouter"]
+
+# Read replicas
+
+# Replica aliases of the primary database aliases, e.g. {"default": ["default_replica"]}. Views flagged with
+# `replica_reads = True` read from them, unless the client wrote less than REPLICA_PIN_SECONDS ago.
+DATABASE_REPLICAS = {}
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", default=5)
+REPLICA_PIN_COOKIE = "primary_pin"
+REPLICA_RETRY_AFTER = 30
+
+# Request coalescing
+
+# Shared across processes only when the default cache is (Redis, Memcached, database).
+COALESCE_CACHE_TIMEOUT = 30
+COALESCE_STALE_TIMEOUT = 60
+COALESCE_LOCK_TIMEOUT = 10
+COALESCE_WAIT_TIMEOUT = 5
+COALESCE_POLL_INTERVAL = 0.05
+
+# Idempotency keys
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+IDEMPOTENCY_RETRY_AFTER = 1
+
+# Background jobs
+
+JOBS_WORKERS = env.int("JOBS_WORKERS", default=2)
+JOBS_POLL_INTERVAL = env.float("JOBS_POLL_INTERVAL", default=1.0)
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_BACKOFF = 5
+JOBS_RETRY_BACKOFF_MAX = 600
+JOBS_STALE_TIMEOUT = 3600
+
+# Server-Sent Events
+
+EVENTS_BACKEND = env.str("EVENTS_BACKEND", default="base.broadcast.LocalBackend")
+EVENTS_REDIS_URL = env.str("EVENTS_REDIS_URL", default="")
+EVENTS_REDIS_RECONNECT_BACKOFF = 0.5
+EVENTS_REDIS_RECONNECT_BACKOFF_MAX = 30
+EVENTS_BUFFER_SIZE = 100
+EVENTS_HEARTBEAT_INTERVAL = 15
+
+# Startup
+
+# Seconds a fresh worker may spend importing the app and populating the URL resolvers, see `profile_startup`.
+STARTUP_IMPORT_BUDGET = env.float("STARTUP_IMPORT_BUDGET", default=1.5)
+
+# Access log
+
+# JSON lines of every request, written by a background thread: a file path, "-" for stdout, empty to disable.
+ACCESS_LOG = env.str("ACCESS_LOG", default="")
+# Records beyond the queue size are dropped (and counted) instead of slowing the requests down.
+ACCESS_LOG_QUEUE_SIZE = 10000
+ACCESS_LOG_BATCH_SIZE = 500
+ACCESS_LOG_FLUSH_INTERVAL = 1.0
+
+# Audit log
+
+# Events are buffered in process and written in batches by a background thread, at least every
+# AUDIT_LOG_FLUSH_INTERVAL seconds. Beyond AUDIT_LOG_MAX_BUFFER events the requests write them themselves.
+AUDIT_LOG_BATCH_SIZE = 500
+AUDIT_LOG_FLUSH_INTERVAL = 1.0
+AUDIT_LOG_MAX_BUFFER = 10000
+
+# Admission control
+
+# Requests in flight per worker process, the ones beyond get a 503 with Retry-After. 0 disables admission control.
+ADMISSION_MAX_CONCURRENCY = env.int("ADMISSION_MAX_CONCURRENCY", default=32)
+# Requests in flight per worker process and endpoint class: logins hash passwords, writes wait on the `@retry` sleeps
+# when the database stalls. Keep them below the worker threads, so that a stall leaves threads to the reads.
+ADMISSION_CLASS_LIMITS = {
+    "auth": env.int("ADMISSION_AUTH_LIMIT", default=2),
+    "writes": env.int("ADMISSION_WRITES_LIMIT", default=3),
+    "reads": env.int("ADMISSION_READS_LIMIT", default=32),
+}
+# Slots of ADMISSION_MAX_CONCURRENCY only reads may take.
+ADMISSION_READ_RESERVE = env.int("ADMISSION_READ_RESERVE", default=8)
+# Seconds a request may have been queued, per the X-Request-Start header of the proxy, before it is shed.
+ADMISSION_QUEUE_TIMEOUT = env.float("ADMISSION_QUEUE_TIMEOUT", default=5.0)
+ADMISSION_RETRY_AFTER = 1
+# Seconds between the warnings counting the shed requests.
+ADMISSION_REPORT_INTERVAL = 60
+
 # GOOGLE AUTH
 
 BASE_URL = env.str("BASE_URL", default="")
 GOOGLE_OAUTH2_CLIENT_ID = env.str("GOOGLE_OAUTH2_CLIENT_ID", default="")
 GOOGLE_OAUTH2_CLIENT_SECRET = env.str("GOOGLE_OAUTH2_CLIENT_SECRET", default="")
-GOOGLE_ID_TOKEN_INFO_URL = env.str("GOOGLE_ID_TOKEN_INFO_URL", default="")
 GOOGLE_ACCESS_TOKEN_OBTAIN_URL = env.str("GOOGLE_ACCESS_TOKEN_OBTAIN_URL", default="")
-GOOGLE_USER_INFO_URL = env.str("GOOGLE_USER_INFO_URL", default="")
 GOOGLE_AUTH_URL = env.str("GOOGLE_AUTH_URL", default="")
 GOOGLE_SCOPE_EMAIL = env.str("GOOGLE_SCOPE_EMAIL", default="")
 GOOGLE_SCOPE_PROFILE = env.str("GOOGLE_SCOPE_PROFILE", default="")
+# ID tokens are verified locally against Google's signing keys, cached and refreshed in the background
+# GOOGLE_JWKS_REFRESH_MARGIN seconds before their Cache-Control max-age runs out.
+GOOGLE_JWKS_URL = env.str("GOOGLE_JWKS_URL", default="")
+GOOGLE_JWKS_REFRESH_MARGIN = 300
+GOOGLE_JWKS_DEFAULT_MAX_AGE = 3600
+# Rate limit of the refreshes caused by tokens signed with an unknown key.
+GOOGLE_JWKS_MIN_REFRESH_INTERVAL = 60
+GOOGLE_ID_TOKEN_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+GOOGLE_ID_TOKEN_LEEWAY = 60
 
 #
 
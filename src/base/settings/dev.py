@@ -4,13 +4,33 @@ DEBUG = True
 
 ALLOWED_HOSTS = ["localhost", "127.0.0.1:8000", "127.0.0.1"]
 
+# Directory of the SQLite files, the load test points it at a throw-away directory.
+SQLITE_DIR = Path(env.str("SQLITE_DIR", default=str(BASE_DIR)))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': SQLITE_DIR / 'db.sqlite3',
     }
 }
 
+for shard in SHARD_DATABASES:
+    DATABASES.setdefault(shard, {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_DIR / f'{shard}.sqlite3',
+    })
+
+# Local replicas are copies of the SQLite files, e.g. `cp db.sqlite3 db.replica.sqlite3`.
+for primary in env.list("REPLICA_DATABASES", default=[]):
+    DATABASES[f'{primary}_replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASES[primary]['NAME'].with_suffix('.replica.sqlite3'),
+    }
+    DATABASE_REPLICAS[primary] = [f'{primary}_replica']
+
+for database in DATABASES.values():
+    database.update(CONN_MAX_AGE=CONN_MAX_AGE, CONN_HEALTH_CHECKS=True)
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -0,0 +1,136 @@
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Executor, wait
+from typing import Iterator, NamedTuple
+
+from django.conf import settings
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+from rest_framework.serializers import BaseSerializer
+
+from .serializers import ValuesSerializer
+
+logger = logging.getLogger(__name__)
+
+# What a worker runs before it can resolve its first request.
+STARTUP_CODE = '''
+import time
+started = time.perf_counter()
+import {module}
+from django.urls import get_resolver
+get_resolver().reverse_dict
+print(time.perf_counter() - started)
+'''
+
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def iter_view_classes(patterns) -> Iterator[type]:
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_view_classes(pattern.url_patterns)
+        else:
+            view_class = getattr(pattern.callback, 'view_class', None)
+            if view_class is not None:
+                yield view_class
+
+
+def view_serializer_classes(view_class: type) -> set[type]:
+    """ The `serializer_class`, `read_serializer_class` and nested serializers (e.g. `InputSerializer`) of a view """
+    classes = set()
+    for name in dir(view_class):
+        value = getattr(view_class, name, None)
+        if isinstance(value, type) and issubclass(value, (BaseSerializer, ValuesSerializer)):
+            classes.add(value)
+    return classes
+
+
+def open_connections() -> None:
+    """ Opens the connections of the current thread to every database, they are kept for `CONN_MAX_AGE` seconds. """
+    for alias in settings.DATABASES:
+        connections[alias].ensure_connection()
+
+
+def open_connections_in(pool: Executor, threads: int, timeout: float = 10) -> None:
+    """
+    Opens the connections of every thread of a pool that does not serve requests yet, e.g. the thread pool of a
+    gthread worker. Each task waits for the others, so that every thread of the pool runs one.
+    """
+    barrier = threading.Barrier(threads)
+
+    def open_in_thread() -> None:
+        try:
+            barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            pass
+        open_connections()
+
+    wait([pool.submit(open_in_thread) for _ in range(threads)])
+
+
+def warm_up() -> dict[str, int]:
+    """
+    Pays the one-off costs of the first request before the worker accepts requests: populates the URL resolvers
+    (importing every view), builds the fields of every view serializer and opens the connections of the current
+    thread to every database.
+
+    Django connections belong to the thread that opened them, see `open_connections_in` for the threads serving the
+    requests.
+    """
+    started = time.perf_counter()
+    resolver = get_resolver()
+    resolver.reverse_dict
+
+    serializer_classes = set()
+    for view_class in iter_view_classes(resolver.url_patterns):
+        serializer_classes |= view_serializer_classes(view_class)
+    for serializer_class in serializer_classes:
+        try:
+            serializer = serializer_class()
+            if isinstance(serializer, BaseSerializer):
+                serializer.fields
+        except Exception as error:
+            logger.warning('Could not warm up %s: %s', serializer_class.__name__, error)
+
+    open_connections()
+
+    summary = {
+        'views': len(set(iter_view_classes(resolver.url_patterns))),
+        'serializers': len(serializer_classes),
+        'databases': len(settings.DATABASES),
+    }
+    logger.info('Warmed up in %.0f ms: %s', (time.perf_counter() - started) * 1000, summary)
+    return summary
+
+
+def profile_imports(module: str = 'base.wsgi', env: dict | None = None) -> tuple[float, list[ImportTime]]:
+    """
+    Imports the application module and populates the URL resolvers in a fresh interpreter run with
+    `-X importtime`. Returns the seconds it took and the time spent importing every module.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE.format(module=module)],
+        cwd=settings.BASE_DIR, env={**os.environ, **(env or {})}, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr[-2000:]}')
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append(ImportTime(name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return float(result.stdout.strip().splitlines()[-1]), imports
@@ -14,16 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
-from .yasg import urlpatterns as doc_urls
-
 
 api_v_1_urls = [
     path('api/v1/', include(
         [
             path('users/', include('users.urls')),
+            path('jobs/', include('jobs.urls')),
             path('', include('teams_app.urls')),
         ]
     ))
@@ -32,5 +32,9 @@ api_v_1_urls = [
 urlpatterns = [
     path('admin/', admin.site.urls),
     *api_v_1_urls,
-    *doc_urls,
 ]
+
+if settings.API_DOCS_ENABLED:
+    from .yasg import urlpatterns as doc_urls
+
+    urlpatterns += doc_urls
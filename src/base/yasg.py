@@ -1,20 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from .schema import schema_artifact_view
+
+api_info = openapi.Info(
+    title="Teams app API",
+    default_version="0.1.0",
+    description="API for Teams app",
+)
+
 schema_view = get_schema_view(
-    openapi.Info(
-        title="Teams app API",
-        default_version="0.1.0",
-        description="API for Teams app",
-    ),
+    api_info,
     public=True,
     permission_classes=[permissions.AllowAny],
 )
 
 urlpatterns = [
-    path("swagger.<format>/", schema_view.without_ui(cache_timeout=0), name="schema-json"),
-    path("swagger/", schema_view.with_ui("swagger", cache_timeout=0), name="schema-swagger-ui"),
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
+    path("swagger.<format>/", schema_artifact_view, name="schema-json"),
+    path("swagger/", schema_view.with_ui("swagger", cache_timeout=settings.OPENAPI_UI_CACHE_TIMEOUT), name="schema-swagger-ui"),
+    path("redoc/", schema_view.with_ui("redoc", cache_timeout=settings.OPENAPI_UI_CACHE_TIMEOUT), name="schema-redoc"),
 ]
@@ -0,0 +1,152 @@
+import logging
+import traceback
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers: Dict[str, Callable] = {}
+
+
+def job(name: str) -> Callable:
+    """
+    Registers a function as a job handler under the given name.
+
+    The handler is called as `handler(job, **payload)`, where `job` is the `Job` instance being executed.
+    """
+    def decorator(func: Callable) -> Callable:
+        if name in _handlers and _handlers[name] is not func:
+            raise ValueError(f'Job handler "{name}" is already registered.')
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def get_handler(name: str) -> Callable:
+    """ Returns the handler registered under the given name. """
+    try:
+        return _handlers[name]
+    except KeyError:
+        raise LookupError(f'No job handler registered as "{name}".')
+
+
+def enqueue(
+    name: str,
+    payload: Optional[Dict[str, Any]] = None,
+    *,
+    owner=None,
+    priority: int = 0,
+    max_attempts: Optional[int] = None,
+    delay: Optional[timedelta] = None,
+) -> Job:
+    """
+    Stores a new job in the queue.
+
+    Args:
+        name (str): The name of a registered job handler.
+        payload (dict): JSON-serializable keyword arguments for the handler.
+        owner (User): The user allowed to poll the job status.
+        priority (int): Jobs with a higher priority are claimed first.
+        max_attempts (int): How many times the job is tried before it is marked as failed.
+        delay (timedelta): Postpones the first run.
+
+    Returns:
+        Job: The queued job.
+    """
+    get_handler(name)
+    run_at = timezone.now() + (delay or timedelta())
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        owner=owner,
+        priority=priority,
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+        run_at=run_at,
+    )
+
+
+def _claimable():
+    return Job.objects.filter(status=Job.STATUS_QUEUED, run_at__lte=timezone.now()).order_by('-priority', 'run_at', 'id')
+
+
+def claim(worker_id: str) -> Optional[Job]:
+    """
+    Claims the next due job for the given worker.
+
+    Uses `SELECT ... FOR UPDATE SKIP LOCKED` where the backend supports it. Elsewhere (SQLite) the job is claimed
+    with a conditional `UPDATE ... WHERE status = 'queued'`, so only one worker can win a given row.
+    """
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            claimed = _claimable().select_for_update(skip_locked=True).first()
+            if claimed is None:
+                return None
+            Job.objects.filter(pk=claimed.pk).update(
+                status=Job.STATUS_RUNNING, locked_by=worker_id, locked_at=now, attempts=claimed.attempts + 1,
+            )
+    else:
+        while True:
+            candidate = _claimable().values_list('pk', 'attempts').first()
+            if candidate is None:
+                return None
+            pk, attempts = candidate
+            updated = Job.objects.filter(pk=pk, status=Job.STATUS_QUEUED).update(
+                status=Job.STATUS_RUNNING, locked_by=worker_id, locked_at=now, attempts=attempts + 1,
+            )
+            if updated:
+                claimed = Job(pk=pk)
+                break
+    claimed.refresh_from_db()
+    return claimed
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """ Returns the exponential backoff before the next attempt. """
+    seconds = settings.JOBS_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, settings.JOBS_RETRY_BACKOFF_MAX))
+
+
+def execute(claimed: Job) -> Job:
+    """ Runs a claimed job and records its outcome, re-queueing it with backoff on failure. """
+    try:
+        result = get_handler(claimed.name)(claimed, **claimed.payload)
+    except Exception as error:
+        logger.warning('Job %s (%s) failed on attempt %s: %s', claimed.pk, claimed.name, claimed.attempts, error)
+        claimed.error = traceback.format_exc()
+        if claimed.attempts < claimed.max_attempts:
+            claimed.status = Job.STATUS_QUEUED
+            claimed.run_at = timezone.now() + retry_delay(claimed.attempts)
+        else:
+            claimed.status = Job.STATUS_FAILED
+    else:
+        claimed.status = Job.STATUS_SUCCEEDED
+        claimed.progress = 100
+        claimed.result = result
+        claimed.error = ''
+    claimed.locked_by = ''
+    claimed.locked_at = None
+    claimed.save(update_fields=['status', 'progress', 'result', 'error', 'run_at', 'locked_by', 'locked_at', 'updated_at'])
+    return claimed
+
+
+def set_progress(running: Job, progress: int) -> None:
+    """ Stores the progress (0-100) of a running job so that clients can poll it. """
+    running.progress = max(0, min(int(progress), 100))
+    Job.objects.filter(pk=running.pk).update(progress=running.progress, updated_at=timezone.now())
+
+
+def requeue_stale(timeout: timedelta) -> int:
+    """ Puts back jobs whose worker died while running them, failing the ones without attempts left. """
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=timezone.now() - timeout)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED, error='Worker lost while running the job.', locked_by='', locked_at=None,
+    )
+    return stale.update(status=Job.STATUS_QUEUED, locked_by='', locked_at=None)
@@ -0,0 +1,11 @@
+from rest_framework import serializers
+from .models import Job
+
+
+class JobStatusSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'progress', 'attempts', 'max_attempts', 'result', 'error', 'created_at',
+                  'updated_at']
+        read_only_fields = fields
@@ -0,0 +1,177 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import User
+from . import queue
+from .models import Job
+
+
+@queue.job('jobs.tests.succeed')
+def succeed(running: Job, **payload) -> dict:
+    return payload
+
+
+@queue.job('jobs.tests.fail')
+def fail(running: Job, **payload) -> None:
+    raise RuntimeError('boom')
+
+
+class ClaimTests(TestCase):
+    """ Workers claim due jobs by priority, then by due date, and never the same job twice. """
+
+    def test_jobs_are_claimed_by_priority_then_due_date(self):
+        now = timezone.now()
+        low = queue.enqueue('jobs.tests.succeed', priority=-1)
+        later = queue.enqueue('jobs.tests.succeed')
+        earlier = queue.enqueue('jobs.tests.succeed')
+        Job.objects.filter(pk=earlier.pk).update(run_at=now - timedelta(seconds=10))
+        high = queue.enqueue('jobs.tests.succeed', priority=5)
+        queue.enqueue('jobs.tests.succeed', priority=10, delay=timedelta(hours=1))
+
+        claimed = [queue.claim('worker').pk for _ in range(4)]
+
+        self.assertEqual(claimed, [high.pk, earlier.pk, later.pk, low.pk])
+        self.assertIsNone(queue.claim('worker'))
+
+    def test_a_claimed_job_is_not_claimed_again(self):
+        queued = queue.enqueue('jobs.tests.succeed')
+
+        claimed = queue.claim('worker-1')
+
+        self.assertEqual(claimed.pk, queued.pk)
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), (Job.STATUS_RUNNING, 'worker-1', 1))
+        self.assertIsNone(queue.claim('worker-2'))
+
+
+@override_settings(JOBS_RETRY_BACKOFF=5, JOBS_RETRY_BACKOFF_MAX=600)
+class RetryTests(TestCase):
+    """ Failed jobs are queued again with an exponential backoff until they run out of attempts. """
+
+    def test_failed_job_is_scheduled_again_with_backoff(self):
+        queue.enqueue('jobs.tests.fail', max_attempts=3)
+
+        before = timezone.now()
+        failed = queue.execute(queue.claim('worker'))
+
+        self.assertEqual(failed.status, Job.STATUS_QUEUED)
+        self.assertIn('RuntimeError: boom', failed.error)
+        self.assertEqual((failed.locked_by, failed.locked_at), ('', None))
+        self.assertGreaterEqual(failed.run_at, before + timedelta(seconds=5))
+        self.assertLessEqual(failed.run_at, timezone.now() + timedelta(seconds=5))
+        # Not due before its backoff.
+        self.assertIsNone(queue.claim('worker'))
+
+    def test_job_fails_after_its_last_attempt(self):
+        queued = queue.enqueue('jobs.tests.fail', max_attempts=2)
+        for _ in range(2):
+            Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+            failed = queue.execute(queue.claim('worker'))
+
+        self.assertEqual((failed.status, failed.attempts), (Job.STATUS_FAILED, 2))
+        self.assertIsNone(queue.claim('worker'))
+
+    def test_backoff_doubles_up_to_the_maximum(self):
+        self.assertEqual(
+            [queue.retry_delay(attempts).total_seconds() for attempts in (1, 2, 3, 8, 20)],
+            [5, 10, 20, 600, 600],
+        )
+
+    def test_succeeded_job_stores_its_result(self):
+        queue.enqueue('jobs.tests.succeed', {'answer': 42})
+
+        succeeded = queue.execute(queue.claim('worker'))
+
+        self.assertEqual(
+            (succeeded.status, succeeded.progress, succeeded.result), (Job.STATUS_SUCCEEDED, 100, {'answer': 42}),
+        )
+
+
+class RequeueStaleTests(TestCase):
+    """ The jobs of a lost worker are queued again, or failed when they have no attempts left. """
+
+    def test_stale_jobs_are_requeued_or_failed(self):
+        retried = queue.enqueue('jobs.tests.succeed', max_attempts=2)
+        exhausted = queue.enqueue('jobs.tests.succeed', max_attempts=1)
+        fresh = queue.enqueue('jobs.tests.succeed', max_attempts=2)
+        for _ in range(3):
+            queue.claim('worker')
+        Job.objects.exclude(pk=fresh.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(queue.requeue_stale(timedelta(minutes=10)), 1)
+
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((retried.status, retried.locked_by), (Job.STATUS_QUEUED, ''))
+        self.assertEqual(exhausted.status, Job.STATUS_FAILED)
+        self.assertEqual(exhausted.error, 'Worker lost while running the job.')
+        self.assertEqual((fresh.status, fresh.locked_by), (Job.STATUS_RUNNING, 'worker'))
+        self.assertEqual(queue.claim('worker').pk, retried.pk)
+
+
+class JobStatusTests(TestCase):
+    """ Only the owner of a job can poll its status. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com')
+        cls.queued = queue.enqueue('jobs.tests.succeed', owner=cls.user)
+
+    def test_owner_gets_the_status(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('job_status', kwargs={'pk': self.queued.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['progress']), (Job.STATUS_QUEUED, 0))
+
+    def test_other_users_get_a_404(self):
+        self.client.force_login(User.objects.create(email='other@example.com'))
+
+        response = self.client.get(reverse('job_status', kwargs={'pk': self.queued.pk}))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_anonymous_users_are_refused(self):
+        response = self.client.get(reverse('job_status', kwargs={'pk': self.queued.pk}))
+
+        self.assertIn(response.status_code, (401, 403))
+
+
+class RunWorkersTests(TransactionTestCase):
+    """ The workers run the due jobs and survive database errors. """
+
+    def run_workers(self) -> None:
+        call_command('run_workers', burst=True, workers=1, poll_interval=0, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_workers_run_the_queued_jobs(self):
+        queued = queue.enqueue('jobs.tests.succeed', {'answer': 42})
+
+        self.run_workers()
+
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.result), (Job.STATUS_SUCCEEDED, {'answer': 42}))
+
+    def test_worker_survives_a_database_error(self):
+        queued = queue.enqueue('jobs.tests.succeed')
+        claim = queue.claim
+        failures = [DatabaseError('database is locked')]
+
+        def claim_after_a_failure(worker_id: str):
+            if failures:
+                raise failures.pop()
+            return claim(worker_id)
+
+        with mock.patch.object(queue, 'claim', claim_after_a_failure):
+            with self.assertLogs('users.management.commands.run_workers', 'ERROR'):
+                self.run_workers()
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_SUCCEEDED)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from jobs import views
+
+
+urlpatterns = [
+    path('<int:pk>/', views.JobStatusAPIView.as_view(), name="job_status"),
+]
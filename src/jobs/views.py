@@ -0,0 +1,28 @@
+from rest_framework import permissions, status
+from rest_framework.generics import RetrieveAPIView
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from .models import Job
+from .serializers import JobStatusSerializer
+
+
+def job_accepted_response(request: Request, queued: Job, message: str) -> Response:
+    """ 202 response pointing the client at the status endpoint of the queued job """
+    url = reverse('job_status', kwargs={'pk': queued.pk}, request=request)
+    return Response({'message': message, 'job': url}, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
+
+class JobStatusAPIView(RetrieveAPIView):
+    """ Get the status and progress of a background job """
+
+    serializer_class = JobStatusSerializer
+    lookup_field = 'pk'
+    allowed_methods = ['GET']
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self) -> list[Job]:
+        queryset = self.request.user.jobs.all()
+        self.queryset = queryset
+        return queryset
@@ -1,6 +1,33 @@
 from django.contrib import admin
+
+from base.admin import EstimatedCountPaginator, IndexedSearchMixin
 from .models import Team, Member
 
 
-admin.site.register(Team)
-admin.site.register(Member)
+@admin.register(Team)
+class TeamAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ['id', 'name', 'owner', 'members_count']
+    list_select_related = ['owner']
+    autocomplete_fields = ['owner']
+    search_fields = ['name']
+    search_lookups = ('name',)
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """ Load the owner used by `Team.__str__`, also for the autocomplete results. """
+        return super().get_queryset(request).select_related('owner')
+
+
+@admin.register(Member)
+class MemberAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ['id', 'email', 'first_name', 'last_name', 'team', 'user']
+    list_select_related = ['team__owner', 'user']
+    list_filter = [('team', admin.EmptyFieldListFilter)]
+    autocomplete_fields = ['team', 'user']
+    search_fields = ['email']
+    search_lookups = ('email',)
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TeamsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'teams_app'
+
+    def ready(self) -> None:
+        """ Connect the change feed signal handlers. """
+        from . import signals  # noqa: F401
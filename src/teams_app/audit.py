@@ -0,0 +1,158 @@
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, router
+from django.http import HttpRequest, HttpResponse
+
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+_current_request: ContextVar[Optional[HttpRequest]] = ContextVar('audit_request', default=None)
+_current_actor: ContextVar[Optional[int]] = ContextVar('audit_actor', default=None)
+
+
+class AuditActorMiddleware:
+    """ Makes the user of the request the actor of the audit events of its changes. """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+
+@contextmanager
+def acting_as(actor_id: Optional[int]) -> Iterator[None]:
+    """ Makes the user the actor of the audit events of the changes made in the block, e.g. by a background job. """
+    token = _current_actor.set(actor_id)
+    try:
+        yield
+    finally:
+        _current_actor.reset(token)
+
+
+def current_actor_id() -> Optional[int]:
+    """
+    The id of the user of the current `acting_as` block or request, None outside of both and for anonymous users.
+    """
+    actor_id = _current_actor.get()
+    if actor_id is not None:
+        return actor_id
+    user = getattr(_current_request.get(), 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+class AuditLogWriter:
+    """
+    Buffers audit events in process and writes them with one `bulk_create` per database from a background thread,
+    as soon as `AUDIT_LOG_BATCH_SIZE` events are buffered and at least every `AUDIT_LOG_FLUSH_INTERVAL` seconds.
+
+    Events are never dropped: the events of a failed write stay buffered for the next flush, and a request finding
+    `AUDIT_LOG_MAX_BUFFER` events buffered (the database cannot keep up) writes them itself.
+    """
+
+    def __init__(self) -> None:
+        self._events: List[Tuple[str, AuditEvent]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid: Optional[int] = None
+
+    def put(self, event: AuditEvent) -> None:
+        if self._pid != os.getpid():
+            self._start()
+        using = router.db_for_write(AuditEvent, instance=event)
+        with self._lock:
+            self._events.append((using, event))
+            buffered = len(self._events)
+        if buffered >= settings.AUDIT_LOG_MAX_BUFFER:
+            self.flush()
+        elif buffered >= settings.AUDIT_LOG_BATCH_SIZE:
+            self._wakeup.set()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Also restarts the thread in a forked worker, threads do not survive a fork. The events copied from
+            # the parent are written by the parent.
+            self._events = []
+            self._wakeup = threading.Event()
+            threading.Thread(target=self._run, args=(self._wakeup,), name='audit-log', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self, wakeup: threading.Event) -> None:
+        while True:
+            wakeup.wait(settings.AUDIT_LOG_FLUSH_INTERVAL)
+            wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # The thread must survive anything, the buffered events are written by the next flush.
+                logger.exception('Audit log flush failed')
+
+    def flush(self) -> int:
+        """ Writes the buffered events, returns the number written. """
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            batches = defaultdict(list)
+            for using, event in events:
+                batches[using].append(event)
+
+            written = 0
+            for using, batch in batches.items():
+                try:
+                    connections[using].close_if_unusable_or_obsolete()
+                    AuditEvent.objects.using(using).bulk_create(batch, batch_size=settings.AUDIT_LOG_BATCH_SIZE)
+                    written += len(batch)
+                except Exception as error:
+                    logger.warning('Failed to write %s audit events to %s, retrying: %s', len(batch), using, error)
+                    with self._lock:
+                        self._events[:0] = [(using, event) for event in batch]
+            return written
+
+    def close(self) -> None:
+        """ Writes the buffered events, on exit. """
+        if self._pid == os.getpid():
+            self.flush()
+
+
+_writer: Optional[AuditLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> AuditLogWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditLogWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def record(owner_id: int, action: str, data: Dict[str, Any], actor_id: Optional[int], created_at: datetime) -> None:
+    """ Buffers the audit event of a committed change, `action` and `data` being the event streamed for it. """
+    if action.startswith('team.'):
+        team_id, member_id = data['id'], None
+    elif action.startswith('member.'):
+        team_id, member_id = data.get('team'), data['id']
+    else:
+        team_id, member_id = data['team'], data['member']
+    get_writer().put(AuditEvent(
+        owner_id=owner_id, actor_id=actor_id, action=action, team_id=team_id, member_id=member_id, data=data,
+        created_at=created_at,
+    ))
@@ -0,0 +1,100 @@
+from collections import Counter
+
+from django.db import router, transaction
+from rest_framework import status
+
+from .models import Change, Member, get_email_domain
+from .serializers import MemberBulkUpdateItemSerializer
+from .signals import member_data, publish_on_commit
+
+
+def item_result(member_id: int | None, status_code: int, message) -> dict:
+    return {'id': member_id, 'status': status_code, 'message': message}
+
+
+def bulk_update_members(user, items: list) -> list[dict]:
+    """
+    Applies `{id, changes}` items to the user's members, returns a result per item. Invalid items are reported and
+    skipped, the others are saved together in one transaction.
+
+    Whatever the number of items, the members are loaded with one `IN` query, the email uniqueness of the whole
+    batch is checked with one more, and the changes are written by one `bulk_update` of the touched fields only.
+    `bulk_update` sends no signals, so the change feed entries and the `member.updated` events of
+    `teams_app.signals` are written here. The team is not among the changes, the team counters stay as they are.
+    """
+    results: list[dict | None] = [None] * len(items)
+    changes = {}
+    for position, item in enumerate(items):
+        serializer = MemberBulkUpdateItemSerializer(data=item)
+        if not serializer.is_valid():
+            member_id = item.get('id') if isinstance(item, dict) else None
+            results[position] = item_result(member_id, status.HTTP_400_BAD_REQUEST, serializer.errors)
+        elif serializer.validated_data['id'] in changes:
+            member_id = serializer.validated_data['id']
+            results[position] = item_result(member_id, status.HTTP_400_BAD_REQUEST, 'Member is already in the batch.')
+        else:
+            changes[serializer.validated_data['id']] = (position, serializer.validated_data['changes'])
+
+    using = router.db_for_write(Member, instance=user)
+    with transaction.atomic(using=using):
+        members = {
+            member.pk: member
+            for member in Member.objects.using(using).select_for_update().filter(user_id=user.pk, pk__in=changes)
+        }
+        for member_id in changes.keys() - members.keys():
+            position, _ = changes.pop(member_id)
+            results[position] = item_result(member_id, status.HTTP_404_NOT_FOUND, 'Member not found')
+
+        for member_id in rejected_emails(user, changes, using):
+            position, member_changes = changes.pop(member_id)
+            message = {'email': [f'Member with email "{member_changes["email"]}" already exists.']}
+            results[position] = item_result(member_id, status.HTTP_400_BAD_REQUEST, message)
+
+        fields = set()
+        updated = []
+        for member_id, (position, member_changes) in changes.items():
+            member = members[member_id]
+            if 'email' in member_changes:
+                member.email = member_changes['email']
+                member.email_domain = get_email_domain(member.email)
+                fields |= {'email', 'email_domain'}
+            if 'full_name' in member_changes:
+                member.full_name = member_changes['full_name']
+                fields |= {'first_name', 'last_name'}
+            updated.append(member)
+            results[position] = item_result(member_id, status.HTTP_200_OK, 'Member details updated')
+
+        if updated:
+            Member.objects.using(using).bulk_update(updated, sorted(fields))
+            Change.objects.using(using).bulk_create(
+                Change(owner_id=user.pk, kind=Change.KIND_MEMBER, object_id=member.pk, action=Change.ACTION_UPSERT)
+                for member in updated
+            )
+            for member in updated:
+                publish_on_commit(user.pk, 'member.updated', member_data(member), using)
+    return results
+
+
+def rejected_emails(user, changes: dict, using: str) -> set[int]:
+    """
+    Ids of the members whose new email would be shared with another member of the user: another item of the batch,
+    or a member keeping it, found with one query. An email the batch moves away from is free, e.g. for a swap.
+    """
+    new_emails = {member_id: member_changes['email'] for member_id, (_, member_changes) in changes.items()
+                  if 'email' in member_changes}
+    counts = Counter(new_emails.values())
+    rejected = {member_id for member_id, email in new_emails.items() if counts[email] > 1}
+    holders = Member.objects.using(using).filter(user_id=user.pk, email__in=set(new_emails.values()))
+    holders = list(holders.values_list('id', 'email'))
+    while True:
+        newly_rejected = {
+            member_id for member_id, email in new_emails.items()
+            if member_id not in rejected and any(
+                holder_email == email and holder_id != member_id
+                and (holder_id not in new_emails or holder_id in rejected)
+                for holder_id, holder_email in holders
+            )
+        }
+        if not newly_rejected:
+            return rejected
+        rejected |= newly_rejected
@@ -0,0 +1,57 @@
+from django.db.models import QuerySet
+from django.db.models.functions import Lower
+from django_filters import rest_framework as filters
+
+from users.models import normalize_email
+from .models import Member, Team
+
+
+def filter_prefix(queryset: QuerySet, field: str, prefix: str) -> QuerySet:
+    """
+    Case-insensitive prefix match written as a range over `lower(field)`.
+
+    `LIKE 'prefix%'` cannot use a B-tree index on every backend, a range over the same expression the index
+    is built on can.
+    """
+    prefix = prefix.lower()
+    if not prefix:
+        return queryset
+    alias = f'{field}_lower'
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return queryset.alias(**{alias: Lower(field)}).filter(**{f'{alias}__gte': prefix, f'{alias}__lt': upper_bound})
+
+
+class MemberFilterSet(filters.FilterSet):
+    """ Member list filters, each one backed by an index of the member table. """
+
+    team = filters.NumberFilter(field_name='team_id')
+    unassigned = filters.BooleanFilter(field_name='team', lookup_expr='isnull')
+    email_domain = filters.CharFilter(method='filter_email_domain')
+    name = filters.CharFilter(method='filter_name', help_text='Prefix of the first name, case insensitive.')
+    id_min = filters.NumberFilter(field_name='id', lookup_expr='gte')
+    id_max = filters.NumberFilter(field_name='id', lookup_expr='lte')
+
+    class Meta:
+        model = Member
+        fields = ['team', 'unassigned', 'email_domain', 'name', 'id_min', 'id_max']
+
+    def filter_email_domain(self, queryset: QuerySet, name: str, value: str) -> QuerySet:
+        return queryset.filter(email_domain=normalize_email(value).lstrip('@'))
+
+    def filter_name(self, queryset: QuerySet, name: str, value: str) -> QuerySet:
+        return filter_prefix(queryset, 'first_name', value)
+
+
+class TeamFilterSet(filters.FilterSet):
+    """ Team list filters, each one backed by an index of the team table. """
+
+    name = filters.CharFilter(method='filter_name', help_text='Prefix of the team name, case insensitive.')
+    id_min = filters.NumberFilter(field_name='id', lookup_expr='gte')
+    id_max = filters.NumberFilter(field_name='id', lookup_expr='lte')
+
+    class Meta:
+        model = Team
+        fields = ['name', 'id_min', 'id_max']
+
+    def filter_name(self, queryset: QuerySet, name: str, value: str) -> QuerySet:
+        return filter_prefix(queryset, 'name', value)
@@ -0,0 +1,109 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from typing import Callable
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def request_fingerprint(request: Request) -> str:
+    """ Identifies the request a key was first used with, a key must not be reused for another request. """
+    digest = hashlib.sha256(f'{request.method} {request.get_full_path()}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def is_replayable(response: Response) -> bool:
+    """ Server errors and database failures (417) are transient, the client may retry them for real. """
+    return response.status_code < 500 and response.status_code != status.HTTP_417_EXPECTATION_FAILED
+
+
+def claim_key(user, key: str, fingerprint: str) -> tuple[IdempotencyKey, bool]:
+    """
+    Claims the key for the current request, returns the record and whether it was claimed.
+
+    Expired records and records left in progress for longer than `IDEMPOTENCY_LOCK_TIMEOUT` (the request that
+    claimed them died) are replaced.
+    """
+    now = timezone.now()
+    keys = user.idempotency_keys
+    keys.filter(key=key, expires_at__lte=now).delete()
+    keys.filter(
+        key=key,
+        status=IdempotencyKey.STATUS_IN_PROGRESS,
+        created_at__lte=now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT),
+    ).delete()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    using = router.db_for_write(IdempotencyKey, instance=user)
+    try:
+        with transaction.atomic(using=using):
+            return keys.create(key=key, fingerprint=fingerprint, expires_at=expires_at), True
+    except IntegrityError:
+        record = keys.filter(key=key).first()
+        if record is not None:
+            return record, False
+    # The holder gave the key up in the meantime.
+    with transaction.atomic(using=using):
+        return keys.create(key=key, fingerprint=fingerprint, expires_at=expires_at), True
+
+
+def idempotent(view_method: Callable) -> Callable:
+    """
+    Makes a write view method honour the `Idempotency-Key` header.
+
+    The response of the first request with a key is stored for `IDEMPOTENCY_KEY_TTL` seconds, in the transaction
+    of its write on the owner's database, so the two are committed together or not at all. Retries of the same
+    request get it replayed without running the view again, retries sent while the first request still runs get a
+    409 and `Retry-After` instead of holding a worker. Requests without the header are not affected.
+
+    Goes under the `retry` decorator, each attempt runs in its own transaction.
+    """
+    @wraps(view_method)
+    def wrapper(view, request: Request, *args, **kwargs) -> Response:
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if not key:
+            return view_method(view, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'message': f'{IDEMPOTENCY_KEY_HEADER} is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, claimed = claim_key(request.user, key, fingerprint)
+        if not claimed:
+            if record.fingerprint != fingerprint:
+                message = f'{IDEMPOTENCY_KEY_HEADER} was already used for another request'
+                return Response({'message': message}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record.status == IdempotencyKey.STATUS_IN_PROGRESS:
+                message = f'A request with this {IDEMPOTENCY_KEY_HEADER} is still in progress, retry later'
+                return Response(
+                    {'message': message},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={'Retry-After': str(settings.IDEMPOTENCY_RETRY_AFTER)},
+                )
+            return Response(record.response_data, status=record.response_status, headers={REPLAYED_HEADER: 'true'})
+
+        try:
+            with transaction.atomic(using=record._state.db):
+                response = view_method(view, request, *args, **kwargs)
+                if is_replayable(response):
+                    record.status = IdempotencyKey.STATUS_DONE
+                    record.response_status = response.status_code
+                    record.response_data = response.data
+                    record.save(update_fields=['status', 'response_status', 'response_data'])
+        except BaseException:
+            record.delete()
+            raise
+        if not is_replayable(response):
+            record.delete()
+        return response
+
+    return wrapper
@@ -0,0 +1,77 @@
+from typing import Optional
+
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+
+from jobs.models import Job
+from jobs.queue import job, set_progress
+from . import audit
+from .models import Member
+from .serializers import MemberReadSerializer
+
+User = get_user_model()
+
+
+@job('teams_app.delete_teams')
+def delete_teams(
+    running: Job, *, owner_id: int, team_ids: list[int], actor_id: Optional[int] = None, batch_size: int = 100,
+) -> dict:
+    """
+    Deletes the owner's teams in batches, releasing their members, and reports progress. The changes are audited as
+    made by `actor_id`, the user who requested them.
+    """
+    owner = User.objects.get(pk=owner_id)
+    deleted = 0
+    with audit.acting_as(actor_id):
+        for start in range(0, len(team_ids), batch_size):
+            batch = team_ids[start:start + batch_size]
+            deleted += owner.teams.filter(pk__in=batch).delete()[1].get('teams_app.Team', 0)
+            set_progress(running, (start + len(batch)) * 100 // len(team_ids))
+    return {'deleted': deleted}
+
+
+@job('teams_app.export_members')
+def export_members(running: Job, *, owner_id: int, batch_size: int = 500) -> dict:
+    """ Exports the owner's members with their team, in id order, and reports progress. """
+    owner = User.objects.get(pk=owner_id)
+    members = owner.members.order_by('id')
+    total = members.count()
+    serializer = MemberReadSerializer()
+    exported = []
+    last_id = 0
+    while True:
+        rows = list(MemberReadSerializer.values(members.filter(id__gt=last_id))[:batch_size])
+        if not rows:
+            break
+        exported += serializer.serialize(rows)
+        last_id = rows[-1]['id']
+        set_progress(running, len(exported) * 100 // max(total, 1))
+    return {'members': exported}
+
+
+@job('teams_app.import_members')
+def import_members(
+    running: Job, *, owner_id: int, members: list[dict], actor_id: Optional[int] = None, batch_size: int = 100,
+) -> dict:
+    """
+    Creates the owner's members of a list of `{email, full_name}` items (validated by `MemberImportSerializer`) and
+    reports progress. Emails already in use are skipped, so a retried import does not create duplicates. The members
+    are audited as created by `actor_id`.
+    """
+    owner = User.objects.get(pk=owner_id)
+    existing = set(owner.members.values_list('email', flat=True))
+    created, skipped = 0, []
+    using = router.db_for_write(Member, instance=owner)
+    for start in range(0, len(members), batch_size):
+        with transaction.atomic(using=using), audit.acting_as(actor_id):
+            for item in members[start:start + batch_size]:
+                if item['email'] in existing:
+                    skipped.append(item['email'])
+                    continue
+                member = Member(user=owner, email=item['email'])
+                member.full_name = item['full_name']
+                member.save()
+                existing.add(member.email)
+                created += 1
+        set_progress(running, (start + batch_size) * 100 // len(members))
+    return {'created': created, 'skipped': skipped}
@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from teams_app.models import Member, Team
+from teams_app.serializers import MemberReadSerializer, MemberSerializer, TeamReadSerializer, TeamSerializer
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the per-row cost of the member and team list serializers, model serializers against the '
+        '`values()` based read serializers. The sample data is created in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Number of members (and teams / 10) to serialize.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per case, the best one is reported.')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        try:
+            with transaction.atomic():
+                user = User.objects.create(email='benchmark-serializers@example.com')
+                teams = Team.objects.bulk_create(Team(name=f'Team {index}', owner=user) for index in range(rows // 10))
+                Member.objects.bulk_create(
+                    Member(email=f'member{index}@example.com', first_name=f'Member {index}', last_name='Benchmark',
+                           user=user, team=teams[index % len(teams)] if teams else None)
+                    for index in range(rows)
+                )
+                self.run_cases(user, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run_cases(self, user, repeat: int) -> None:
+        request = APIRequestFactory().get('/')
+        request.user = user
+        context = {'request': request}
+        members = user.members.order_by('id')
+        teams = user.teams.order_by('id')
+
+        cases = [
+            ('members', 'MemberSerializer', members.count(),
+             lambda: MemberSerializer(members.select_related('team'), many=True).data),
+            ('members', 'MemberReadSerializer', members.count(),
+             lambda: MemberReadSerializer().serialize(MemberReadSerializer.values(members))),
+            ('teams', 'TeamSerializer', teams.count(),
+             lambda: TeamSerializer(TeamSerializer.setup_eager_loading(teams), many=True, context=context).data),
+            ('teams', 'TeamReadSerializer', teams.count(),
+             lambda: TeamReadSerializer(context=context).serialize(TeamReadSerializer.values(teams))),
+        ]
+        self.stdout.write(f'{"list":<8} {"serializer":<22} {"rows":>6} {"us/row":>8} (queries included, best of {repeat})')
+        for name, serializer_name, count, run in cases:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            per_row = min(timings) / max(count, 1) * 1_000_000
+            self.stdout.write(f'{name:<8} {serializer_name:<22} {count:>6} {per_row:>8.1f}')
+        self.stdout.write(f'Team member previews hold {settings.TEAM_MEMBERS_PREVIEW_SIZE} members.')
@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand, call_command
+
+from base.routers import all_databases
+
+
+class Command(BaseCommand):
+    help = 'Runs migrate on the default database and on every database of SHARD_DATABASES.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive')
+
+    def handle(self, *args, **options):
+        for database in all_databases():
+            self.stderr.write(f'Migrating database "{database}"...')
+            call_command('migrate', database=database, interactive=options['interactive'], verbosity=options['verbosity'])
@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from base.routers import all_databases
+from teams_app.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Deletes the expired idempotency keys of every database.'
+
+    def handle(self, *args, **options):
+        deleted = 0
+        for database in all_databases():
+            deleted += IdempotencyKey.objects.using(database).filter(expires_at__lte=timezone.now()).delete()[0]
+        self.stderr.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency key(s).'))
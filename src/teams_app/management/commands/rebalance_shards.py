@@ -0,0 +1,114 @@
+from django.core.management import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+
+from base.broadcast import publish
+from base.routers import all_databases, shard_for_owner
+from teams_app.models import AuditEvent, Change, IdempotencyKey, Member, Team
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the teams and members of every owner to the shard picked by the current SHARD_DATABASES. '
+        'Moved rows get new ids on their new shard and the owners are told to resync. '
+        'Run it while the moved owners are not writing, e.g. in a maintenance window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the owners that would be moved.')
+        parser.add_argument(
+            '--source', action='append', default=[], dest='sources',
+            help='Another database to drain, e.g. a shard removed from SHARD_DATABASES. Can be repeated.',
+        )
+
+    def handle(self, *args, **options):
+        moves = []
+        for source in dict.fromkeys([*all_databases(), *options['sources']]):
+            owner_ids = set(Team.objects.using(source).values_list('owner_id', flat=True).distinct())
+            owner_ids |= set(Member.objects.using(source).values_list('user_id', flat=True).distinct())
+            moves += [(owner_id, source, shard_for_owner(owner_id)) for owner_id in sorted(owner_ids)]
+        moves = [(owner_id, source, target) for owner_id, source, target in moves if source != target]
+
+        for owner_id, source, target in moves:
+            if options['dry_run']:
+                self.stdout.write(f'Owner {owner_id}: {source} -> {target}')
+                continue
+            if not connections[target].features.can_return_rows_from_bulk_insert:
+                raise CommandError(f'Database "{target}" cannot return the ids of bulk inserted rows.')
+            teams_count, members_count = self.move_owner(owner_id, source, target)
+            self.stdout.write(f'Owner {owner_id}: moved {teams_count} team(s), {members_count} member(s) '
+                              f'from {source} to {target}')
+
+        self.stderr.write(self.style.SUCCESS(f'{len(moves)} owner(s) to move.' if options['dry_run']
+                                             else f'Moved {len(moves)} owner(s).'))
+
+    def move_owner(self, owner_id: int, source: str, target: str) -> tuple[int, int]:
+        """
+        Copies the owner's rows to the target shard and removes them from the source one.
+
+        The target transaction is committed first, so a failure in between leaves duplicates rather than a loss.
+        """
+        with transaction.atomic(using=source), transaction.atomic(using=target):
+            teams = list(Team.objects.using(source).filter(owner_id=owner_id).order_by('pk'))
+            members = list(Member.objects.using(source).filter(user_id=owner_id).order_by('pk'))
+
+            old_team_ids = [team.pk for team in teams]
+            for team in teams:
+                team.pk = None
+            Team.objects.using(target).bulk_create(teams)
+            new_team_ids = dict(zip(old_team_ids, (team.pk for team in teams)))
+
+            old_member_ids = [member.pk for member in members]
+            for member in members:
+                member.pk = None
+                member.team_id = new_team_ids.get(member.team_id)
+            Member.objects.using(target).bulk_create(members)
+            new_member_ids = dict(zip(old_member_ids, (member.pk for member in members)))
+
+            # The audit history moves along, the events of deleted teams and members keep their old ids.
+            audit_events = list(AuditEvent.objects.using(source).filter(owner_id=owner_id).order_by('pk'))
+            for event in audit_events:
+                event.pk = None
+                event.team_id = new_team_ids.get(event.team_id, event.team_id)
+                event.member_id = new_member_ids.get(event.member_id, event.member_id)
+            AuditEvent.objects.using(target).bulk_create(audit_events)
+
+            self.mark_moved(owner_id, source, target)
+            Change.objects.using(target).bulk_create(
+                [Change(owner_id=owner_id, kind=Change.KIND_TEAM, object_id=team.pk, action=Change.ACTION_UPSERT)
+                 for team in teams]
+                + [Change(owner_id=owner_id, kind=Change.KIND_MEMBER, object_id=member.pk,
+                          action=Change.ACTION_UPSERT) for member in members]
+            )
+
+            # Raw deletes send no signals, the rows were moved rather than deleted.
+            Member.objects.using(source).filter(user_id=owner_id)._raw_delete(source)
+            Team.objects.using(source).filter(owner_id=owner_id)._raw_delete(source)
+            Change.objects.using(source).filter(owner_id=owner_id)._raw_delete(source)
+            AuditEvent.objects.using(source).filter(owner_id=owner_id)._raw_delete(source)
+            IdempotencyKey.objects.using(source).filter(user_id=owner_id)._raw_delete(source)
+
+            # The ids and the change feed tokens of the owner are not valid on the new shard.
+            transaction.on_commit(lambda: publish(owner_id, 'resync', {}), using=source)
+        return len(teams), len(members)
+
+    def mark_moved(self, owner_id: int, source: str, target: str) -> Change:
+        """
+        Starts the owner's feed on the target shard with a `moved` entry numbered above every token the owner's
+        clients may hold from the source shard, so that the change feed can tell those tokens apart and answer them
+        with a resync instead of silently skipping the changes numbered below them.
+        """
+        last_token = Change.objects.using(source).filter(owner_id=owner_id).aggregate(seq=Max('seq'))['seq'] or 0
+        target_seq = Change.objects.using(target).aggregate(seq=Max('seq'))['seq'] or 0
+        marker = Change(owner_id=owner_id, kind=Change.KIND_OWNER, object_id=owner_id, action=Change.ACTION_MOVED)
+        if last_token < target_seq:
+            marker.save(using=target)
+            return marker
+        marker.seq = last_token + 1
+        marker.save(using=target, force_insert=True)
+        # Move the sequence past the explicit value, on the backends that have one.
+        with connections[target].cursor() as cursor:
+            for sql in connections[target].ops.sequence_reset_sql(no_style(), [Change]):
+                cursor.execute(sql)
+        return marker
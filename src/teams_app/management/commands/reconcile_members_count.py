@@ -0,0 +1,45 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from base.routers import all_databases
+from teams_app.models import Member, Team
+
+
+class Command(BaseCommand):
+    help = 'Fixes drift of the denormalised Team.members_count counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of teams checked per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        actual_count = Coalesce(
+            Subquery(
+                Member.objects.filter(team=OuterRef('pk')).order_by().values('team')
+                .annotate(count=Count('id')).values('count'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+
+        fixed = 0
+        for database in all_databases():
+            teams = Team.objects.using(database)
+            last_pk = 0
+            while True:
+                batch = list(teams.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1]
+                with transaction.atomic(using=database):
+                    drifted = (
+                        teams.filter(pk__in=batch)
+                        .annotate(actual_count=actual_count)
+                        .exclude(members_count=F('actual_count'))
+                        .values_list('pk', flat=True)
+                    )
+                    fixed += teams.filter(pk__in=list(drifted)).update(members_count=actual_count)
+
+        self.stderr.write(self.style.SUCCESS(f'Fixed members_count of {fixed} team(s).'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams_app', '0004_alter_member_team'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('owner_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('team', 'Team'), ('member', 'Member')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner_id', 'seq'], name='teams_app_change_owner_seq_idx')],
+            },
+        ),
+    ]
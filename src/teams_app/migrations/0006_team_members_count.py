@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:49
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_members_count(apps, schema_editor):
+    Team = apps.get_model('teams_app', 'Team')
+    Member = apps.get_model('teams_app', 'Member')
+    members_count = Subquery(
+        Member.objects.filter(team=OuterRef('pk')).order_by().values('team').annotate(count=Count('id')).values('count'),
+        output_field=IntegerField(),
+    )
+    Team.objects.update(members_count=Coalesce(members_count, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams_app', '0005_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='members_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_members_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams_app', '0006_team_members_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['email'], name='teams_app_member_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['name'], name='teams_app_team_name_idx'),
+        ),
+    ]
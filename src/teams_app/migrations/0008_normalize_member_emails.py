@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:57
+
+from django.db import migrations
+from django.db.models.functions import Lower, Trim
+
+
+def normalize_emails(apps, schema_editor):
+    Member = apps.get_model('teams_app', 'Member')
+    normalized = Lower(Trim('email'))
+    Member.objects.exclude(email=normalized).update(email=normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams_app', '0007_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_emails, migrations.RunPython.noop),
+    ]
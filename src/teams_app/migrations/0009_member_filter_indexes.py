@@ -0,0 +1,57 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:57
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import StrIndex, Substr
+
+
+def backfill_email_domain(apps, schema_editor):
+    Member = apps.get_model('teams_app', 'Member')
+    Member.objects.update(email_domain=Substr('email', StrIndex('email', Value('@')) + 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams_app', '0008_normalize_member_emails'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='email_domain',
+            field=models.CharField(blank=True, default='', editable=False, max_length=254),
+        ),
+        migrations.RunPython(backfill_email_domain, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['user', 'id'], name='teams_app_member_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['user', 'team'], name='teams_app_member_user_team_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(condition=models.Q(('team__isnull', True)), fields=['user'], name='teams_app_member_no_team_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['user', 'email_domain'], name='teams_app_member_domain_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(models.F('user'), django.db.models.functions.text.Lower('first_name'), name='teams_app_member_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['owner', 'id'], name='teams_app_team_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(models.F('owner'), django.db.models.functions.text.Lower('name'), name='teams_app_team_owner_name_idx'),
+        ),
+    ]
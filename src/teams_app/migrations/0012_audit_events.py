@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams_app', '0011_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('owner_id', models.BigIntegerField()),
+                ('actor_id', models.BigIntegerField(blank=True, null=True)),
+                ('action', models.CharField(max_length=30)),
+                ('team_id', models.BigIntegerField(blank=True, null=True)),
+                ('member_id', models.BigIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner_id', 'team_id', 'id'], name='teams_app_audit_team_idx'), models.Index(fields=['owner_id', 'member_id', 'id'], name='teams_app_audit_member_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-19 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams_app', '0012_audit_events'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='change',
+            name='action',
+            field=models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete'), ('moved', 'Moved')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='change',
+            name='kind',
+            field=models.CharField(choices=[('team', 'Team'), ('member', 'Member'), ('owner', 'Owner')], max_length=10),
+        ),
+    ]
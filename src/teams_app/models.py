@@ -1,29 +1,42 @@
 from django.db import models
+from django.db.models import DEFERRED, F, Q
+from django.db.models.functions import Lower
 from django.contrib.auth import get_user_model
 
+from base.replicas import pick_replica
+from base.routers import OwnerShardedQuerySet, shard_for_owner
+from users.models import LowercaseEmailField, normalize_email
+
 User = get_user_model()
 
 
-class LowercaseEmailField(models.EmailField):
-    """
-    A custom EmailField that converts email addresses to lowercase.
-    """
+def format_full_name(first_name: str | None, last_name: str | None) -> str:
+    """ Returns the full name of a member from its parts. """
+    return f"{first_name} {last_name}".strip()
 
-    def get_prep_value(self, value: str) -> str:
-        """Convert email address to lowercase."""
-        return value.lower()
+
+def get_email_domain(email: str | None) -> str:
+    """ Returns the lowercase domain part of an email address. """
+    return normalize_email(email or '').rpartition('@')[2]
 
 
 class Team(models.Model):
     """ Team model. """
 
     name = models.CharField(max_length=100)
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="teams")
+    # Teams may live on another database than their owner (see `base.routers`), so the relation to the user is not
+    # a database constraint, the cascade is done by Django.
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="teams", db_constraint=False)
+    members_count = models.PositiveIntegerField(default=0, editable=False)
 
-    @property
-    def members_count(self) -> int:
-        """ Returns the number of members in the team. """
-        return self.members.count()
+    objects = OwnerShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='teams_app_team_name_idx'),
+            models.Index(fields=['owner', 'id'], name='teams_app_team_owner_id_idx'),
+            models.Index(F('owner'), Lower('name'), name='teams_app_team_owner_name_idx'),
+        ]
 
     def __str__(self) -> str:
         """ Returns a string representation of the team. """
@@ -34,16 +47,36 @@ class Member(models.Model):
     """ Member model. """
 
     email = LowercaseEmailField(blank=False, null=False)
+    email_domain = models.CharField(max_length=254, blank=True, default='', editable=False)
     first_name = models.CharField(max_length=255, blank=True, null=True)
     last_name = models.CharField(max_length=255, blank=True, null=True)
 
     team = models.ForeignKey(Team, on_delete=models.SET_NULL, related_name="members", null=True, blank=True)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="members")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="members", db_constraint=False)
+
+    objects = OwnerShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['email'], name='teams_app_member_email_idx'),
+            models.Index(fields=['user', 'id'], name='teams_app_member_user_id_idx'),
+            models.Index(fields=['user', 'team'], name='teams_app_member_user_team_idx'),
+            models.Index(fields=['user'], condition=Q(team__isnull=True), name='teams_app_member_no_team_idx'),
+            models.Index(fields=['user', 'email_domain'], name='teams_app_member_domain_idx'),
+            models.Index(F('user'), Lower('first_name'), name='teams_app_member_name_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """ Remember the loaded team, so that a reassignment can move the team counters. """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_team_id = instance.__dict__.get('team_id', DEFERRED)
+        return instance
 
     @property
     def full_name(self) -> str:
         """ Returns the full name of the member. """
-        return f"{self.first_name} {self.last_name}".strip()
+        return format_full_name(self.first_name, self.last_name)
 
     @full_name.setter
     def full_name(self, name: str) -> None:
@@ -58,6 +91,145 @@ class Member(models.Model):
             self.first_name = name.strip()
             self.last_name = ""
 
+    def save(self, *args, **kwargs) -> None:
+        """ Keep the indexed email domain in sync with the email. """
+        self.email = normalize_email(self.email)
+        self.email_domain = get_email_domain(self.email)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'email_domain'}
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         """ Returns a string representation of the member. """
         return f'id={self.id}, {self.full_name} ({self.email})'
+
+
+class ChangeQuerySet(OwnerShardedQuerySet):
+
+    def for_owner(self, owner_id: int):
+        """ Returns the changes of the given owner, read from the owner's shard (or its replica in replica reads). """
+        return self.using(pick_replica(shard_for_owner(owner_id))).filter(owner_id=owner_id)
+
+
+class Change(models.Model):
+    """
+    Entry of the per-owner change feed for teams and members.
+
+    The auto-incremented `seq` is the sync token. The owner is stored as a plain id, so that tombstones outlive
+    the cascade that removes the owner's rows.
+
+    When `rebalance_shards` moves an owner, their feed on the new shard starts with a `moved` entry, numbered above
+    every token of the previous shard, that tells the clients still holding such a token to resync.
+    """
+
+    KIND_TEAM = 'team'
+    KIND_MEMBER = 'member'
+    KIND_OWNER = 'owner'
+    KINDS = [
+        (KIND_TEAM, 'Team'),
+        (KIND_MEMBER, 'Member'),
+        (KIND_OWNER, 'Owner'),
+    ]
+
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+    ACTION_MOVED = 'moved'
+    ACTIONS = [
+        (ACTION_UPSERT, 'Upsert'),
+        (ACTION_DELETE, 'Delete'),
+        (ACTION_MOVED, 'Moved'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    owner_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ChangeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner_id', 'seq'], name='teams_app_change_owner_seq_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """ Returns a string representation of the change. """
+        return f'seq={self.seq}, {self.action} {self.kind} id={self.object_id}'
+
+
+class AuditEventQuerySet(ChangeQuerySet):
+    """ The audit log is read per owner, like the change feed. """
+
+
+class AuditEvent(models.Model):
+    """
+    Entry of the audit log of the team, member and membership changes, written in batches by `teams_app.audit`.
+
+    The action is the event type streamed for the change (e.g. `team.created`, `membership.added`) and `data` its
+    payload. The owner, actor, team and member are stored as plain ids, so that the history outlives them.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    owner_id = models.BigIntegerField()
+    # None for changes made outside of a request, e.g. by a job.
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    action = models.CharField(max_length=30)
+    team_id = models.BigIntegerField(null=True, blank=True)
+    member_id = models.BigIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict)
+    # When the change was committed, not when the event was written.
+    created_at = models.DateTimeField()
+
+    objects = AuditEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner_id', 'team_id', 'id'], name='teams_app_audit_team_idx'),
+            models.Index(fields=['owner_id', 'member_id', 'id'], name='teams_app_audit_member_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """ Returns a string representation of the audit event. """
+        return f'id={self.id}, {self.action} by actor={self.actor_id} at {self.created_at}'
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a write request sent with an `Idempotency-Key` header.
+
+    The first request with a key claims it while it runs, retries of the same request get the stored response
+    replayed until `expires_at`.
+    """
+
+    STATUS_IN_PROGRESS = 'in_progress'
+    STATUS_DONE = 'done'
+    STATUSES = [
+        (STATUS_IN_PROGRESS, 'In progress'),
+        (STATUS_DONE, 'Done'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="idempotency_keys", db_constraint=False)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUSES, default=STATUS_IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    objects = OwnerShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='teams_app_idempotency_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='teams_app_idempotency_exp_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """ Returns a string representation of the idempotency key. """
+        return f'{self.key} ({self.status})'
@@ -1,5 +1,11 @@
+from django.conf import settings
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
-from .models import Team, Member
+from rest_framework.reverse import reverse
+from base.serializers import ValuesSerializer
+from users.models import normalize_email
+from .models import AuditEvent, Team, Member, format_full_name
 
 
 """ MEMBER SERIALIZERS """
@@ -12,11 +18,14 @@ class MemberCreateSerializer(serializers.ModelSerializer):
         model = Member
         fields = ['email', 'full_name']
 
+    def validate_email(self, value: str) -> str:
+        """ Normalise the email, so that the duplicate check below compares stored forms. """
+        return normalize_email(value)
+
     def validate(self, attrs):
         """ Validate that the email is not already in use by another user's member. """
         request = self.context.get('request')
-        existing_emails = request.user.members.values_list('email', flat=True)
-        if attrs['email'] in existing_emails:
+        if request.user.members.filter(email=attrs['email']).exists():
             raise serializers.ValidationError({'email': f'Member with email "{attrs["email"]}" already exists.'})
         return attrs
 
@@ -26,6 +35,15 @@ class MemberCreateSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class MemberImportSerializer(serializers.Serializer):
+    """ One member of an import, the duplicates are skipped by the `teams_app.import_members` job. """
+    email = serializers.EmailField()
+    full_name = serializers.CharField(max_length=150)
+
+    def validate_email(self, value: str) -> str:
+        return normalize_email(value)
+
+
 class MemberSerializer(serializers.ModelSerializer):
     class MemberTeamSerializer(serializers.ModelSerializer):
 
@@ -52,15 +70,39 @@ class MemberUpdateSerializer(serializers.ModelSerializer):
         fields = ['email', 'full_name']
         partial = True
 
+    def validate_email(self, value: str) -> str:
+        """ Normalise the email, so that the duplicate check below compares stored forms. """
+        return normalize_email(value)
+
     def validate(self, attrs):
         """ Validate that the email is not already in use by another user's member. """
         request = self.context.get('request')
-        existing_emails = request.user.members.values_list('email', flat=True).exclude(id=self.instance.id)
-        if attrs['email'] in existing_emails:
-            raise serializers.ValidationError({'email': f'Member with email "{attrs["email"]}" already exists.'})
+        email = attrs.get('email')
+        if email and request.user.members.filter(email=email).exclude(id=self.instance.id).exists():
+            raise serializers.ValidationError({'email': f'Member with email "{email}" already exists.'})
         return super().validate(attrs)
 
 
+class MemberBulkUpdateItemSerializer(serializers.Serializer):
+    """ One `{id, changes}` item of a bulk update, the changes take the fields of `MemberUpdateSerializer`. """
+
+    class ChangesSerializer(serializers.Serializer):
+        email = serializers.EmailField(required=False)
+        full_name = serializers.CharField(max_length=150, required=False)
+
+        def validate_email(self, value: str) -> str:
+            """ Normalise the email, so that the duplicate check compares stored forms. """
+            return normalize_email(value)
+
+        def validate(self, attrs):
+            if not attrs:
+                raise serializers.ValidationError('No changes.')
+            return attrs
+
+    id = serializers.IntegerField(min_value=1)
+    changes = ChangesSerializer()
+
+
 """ TEAM SERIALIZERS """
 
 
@@ -106,8 +148,98 @@ class TeamSerializer(serializers.ModelSerializer):
             model = Member
             fields = ['id', 'email', 'full_name']
 
-    members = TeamMemberSerializer(many=True, read_only=True)
+    members = TeamMemberSerializer(source='members_preview', many=True, read_only=True)
+    members_next = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Team
+        fields = ['id', 'name', 'members_count', 'members', 'members_next']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """ Prefetch the first members of every team in one windowed query, regardless of the team sizes. """
+        preview = Member.objects.order_by('id')[:settings.TEAM_MEMBERS_PREVIEW_SIZE]
+        return queryset.prefetch_related(Prefetch('members', queryset=preview, to_attr='members_preview'))
+
+    def get_members_next(self, team: Team) -> str | None:
+        """ Link to the paginated members of the team when the preview does not hold all of them. """
+        if team.members_count <= len(team.members_preview):
+            return None
+        return reverse('team_members', kwargs={'pk': team.pk}, request=self.context.get('request'))
+
+
+""" FAST READ SERIALIZERS """
+
+
+class MemberReadSerializer(ValuesSerializer):
+    """ Output of `MemberSerializer`, built from `values()` rows. """
+
+    fields = {'id': 'id', 'email': 'email', 'team': None, 'user': 'user_id', 'full_name': None}
+    extra_lookups = ('team_id', 'team__name', 'first_name', 'last_name')
+
+    def get_team(self, row: dict) -> dict | None:
+        if row['team_id'] is None:
+            return None
+        return {'id': row['team_id'], 'name': row['team__name']}
+
+    def get_full_name(self, row: dict) -> str:
+        return format_full_name(row['first_name'], row['last_name'])
+
+
+class TeamReadSerializer(ValuesSerializer):
+    """ Output of `TeamSerializer`, built from `values()` rows and one windowed query for the member previews. """
+
+    fields = {'id': 'id', 'name': 'name', 'members_count': 'members_count', 'members': None, 'members_next': None}
+
+    def prepare(self, rows: list[dict]) -> None:
+        """ Load the first members of every team of the page. """
+        self.previews = {row['id']: [] for row in rows}
+        if not rows:
+            return
+        preview = (
+            self.context['request'].user.members.filter(team_id__in=self.previews)
+            .alias(position=Window(RowNumber(), partition_by=F('team_id'), order_by=F('id').asc()))
+            .filter(position__lte=settings.TEAM_MEMBERS_PREVIEW_SIZE)
+            .order_by('id')
+            .values_list('team_id', 'id', 'email', 'first_name', 'last_name')
+        )
+        for team_id, member_id, email, first_name, last_name in preview:
+            self.previews[team_id].append(
+                {'id': member_id, 'email': email, 'full_name': format_full_name(first_name, last_name)}
+            )
+
+    def get_members(self, row: dict) -> list[dict]:
+        return self.previews[row['id']]
+
+    def get_members_next(self, row: dict) -> str | None:
+        if row['members_count'] <= len(self.previews[row['id']]):
+            return None
+        return reverse('team_members', kwargs={'pk': row['id']}, request=self.context.get('request'))
+
+
+""" CHANGE FEED SERIALIZERS """
+
+
+class ChangeFeedInputSerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.CHANGE_FEED_MAX_LIMIT, default=settings.PAGINATION_PAGE_SIZE)
+
+
+class ChangeTeamSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Team
-        fields = ['id', 'name', 'members_count', 'members']
+        fields = ['id', 'name']
+
+
+""" AUDIT SERIALIZERS """
+
+
+class AuditEventSerializer(serializers.ModelSerializer):
+    actor = serializers.IntegerField(source='actor_id')
+    team = serializers.IntegerField(source='team_id')
+    member = serializers.IntegerField(source='member_id')
+
+    class Meta:
+        model = AuditEvent
+        fields = ['id', 'action', 'actor', 'team', 'member', 'data', 'created_at']
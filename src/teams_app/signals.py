@@ -0,0 +1,107 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import DEFERRED, F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from base.broadcast import publish
+from base.routers import shard_for_owner
+from . import audit
+from .models import Change, IdempotencyKey, Member, Team
+
+User = get_user_model()
+
+
+def record_change(owner_id: int, kind: str, object_id: int, action: str, using: str | None = None) -> None:
+    """ Appends an entry to the owner's change feed. """
+    Change.objects.using(using).create(owner_id=owner_id, kind=kind, object_id=object_id, action=action)
+
+
+def publish_on_commit(user_id: int, event_type: str, data: dict, using: str | None = None) -> None:
+    """ Streams the event to the user and records it in the audit log once the surrounding transaction is committed. """
+    transaction.on_commit(partial(publish, user_id, event_type, data), using=using)
+    transaction.on_commit(
+        partial(audit.record, user_id, event_type, data, audit.current_actor_id(), timezone.now()), using=using,
+    )
+
+
+def adjust_members_count(team_id: int | None, delta: int, using: str | None = None) -> None:
+    """ Atomically moves the denormalised members counter of the team, never below 0 when it has drifted. """
+    if team_id is not None:
+        Team.objects.using(using).filter(pk=team_id).update(members_count=Greatest(F('members_count') + delta, 0))
+
+
+def team_data(team: Team) -> dict:
+    return {'id': team.pk, 'name': team.name}
+
+
+def member_data(member: Member) -> dict:
+    return {'id': member.pk, 'email': member.email, 'team': member.team_id, 'full_name': member.full_name}
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, using: str, **kwargs) -> None:
+    """ The cascade only reaches the database of the user, delete the rows kept on the user's shard. """
+    shard = shard_for_owner(instance.pk)
+    if shard != using:
+        Team.objects.using(shard).filter(owner_id=instance.pk).delete()
+        Member.objects.using(shard).filter(user_id=instance.pk).delete()
+        IdempotencyKey.objects.using(shard).filter(user_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Team)
+def team_saved(sender, instance: Team, created: bool, using: str, **kwargs) -> None:
+    record_change(instance.owner_id, Change.KIND_TEAM, instance.pk, Change.ACTION_UPSERT, using)
+    publish_on_commit(instance.owner_id, 'team.created' if created else 'team.updated', team_data(instance), using)
+
+
+@receiver(pre_delete, sender=Team)
+def team_deleting(sender, instance: Team, **kwargs) -> None:
+    """ Remember the members that `SET_NULL` is about to detach, the bulk update sends no signals. """
+    instance._detached_member_ids = list(instance.members.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Team)
+def team_deleted(sender, instance: Team, using: str, **kwargs) -> None:
+    detached_member_ids = getattr(instance, '_detached_member_ids', [])
+    Change.objects.using(using).bulk_create(
+        Change(owner_id=instance.owner_id, kind=Change.KIND_MEMBER, object_id=member_id, action=Change.ACTION_UPSERT)
+        for member_id in detached_member_ids
+    )
+    record_change(instance.owner_id, Change.KIND_TEAM, instance.pk, Change.ACTION_DELETE, using)
+    for member_id in detached_member_ids:
+        publish_on_commit(instance.owner_id, 'membership.removed', {'team': instance.pk, 'member': member_id}, using)
+    publish_on_commit(instance.owner_id, 'team.deleted', {'id': instance.pk}, using)
+
+
+@receiver(pre_save, sender=Member)
+def member_saving(sender, instance: Member, using: str, update_fields=None, **kwargs) -> None:
+    """ Find out which team the member is leaving, unless the instance already knows it. """
+    if instance._state.adding:
+        instance._loaded_team_id = None
+    elif getattr(instance, '_loaded_team_id', DEFERRED) is DEFERRED:
+        instance._loaded_team_id = Member.objects.using(using).filter(pk=instance.pk).values_list('team_id', flat=True).first()
+
+
+@receiver(post_save, sender=Member)
+def member_saved(sender, instance: Member, created: bool, using: str, update_fields=None, **kwargs) -> None:
+    if update_fields is None or 'team' in update_fields or 'team_id' in update_fields:
+        if instance._loaded_team_id != instance.team_id:
+            adjust_members_count(instance._loaded_team_id, -1, using)
+            adjust_members_count(instance.team_id, 1, using)
+        instance._loaded_team_id = instance.team_id
+    record_change(instance.user_id, Change.KIND_MEMBER, instance.pk, Change.ACTION_UPSERT, using)
+    publish_on_commit(
+        instance.user_id, 'member.created' if created else 'member.updated', member_data(instance), using,
+    )
+
+
+@receiver(post_delete, sender=Member)
+def member_deleted(sender, instance: Member, using: str, **kwargs) -> None:
+    adjust_members_count(instance.team_id, -1, using)
+    record_change(instance.user_id, Change.KIND_MEMBER, instance.pk, Change.ACTION_DELETE, using)
+    publish_on_commit(instance.user_id, 'member.deleted', {'id': instance.pk}, using)
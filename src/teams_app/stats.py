@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q
+
+from base.routers import shard_for_owner
+from .models import Change
+
+
+def data_version(user) -> str:
+    """
+    Returns the shard and the latest change feed sequence of the user.
+
+    It changes on every write to their data, and when `rebalance_shards` moves the data to another shard.
+    """
+    version = Change.objects.for_owner(user.id).aggregate(version=Max('seq'))['version'] or 0
+    return f'{shard_for_owner(user.id)}.{version}'
+
+
+def compute_stats(user) -> dict:
+    """ Computes the user's team and member statistics with aggregate queries. """
+    teams = user.teams.all()
+    members = user.members.all()
+
+    member_totals = members.aggregate(total=Count('id'), unassigned=Count('id', filter=Q(team__isnull=True)))
+
+    distribution = (
+        teams.values(size=F('members_count'))
+        .annotate(teams=Count('id'))
+        .order_by('size')
+    )
+
+    largest_teams = teams.order_by('-members_count', 'id').values('id', 'name', 'members_count')[:settings.STATS_TOP_SIZE]
+
+    email_domains = (
+        members.values(domain=F('email_domain'))
+        .annotate(members=Count('id'))
+        .order_by('-members', 'domain')[:settings.STATS_TOP_SIZE]
+    )
+
+    return {
+        'teams_count': teams.count(),
+        'members_count': member_totals['total'],
+        'unassigned_members_count': member_totals['unassigned'],
+        'members_per_team': list(distribution),
+        'largest_teams': list(largest_teams),
+        'email_domains': list(email_domains),
+    }
+
+
+def get_stats(user) -> dict:
+    """ Returns the user's statistics, cached until their data changes. """
+    cache_key = f'teams_app:stats:{user.id}:{data_version(user)}'
+    stats = cache.get(cache_key)
+    if stats is None:
+        stats = compute_stats(user)
+        cache.set(cache_key, stats, settings.STATS_CACHE_TIMEOUT)
+    return stats
@@ -0,0 +1,47 @@
+import json
+from typing import AsyncIterator
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
+from django.views import View
+
+from base.broadcast import Subscription, broadcaster
+
+
+class EventStreamView(View):
+    """
+    Stream the user's team, member and membership events as Server-Sent Events.
+
+    The stream holds the connection open for as long as the client stays, so it is only served under ASGI
+    (`base.asgi.application`).
+    """
+
+    http_method_names = ['get']
+
+    async def get(self, request: HttpRequest, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'message': 'Event stream requires the ASGI server'}, status=501)
+
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403)
+
+        response = StreamingHttpResponse(self.stream(user.id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, user_id: int) -> AsyncIterator[str]:
+        """ Yield events until the client disconnects, sending heartbeats while idle. """
+        subscription: Subscription = broadcaster.subscribe(user_id)
+        try:
+            yield f'retry: {settings.EVENTS_HEARTBEAT_INTERVAL * 1000}\n\n'
+            while True:
+                event = await subscription.get(timeout=settings.EVENTS_HEARTBEAT_INTERVAL)
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'event: {event["type"]}\ndata: {json.dumps(event["data"])}\n\n'
+        finally:
+            broadcaster.unsubscribe(subscription)
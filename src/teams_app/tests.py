@@ -1,3 +1,1629 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import io
+import json
+import os
+import queue
+import re
+import runpy
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory
+
+from base import access_log, admission, broadcast, coalescing, replicas, schema, startup
+from base.admin import EstimatedCountPaginator
+from base.routers import all_databases, shard_for_owner
+from base.yasg import schema_view
+from jobs.queue import claim, execute
+from users.models import User
+from . import audit, stats
+from .filters import MemberFilterSet, TeamFilterSet
+from .management.commands import rebalance_shards
+from .models import AuditEvent, Change, IdempotencyKey, Member, Team
+from .serializers import MemberReadSerializer, MemberSerializer, TeamReadSerializer, TeamSerializer
+
+
+@unittest.skipUnless(settings.API_DOCS_ENABLED, 'The docs routes are disabled.')
+class OpenAPISchemaArtifactTests(TestCase):
+    """ The stored OpenAPI schema must match the one generated live from the views. """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The artifact of the deployment when there is one, so a stale artifact fails the test, otherwise the one the
+        # deployment would write.
+        cls.schema_dir = settings.OPENAPI_SCHEMA_DIR
+        if not schema.artifact_path('json').exists():
+            cls.schema_dir = cls.enterClassContext(tempfile.TemporaryDirectory())
+            with override_settings(OPENAPI_SCHEMA_DIR=cls.schema_dir):
+                call_command('generate_openapi_schema', stderr=io.StringIO())
+
+    def setUp(self):
+        schema._artifacts.clear()
+        self.addCleanup(schema._artifacts.clear)
+
+    def live_schema(self) -> dict:
+        request = APIRequestFactory().get('/swagger.json/', {'format': 'json'})
+        response = schema_view.without_ui()(request, format='json')
+        response.render()
+        live = json.loads(response.content)
+        # The live schema describes the host of the request, the artifact is host independent.
+        live.pop('host', None)
+        live.pop('schemes', None)
+        return live
+
+    def test_stored_schema_matches_live_schema(self):
+        with override_settings(OPENAPI_SCHEMA_DIR=self.schema_dir):
+            response = self.client.get('/swagger.json/')
+            artifact = schema.artifact_path('json').read_bytes()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, artifact)
+        self.assertEqual(json.loads(artifact), self.live_schema())
+
+    def test_conditional_request_is_not_modified(self):
+        response = self.client.get('/swagger.json/')
+        cached = self.client.get('/swagger.json/', HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_artifact_of_the_current_code_is_served(self):
+        with tempfile.TemporaryDirectory() as schema_dir, override_settings(OPENAPI_SCHEMA_DIR=schema_dir):
+            schema.artifact_path('json').write_bytes(b'{"stored": true}')
+            schema.fingerprint_path().write_text(schema.code_fingerprint())
+            stored = self.client.get('/swagger.json/')
+            with override_settings(DEBUG=True):
+                debug = self.client.get('/swagger.json/')
+
+        self.assertEqual(stored.content, b'{"stored": true}')
+        self.assertEqual(json.loads(debug.content), self.live_schema())
+
+    def test_stale_artifact_is_replaced_by_the_live_schema(self):
+        with tempfile.TemporaryDirectory() as schema_dir, override_settings(OPENAPI_SCHEMA_DIR=schema_dir):
+            schema.artifact_path('json').write_bytes(b'{"stored": true}')
+            schema.fingerprint_path().write_text('0' * 64)
+            with self.assertLogs('base.schema', 'WARNING'):
+                response = self.client.get('/swagger.json/')
+
+        self.assertEqual(json.loads(response.content), self.live_schema())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against the SQLite planner.')
+class FilterIndexTests(TestCase):
+    """ Every list filter must be answered with an index search, never with a table scan. """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com')
+        (cls.team,), _ = create_fixture(
+            cls.user, {'Alpha': [{'email': 'bob@example.com', 'first_name': 'Bob'}]},
+            [{'email': 'al@example.org', 'first_name': 'Al'}],
+        )
+
+    def assertUsesIndex(self, queryset, indexes):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'SEARCH \w+ USING INDEX ({"|".join(indexes)})', plan)
+        self.assertNotIn('SCAN', plan)
+
+    def test_member_filters_use_indexes(self):
+        cases = [
+            ({'team': self.team.pk}, ['teams_app_member_user_team_idx']),
+            ({'unassigned': 'true'}, ['teams_app_member_user_team_idx', 'teams_app_member_no_team_idx']),
+            ({'email_domain': 'Example.com'}, ['teams_app_member_domain_idx']),
+            ({'name': 'bo'}, ['teams_app_member_name_idx']),
+            ({'id_min': 1, 'id_max': 10}, ['teams_app_member_user_id_idx']),
+        ]
+        for params, indexes in cases:
+            with self.subTest(params=params):
+                queryset = MemberFilterSet(params, queryset=self.user.members.all()).qs
+                self.assertEqual(queryset.count(), 1 if 'id_min' not in params else 2)
+                self.assertUsesIndex(queryset, indexes)
+
+    def test_team_filters_use_indexes(self):
+        cases = [
+            ({'name': 'al'}, ['teams_app_team_owner_name_idx']),
+            ({'id_min': 1, 'id_max': 10}, ['teams_app_team_owner_id_idx']),
+        ]
+        for params, indexes in cases:
+            with self.subTest(params=params):
+                queryset = TeamFilterSet(params, queryset=self.user.teams.all()).qs
+                self.assertEqual(queryset.count(), 1)
+                self.assertUsesIndex(queryset, indexes)
+
+
+def create_fixture(owner: User, teams: dict[str, list[dict]], unassigned: list[dict] = ()) -> tuple[list, list]:
+    """
+    Creates the owner's teams, `teams` mapping each name to the fields of its members, then the members without a
+    team, through the usual signals (counters, change feed). Returns the teams and the members in creation order.
+    """
+    created_teams, members = [], []
+    for name, team_members in teams.items():
+        team = Team.objects.create(name=name, owner=owner)
+        created_teams.append(team)
+        members += [Member.objects.create(user=owner, team=team, **fields) for fields in team_members]
+    members += [Member.objects.create(user=owner, **fields) for fields in unassigned]
+    for team in created_teams:
+        team.refresh_from_db(fields=['members_count'])
+    return created_teams, members
+
+
+def dormant_audit_writer() -> audit.AuditLogWriter:
+    """ An audit log writer without its background thread, the test flushes it. """
+    writer = audit.AuditLogWriter()
+    writer._pid = os.getpid()
+    return writer
+
+
+def url_pattern_names(patterns) -> set[str]:
+    names = set()
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            names |= url_pattern_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against the SQLite planner.')
+@override_settings(DATABASE_REPLICAS={})
+class EndpointQueryBudgetTests(TestCase):
+    """
+    Every endpoint of `teams_app.urls` and `users.urls` runs at most its declared number of queries, the same
+    number whatever the page size, and none of its statements scans the member, team or user table.
+    """
+
+    databases = '__all__'
+    page_sizes = (2, 20)
+    scanned_tables = re.compile(r'\bSCAN (teams_app_member|teams_app_team|users_user)\b')
+
+    # Maximum number of queries, sessions and savepoints included.
+    budgets = {
+        'team_list': 7,
+        'team_detail': 5,
+        'team_batch': 5,
+        'team_members': 6,
+        'team_audit': 4,
+        'team_create': 5,
+        'team_update': 6,
+        'team_delete': 8,
+        'member_list': 5,
+        'member_detail': 4,
+        'member_batch': 3,
+        'member_audit': 4,
+        'member_create': 5,
+        'member_update': 5,
+        'member_bulk_update': 8,
+        'member_export': 5,
+        'member_import': 5,
+        'member_delete': 6,
+        'add_member': 7,
+        'remove_member': 8,
+        'stats': 8,
+        'change_feed': 5,
+        'user_list': 5,
+        'register': 2,
+        'edit_profile': 3,
+        'change_password': 5,
+        'delete_user': 19,
+        'login': 9,
+        'logout': 4,
+        'google_login_redirect': 0,
+        'google_login_callback': 0,
+    }
+    # Queries added when sharded, deleting a user also deletes its rows on its shard.
+    sharded_extra = {
+        'delete_user': 2,
+    }
+    # Tables an endpoint is expected to scan.
+    allowed_scans = {
+        'user_list': {'users_user'},
+    }
+    not_covered = {
+        'event_stream': 'streams until the client disconnects',
+        'google_login': 'calls Google, see users.tests.GoogleIdTokenLoginTests',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com', is_staff=True)
+        cls.user.set_password('password')
+        cls.user.save()
+        big_team = [
+            {'email': 'member@example.com', 'first_name': 'Member'},
+            *({'email': f'big{index}@example.com'} for index in range(25)),
+        ]
+        small_teams = {f'Team {index}': [{'email': f'team{index}@example.com'}] for index in range(1, 25)}
+        free = [{'email': 'free@example.com', 'first_name': 'Free'}]
+        free += [{'email': f'free{index}@example.com'} for index in range(10)]
+        cls.teams, members = create_fixture(cls.user, {'Team 0': big_team, **small_teams}, free)
+        cls.member, cls.free_member = members[0], members[-len(free)]
+        cls.other = User.objects.create(email='other@example.com')
+        create_fixture(cls.other, {'Foreign': [{'email': 'foreign@example.com'}]})
+
+    def endpoint_requests(self, page_size: int) -> dict:
+        """ url name -> (method, URL kwargs, data, authenticated) """
+        team, member, free_member = self.teams[0], self.member, self.free_member
+        member_ids = list(self.user.members.order_by('id').values_list('id', flat=True))
+        password = {'old_password': 'password', 'new_password': 'new-password', 'confirm_password': 'new-password'}
+        return {
+            'team_list': ('GET', {}, {}, True),
+            'team_detail': ('GET', {'pk': team.pk}, {}, True),
+            'team_batch': ('GET', {}, {'ids': ','.join(str(team.pk) for team in self.teams[:page_size])}, True),
+            'team_members': ('GET', {'pk': team.pk}, {}, True),
+            'team_audit': ('GET', {'pk': team.pk}, {}, True),
+            'team_create': ('POST', {}, {'name': 'New team'}, True),
+            'team_update': ('PUT', {'pk': team.pk}, {'name': 'Renamed'}, True),
+            'team_delete': ('DELETE', {'pk': team.pk}, None, True),
+            'member_list': ('GET', {}, {}, True),
+            'member_detail': ('GET', {'pk': member.pk}, {}, True),
+            'member_audit': ('GET', {'pk': member.pk}, {}, True),
+            'member_batch': ('GET', {}, {'ids': ','.join(str(pk) for pk in member_ids[:page_size])}, True),
+            'member_create': ('POST', {}, {'email': 'new@example.com', 'full_name': 'New Member'}, True),
+            'member_update': ('PUT', {'pk': member.pk}, {'full_name': 'Renamed Member'}, True),
+            'member_bulk_update': ('PATCH', {}, [
+                {'id': pk, 'changes': {'email': f'renamed{pk}@example.org', 'full_name': 'Renamed Member'}}
+                for pk in member_ids[:page_size]
+            ], True),
+            'member_export': ('POST', {}, None, True),
+            'member_import': ('POST', {}, [
+                {'email': f'imported{index}@example.com', 'full_name': 'Imported Member'} for index in range(page_size)
+            ], True),
+            'member_delete': ('DELETE', {'pk': member.pk}, None, True),
+            'add_member': ('POST', {'team_pk': team.pk, 'member_pk': free_member.pk}, None, True),
+            'remove_member': ('POST', {'team_pk': team.pk, 'member_pk': member.pk}, None, True),
+            'stats': ('GET', {}, {}, True),
+            'change_feed': ('GET', {}, {'limit': page_size}, True),
+            'user_list': ('GET', {}, {}, True),
+            'register': ('POST', {}, {'email': 'new-user@example.com', 'password': 'password'}, False),
+            'edit_profile': ('PUT', {}, {'fullName': 'Owner'}, True),
+            'change_password': ('PUT', {}, password, True),
+            'delete_user': ('DELETE', {'pk': self.other.pk}, None, True),
+            'login': ('POST', {}, {'email': 'owner@example.com', 'password': 'password'}, False),
+            'logout': ('POST', {}, None, True),
+            'google_login_redirect': ('GET', {}, {}, False),
+            'google_login_callback': ('GET', {}, {'code': 'code'}, False),
+        }
+
+    def run_request(self, url_name: str, page_size: int) -> tuple[list, list[str]]:
+        """ Runs the request in a rolled back transaction, returns its (alias, sql, params) and query plans. """
+        method, kwargs, data, authenticated = self.endpoint_requests(page_size)[url_name]
+        statements = []
+
+        def capture(alias):
+            def wrapper(execute, sql, params, many, context):
+                statements.append((alias, sql, None if many else params))
+                return execute(sql, params, many, context)
+            return wrapper
+
+        cache.clear()
+        with contextlib.ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(transaction.atomic(using=alias))
+            if authenticated:
+                self.client.force_login(self.user)
+            else:
+                self.client.logout()
+            with contextlib.ExitStack() as capturing:
+                capturing.enter_context(mock.patch.object(PageNumberPagination, 'page_size', page_size))
+                for alias in settings.DATABASES:
+                    capturing.enter_context(connections[alias].execute_wrapper(capture(alias)))
+                url = reverse(url_name, kwargs=kwargs)
+                if method == 'GET':
+                    response = self.client.get(url, data)
+                else:
+                    body = json.dumps(data) if data is not None else None
+                    response = self.client.generic(method, url, body, content_type='application/json')
+            self.assertLess(response.status_code, 400, f'{url_name}: {response.status_code} {response.content[:200]}')
+
+            plans = []
+            for alias, sql, params in statements:
+                if params is None or not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                    plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                plans.append(f'{sql}\n{plan}')
+            for alias in settings.DATABASES:
+                transaction.set_rollback(True, using=alias)
+        return statements, plans
+
+    def test_every_endpoint_is_covered(self):
+        url_names = set()
+        for urlconf in ('teams_app.urls', 'users.urls'):
+            url_names |= url_pattern_names(import_module(urlconf).urlpatterns)
+        self.assertEqual(url_names, {*self.budgets, *self.not_covered})
+
+    def test_query_counts_stay_within_the_budgets(self):
+        for url_name, budget in self.budgets.items():
+            with self.subTest(url_name):
+                counts = [len(self.run_request(url_name, page_size)[0]) for page_size in self.page_sizes]
+                self.assertEqual(counts[0], counts[-1], f'{url_name} runs more queries on larger pages')
+                if settings.SHARD_DATABASES:
+                    budget += self.sharded_extra.get(url_name, 0)
+                self.assertLessEqual(counts[-1], budget)
+
+    def test_no_endpoint_scans_the_member_team_or_user_table(self):
+        for url_name in self.budgets:
+            with self.subTest(url_name):
+                _, plans = self.run_request(url_name, self.page_sizes[-1])
+                allowed = self.allowed_scans.get(url_name, set())
+                scans = [plan for plan in plans if set(self.scanned_tables.findall(plan)) - allowed]
+                self.assertFalse(scans, '\n\n'.join(scans))
+
+
+class MultiGetTests(TestCase):
+    """ `?ids=` endpoints return the user's objects in the requested order and report the missing ids. """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com')
+        janes = [{'email': f'member{index}@example.com', 'first_name': 'Jane', 'last_name': f'Doe {index}'}
+                 for index in range(3)]
+        (cls.team,), members = create_fixture(cls.user, {'Alpha': janes[1:]}, janes[:1])
+        cls.members = [members[-1], *members[:-1]]
+        cls.other = User.objects.create(email='other@example.com')
+        (cls.foreign_team,), (cls.foreign_member,) = create_fixture(
+            cls.other, {'Foreign': []}, [{'email': 'foreign@example.com'}],
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, url_name, ids):
+        return self.client.get(reverse(url_name), {'ids': ids})
+
+    def test_members_are_returned_in_order_with_their_team(self):
+        first, second, third = self.members
+        ids = f'{third.pk},{self.foreign_member.pk},{first.pk},{third.pk},999999'
+        response = self.get('member_batch', ids)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data'], [
+            {'id': third.pk, 'email': third.email, 'team': {'id': self.team.pk, 'name': 'Alpha'},
+             'user': self.user.pk, 'full_name': 'Jane Doe 2'},
+            {'id': first.pk, 'email': first.email, 'team': None, 'user': self.user.pk, 'full_name': 'Jane Doe 0'},
+        ])
+        self.assertEqual(response.data['missing'], [self.foreign_member.pk, 999999])
+
+    def test_teams_match_the_detail_endpoint(self):
+        response = self.get('team_batch', f'{self.team.pk},{self.foreign_team.pk}')
+
+        self.assertEqual(response.status_code, 200)
+        detail = self.client.get(reverse('team_detail', kwargs={'pk': self.team.pk}))
+        self.assertEqual(response.data['data'], [detail.data])
+        self.assertEqual(response.data['missing'], [self.foreign_team.pk])
+
+    @override_settings(MULTI_GET_MAX_IDS=2)
+    def test_invalid_batches_are_rejected(self):
+        for ids in ('', '1,a', '1,2,3', '0', str(2 ** 63)):
+            with self.subTest(ids):
+                self.assertEqual(self.get('member_batch', ids).status_code, 400)
+        self.assertEqual(self.get('member_batch', '1, 2,').status_code, 200)
+
+
+@override_settings(TEAM_MEMBERS_PREVIEW_SIZE=2)
+class TeamMembersPreviewTests(TestCase):
+    """ Teams embed their first members only, the others are paged through the `team_members` endpoint. """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com')
+        members = [{'email': f'member{index}@example.com', 'first_name': f'Member {index}'} for index in range(15)]
+        (cls.big, cls.full, cls.empty), cls.members = create_fixture(
+            cls.user, {'Big': members[:12], 'Full': members[12:14], 'Empty': []}, members[14:],
+        )
+        (cls.foreign,), _ = create_fixture(
+            User.objects.create(email='other@example.com'), {'Foreign': [{'email': 'foreign@example.com'}]},
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.user)
+
+    def members_url(self, team: Team) -> str:
+        return f'http://testserver{reverse("team_members", kwargs={"pk": team.pk})}'
+
+    def test_detail_embeds_the_first_members_and_links_the_others(self):
+        response = self.client.get(reverse('team_detail', kwargs={'pk': self.big.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['members_count'], 12)
+        self.assertEqual([member['id'] for member in response.data['members']], [m.pk for m in self.members[:2]])
+        self.assertEqual(response.data['members_next'], self.members_url(self.big))
+
+    def test_members_next_is_only_set_when_more_members_exist(self):
+        for team in (self.full, self.empty):
+            with self.subTest(team.name):
+                response = self.client.get(reverse('team_detail', kwargs={'pk': team.pk}))
+
+                self.assertEqual(len(response.data['members']), team.members_count)
+                self.assertIsNone(response.data['members_next'])
+
+    def test_list_caps_every_preview(self):
+        response = self.client.get(reverse('team_list'), {'ordering': 'id'})
+
+        self.assertEqual(
+            [(team['name'], len(team['members']), team['members_next']) for team in response.data['data']],
+            [('Big', 2, self.members_url(self.big)), ('Full', 2, None), ('Empty', 0, None)],
+        )
+
+    def test_team_members_are_paginated(self):
+        first = self.client.get(reverse('team_members', kwargs={'pk': self.big.pk}))
+        second = self.client.get(reverse('team_members', kwargs={'pk': self.big.pk}), {'page': 2})
+
+        self.assertEqual((first.data['pages'], second.data['pages']), (2, 2))
+        self.assertEqual(
+            [member['id'] for member in first.data['data'] + second.data['data']],
+            [member.pk for member in self.members[:12]],
+        )
+
+    def test_other_users_team_members_are_not_listed(self):
+        response = self.client.get(reverse('team_members', kwargs={'pk': self.foreign.pk}))
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=3)
+class AdminCountTests(TestCase):
+    """ The admin lists never count more rows than the threshold. """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Users, as they stay on the default database seen by the admin also with sharding.
+        cls.admin = User.objects.create(email='admin@example.com', is_staff=True, is_superuser=True)
+        for index in range(4):
+            User.objects.create(email=f'user{index}@example.com')
+
+    def test_count_stops_after_the_threshold(self):
+        with CaptureQueriesContext(connection) as queries:
+            count = EstimatedCountPaginator(User.objects.order_by('-id'), 2).count
+
+        self.assertEqual(count, 4)
+        self.assertIn('LIMIT 4', queries[-1]['sql'])
+
+    def test_count_under_the_threshold_is_exact(self):
+        paginator = EstimatedCountPaginator(User.objects.filter(email__startswith='user1').order_by('id'), 2)
+
+        self.assertEqual(paginator.count, 1)
+
+    def test_changelist_counts_are_bounded(self):
+        self.client.force_login(self.admin)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:users_user_changelist'))
+
+        self.assertEqual(response.status_code, 200)
+        counts = [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+        self.assertTrue(counts)
+        self.assertTrue(all('LIMIT 4' in sql for sql in counts), counts)
+
+
+class MemberBulkUpdateTests(TestCase):
+    """ A bulk PATCH validates the whole batch at once, saves the valid items together and reports every item. """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com')
+        members = [{'email': f'{name}@old.example.com', 'first_name': name.title()} for name in ('ann', 'bob', 'cid')]
+        (cls.team,), (cls.ann, cls.bob, cls.cid) = create_fixture(cls.user, {'Alpha': members})
+        other = User.objects.create(email='o@x.io')
+        _, (cls.foreign_member,) = create_fixture(other, {}, [{'email': 'foreign@example.com'}])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def patch(self, items):
+        using = shard_for_owner(self.user.pk)
+        with mock.patch('teams_app.signals.publish') as publish, \
+                mock.patch.object(audit, '_writer', dormant_audit_writer()), \
+                self.captureOnCommitCallbacks(using=using, execute=True):
+            response = self.client.patch(reverse('member_bulk_update'), items, content_type='application/json')
+        self.published = [(call.args[1], call.args[2]['id']) for call in publish.call_args_list]
+        return response
+
+    def test_valid_items_are_saved_and_every_item_is_reported(self):
+        since = Change.objects.for_owner(self.user.pk).order_by('seq').last().seq
+        response = self.patch([
+            {'id': self.ann.pk, 'changes': {'email': 'Ann@New.example.com', 'full_name': 'Ann Smith'}},
+            {'id': self.bob.pk, 'changes': {'email': 'cid@old.example.com'}},
+            {'id': self.foreign_member.pk, 'changes': {'full_name': 'Mallory'}},
+            {'id': self.cid.pk, 'changes': {}},
+            {'id': self.ann.pk, 'changes': {'full_name': 'Twice'}},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['message'], '1 members updated')
+        self.assertEqual(
+            [(result['id'], result['status']) for result in response.data['results']],
+            [(self.ann.pk, 200), (self.bob.pk, 400), (self.foreign_member.pk, 404), (self.cid.pk, 400),
+             (self.ann.pk, 400)],
+        )
+        ann, bob = self.user.members.get(pk=self.ann.pk), self.user.members.get(pk=self.bob.pk)
+        self.assertEqual(
+            (ann.email, ann.email_domain, ann.full_name), ('ann@new.example.com', 'new.example.com', 'Ann Smith'),
+        )
+        self.assertEqual(bob.email, 'bob@old.example.com')
+        self.assertEqual(
+            list(Change.objects.for_owner(self.user.pk).filter(seq__gt=since).values_list('object_id', 'action')),
+            [(self.ann.pk, Change.ACTION_UPSERT)],
+        )
+        self.assertEqual(self.published, [('member.updated', self.ann.pk)])
+        self.assertEqual(self.user.teams.get(pk=self.team.pk).members_count, 3)
+
+    def test_emails_can_be_swapped_within_the_batch(self):
+        response = self.patch([
+            {'id': self.ann.pk, 'changes': {'email': 'bob@old.example.com'}},
+            {'id': self.bob.pk, 'changes': {'email': 'ann@old.example.com'}},
+            {'id': self.cid.pk, 'changes': {'email': 'shared@example.com'}},
+        ])
+
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 200, 200])
+        self.assertEqual(
+            dict(self.user.members.values_list('first_name', 'email')),
+            {'Ann': 'bob@old.example.com', 'Bob': 'ann@old.example.com', 'Cid': 'shared@example.com'},
+        )
+
+    def test_an_email_taken_twice_in_the_batch_is_rejected(self):
+        response = self.patch([
+            {'id': self.ann.pk, 'changes': {'email': 'same@example.com'}},
+            {'id': self.bob.pk, 'changes': {'email': 'SAME@example.com'}},
+            {'id': self.cid.pk, 'changes': {'full_name': 'Cid Vicious'}},
+        ])
+
+        self.assertEqual([result['status'] for result in response.data['results']], [400, 400, 200])
+        self.assertFalse(self.user.members.filter(email='same@example.com').exists())
+
+    @override_settings(MEMBER_BULK_UPDATE_MAX_ITEMS=2)
+    def test_malformed_batches_are_rejected(self):
+        item = {'id': self.ann.pk, 'changes': {'full_name': 'Ann'}}
+        for body in ({}, [], [item] * 3):
+            with self.subTest(body):
+                self.assertEqual(self.patch(body).status_code, 400)
+
+
+class MemberImportExportTests(TestCase):
+    """ Imports and exports run as background jobs whose result is polled from the returned job URL. """
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create(email='owner@example.com')
+        self.client.force_login(self.user)
+        self.enterContext(mock.patch.object(audit, '_writer', dormant_audit_writer()))
+
+    def run_job(self, response) -> dict:
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], response.data['job'])
+        execute(claim('test'))
+        return self.client.get(response.data['job']).data
+
+    def test_imported_members_are_exported(self):
+        existing = Member.objects.create(email='bob@example.com', first_name='Bob', last_name='Smith', user=self.user)
+        members = [
+            {'email': 'Jane@Example.com', 'full_name': 'Jane Doe'},
+            {'email': 'bob@example.com', 'full_name': 'Bob Again'},
+        ]
+
+        imported = self.run_job(self.client.post(reverse('member_import'), members, content_type='application/json'))
+        exported = self.run_job(self.client.post(reverse('member_export')))
+
+        self.assertEqual(imported['result'], {'created': 1, 'skipped': ['bob@example.com']})
+        self.assertEqual(
+            [(member['email'], member['full_name']) for member in exported['result']['members']],
+            [(existing.email, 'Bob Smith'), ('jane@example.com', 'Jane Doe')],
+        )
+        self.assertEqual((exported['status'], exported['progress']), ('succeeded', 100))
+
+    def test_invalid_import_is_not_queued(self):
+        response = self.client.post(
+            reverse('member_import'), [{'email': 'not-an-email', 'full_name': 'X'}], content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(claim('test'))
+
+
+class AuditLogTests(TestCase):
+    """ Committed changes are recorded with their actor by a batching writer and listed per team and member. """
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create(email='owner@example.com')
+        self.client.force_login(self.user)
+        self.writer = self.enterContext(mock.patch.object(audit, '_writer', dormant_audit_writer()))
+
+    def test_changes_are_recorded_and_listed(self):
+        with self.captureOnCommitCallbacks(using=shard_for_owner(self.user.pk), execute=True):
+            self.client.post(reverse('team_create'), {'name': 'Alpha'})
+            self.client.post(reverse('member_create'), {'email': 'bob@example.com', 'full_name': 'Bob Smith'})
+            team, member = self.user.teams.get(), self.user.members.get()
+            self.client.post(reverse('add_member', kwargs={'team_pk': team.pk, 'member_pk': member.pk}))
+            self.client.post(reverse('remove_member', kwargs={'team_pk': team.pk, 'member_pk': member.pk}))
+            self.assertEqual(self.client.delete(reverse('team_delete', kwargs={'pk': team.pk})).status_code, 202)
+            execute(claim('test'))
+        self.assertFalse(AuditEvent.objects.for_owner(self.user.pk).exists())
+        self.assertEqual(self.writer.flush(), 7)
+
+        events = AuditEvent.objects.for_owner(self.user.pk)
+        # Including the team deleted by a background job, on behalf of the user.
+        self.assertEqual({event.actor_id for event in events}, {self.user.pk})
+        response = self.client.get(reverse('team_audit', kwargs={'pk': team.pk}))
+        self.assertEqual(
+            [(event['action'], event['member']) for event in response.data['data']],
+            [('team.deleted', None), ('membership.removed', member.pk), ('membership.added', member.pk),
+             ('member.updated', member.pk), ('team.created', None)],
+        )
+        response = self.client.get(reverse('member_audit', kwargs={'pk': member.pk}))
+        self.assertEqual(
+            [event['action'] for event in response.data['data']],
+            ['membership.removed', 'member.updated', 'membership.added', 'member.updated', 'member.created'],
+        )
+        self.assertEqual(response.data['data'][-1]['data']['email'], 'bob@example.com')
+
+    def test_other_users_history_is_not_listed(self):
+        AuditEvent.objects.create(
+            owner_id=self.user.pk + 1, action='team.created', team_id=1, created_at=timezone.now(),
+        )
+
+        response = self.client.get(reverse('team_audit', kwargs={'pk': 1}))
+        self.assertEqual(response.data['data'], [])
+
+    def test_failed_write_keeps_the_events(self):
+        audit.record(self.user.pk, 'team.created', {'id': 1, 'name': 'A'}, self.user.pk, timezone.now())
+
+        with mock.patch.object(AuditEvent.objects, 'using') as using, self.assertLogs(audit.logger, 'WARNING'):
+            using.return_value.bulk_create.side_effect = TypeError('unexpected')
+            self.assertEqual(self.writer.flush(), 0)
+
+        self.assertEqual(self.writer.flush(), 1)
+        self.assertTrue(AuditEvent.objects.for_owner(self.user.pk).exists())
+
+    @override_settings(AUDIT_LOG_FLUSH_INTERVAL=3600)
+    def test_writer_thread_survives_a_failed_flush(self):
+        failed, flushed = threading.Event(), threading.Event()
+
+        def flush():
+            if not failed.is_set():
+                failed.set()
+                raise RuntimeError('boom')
+            flushed.set()
+
+        writer = audit.AuditLogWriter()
+        writer.flush = flush
+        with self.assertLogs(audit.logger, 'ERROR') as logs:
+            writer._start()
+            writer._wakeup.set()
+            self.assertTrue(failed.wait(5))
+            writer._wakeup.set()
+            self.assertTrue(flushed.wait(5))
+
+        self.assertIn('Audit log flush failed', logs.output[0])
+
+    @override_settings(AUDIT_LOG_BATCH_SIZE=2, AUDIT_LOG_FLUSH_INTERVAL=3600)
+    def test_full_batch_wakes_the_writer_thread(self):
+        written = []
+        flushed = threading.Event()
+
+        def bulk_create(events, **kwargs):
+            written.extend(events)
+            flushed.set()
+
+        writer = audit.AuditLogWriter()
+        with mock.patch.object(AuditEvent.objects, 'using') as using:
+            using.return_value.bulk_create.side_effect = bulk_create
+            with mock.patch.object(audit, '_writer', writer):
+                audit.record(self.user.pk, 'team.created', {'id': 1, 'name': 'A'}, self.user.pk, timezone.now())
+                self.assertFalse(flushed.wait(0.2))
+                audit.record(self.user.pk, 'team.deleted', {'id': 1}, self.user.pk, timezone.now())
+                self.assertTrue(flushed.wait(5))
+        self.assertEqual([event.action for event in written], ['team.created', 'team.deleted'])
+
+    def test_failed_writes_are_retried(self):
+        with mock.patch.object(AuditEvent.objects, 'using') as using:
+            using.return_value.bulk_create.side_effect = [DatabaseError('database is locked'), None]
+            audit.record(self.user.pk, 'member.deleted', {'id': 1}, None, timezone.now())
+            with self.assertLogs('teams_app.audit', 'WARNING'):
+                self.assertEqual(self.writer.flush(), 0)
+            self.assertEqual(self.writer.flush(), 1)
+            self.assertEqual(self.writer.flush(), 0)
+        [events] = using.return_value.bulk_create.call_args.args
+        self.assertEqual([(event.action, event.member_id) for event in events], [('member.deleted', 1)])
+
+
+class MembersCountTests(TestCase):
+    """ The denormalised `Team.members_count` follows the members joining and leaving the team. """
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create(email='owner@example.com')
+        (self.alpha, self.beta), _ = create_fixture(self.user, {'Alpha': [], 'Beta': []})
+
+    def counts(self) -> list[int]:
+        return list(self.user.teams.order_by('id').values_list('members_count', flat=True))
+
+    def test_created_member_is_counted(self):
+        self.user.members.create(email='bob@example.com', team=self.alpha)
+        self.user.members.create(email='al@example.com')
+
+        self.assertEqual(self.counts(), [1, 0])
+
+    def test_reassigned_member_moves_between_teams(self):
+        member = self.user.members.create(email='bob@example.com', team=self.alpha)
+
+        member.team = self.beta
+        member.save()
+        self.assertEqual(self.counts(), [0, 1])
+
+        member = self.user.members.get()
+        member.team = None
+        member.save(update_fields=['team'])
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_deleted_member_is_uncounted(self):
+        member = self.user.members.create(email='bob@example.com', team=self.alpha)
+
+        member.delete()
+
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_members_of_a_deleted_team_are_released(self):
+        self.user.members.create(email='bob@example.com', team=self.alpha)
+
+        self.user.teams.get(pk=self.alpha.pk).delete()
+        member = self.user.members.get()
+        self.assertIsNone(member.team_id)
+
+        member.team = self.beta
+        member.save()
+        self.assertEqual(self.counts(), [1])
+
+    def test_drifted_counter_does_not_go_below_zero(self):
+        member = self.user.members.create(email='bob@example.com', team=self.alpha)
+        self.user.teams.filter(pk=self.alpha.pk).update(members_count=0)
+
+        member.delete()
+
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_reconcile_fixes_drifted_counters(self):
+        self.user.members.create(email='bob@example.com', team=self.alpha)
+        self.user.members.create(email='al@example.com', team=self.alpha)
+        self.user.teams.filter(pk=self.alpha.pk).update(members_count=0)
+        self.user.teams.filter(pk=self.beta.pk).update(members_count=5)
+
+        stderr = io.StringIO()
+        call_command('reconcile_members_count', batch_size=1, stderr=stderr)
+
+        self.assertEqual(self.counts(), [2, 0])
+        self.assertIn('Fixed members_count of 2 team(s).', stderr.getvalue())
+
+
+class IdempotencyKeyTests(TestCase):
+    """ Retries carrying the same Idempotency-Key get the first response without running the write again. """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create_team(self, name: str, key: str):
+        return self.client.post(reverse('team_create'), {'name': name}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.create_team('Alpha', 'key-1')
+        retry = self.create_team('Alpha', 'key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.user.teams.count(), 1)
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        self.client.post(reverse('team_create'), {'name': 'Alpha'})
+        response = self.client.post(reverse('team_create'), {'name': 'Alpha'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        self.create_team('Alpha', 'key-1')
+        response = self.create_team('Beta', 'key-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.user.teams.count(), 1)
+
+    def test_concurrent_request_is_told_to_retry(self):
+        self.create_team('Alpha', 'key-1')
+        self.user.idempotency_keys.update(status=IdempotencyKey.STATUS_IN_PROGRESS)
+
+        response = self.create_team('Alpha', 'key-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], str(settings.IDEMPOTENCY_RETRY_AFTER))
+        self.assertEqual(self.user.teams.count(), 1)
+
+    def test_response_is_stored_in_the_transaction_of_the_write(self):
+        save = IdempotencyKey.save
+        failures = [DatabaseError('database is locked')]
+
+        def fail_once(record, *args, **kwargs):
+            if kwargs.get('update_fields') and failures:
+                raise failures.pop()
+            return save(record, *args, **kwargs)
+
+        with mock.patch.object(IdempotencyKey, 'save', fail_once):
+            response = self.create_team('Alpha', 'key-1')
+
+        # The team of the failed attempt was rolled back with its response, the retry created it again.
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.user.teams.count(), 1)
+        self.assertEqual(self.user.idempotency_keys.get().status, IdempotencyKey.STATUS_DONE)
+
+    def test_expired_key_runs_the_request_again(self):
+        self.create_team('Alpha', 'key-1')
+        self.user.idempotency_keys.update(expires_at=timezone.now())
+
+        response = self.create_team('Alpha', 'key-1')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+
+class ChangeFeedTests(TestCase):
+    """ The change feed pages through the changes after `since`, reporting every object once in its latest state. """
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create(email='owner@example.com')
+        self.client.force_login(self.user)
+
+    def feed(self, **params) -> dict:
+        response = self.client.get(reverse('change_feed'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_follow_the_next_token(self):
+        team = self.user.teams.create(name='Alpha')
+        bob = self.user.members.create(email='bob@example.com', first_name='Bob', team=team)
+        al = self.user.members.create(email='al@example.com', first_name='Al')
+        team.name = 'Renamed'
+        team.save()
+        al_pk = al.pk
+        al.delete()
+
+        pages, since = [], 0
+        while True:
+            page = self.feed(since=since, limit=2)
+            pages.append([(change['type'], change['id'], change['deleted']) for change in page['changes']])
+            since = page['next']
+            if not page['has_more']:
+                break
+
+        # Changes: team created, bob created, al created, team renamed, al deleted. Al is already gone on page 2.
+        self.assertEqual(pages, [
+            [('team', team.pk, False), ('member', bob.pk, False)],
+            [('member', al_pk, True), ('team', team.pk, False)],
+            [('member', al_pk, True)],
+        ])
+        self.assertEqual(since, Change.objects.for_owner(self.user.pk).latest('seq').seq)
+        last = self.feed(since=since)
+        self.assertEqual((last['next'], last['has_more'], last['changes']), (since, False, []))
+
+    def test_changes_are_reported_once_in_their_latest_state(self):
+        team = self.user.teams.create(name='Alpha')
+        team.name = 'Renamed'
+        team.save()
+
+        page = self.feed()
+
+        self.assertEqual(page['has_more'], False)
+        self.assertEqual(len(page['changes']), 1)
+        self.assertEqual(page['changes'][0]['data'], {'id': team.pk, 'name': 'Renamed'})
+        self.assertEqual(page['next'], page['changes'][0]['seq'])
+
+    def test_other_users_changes_are_not_listed(self):
+        User.objects.create(email='other@example.com').teams.create(name='Foreign')
+
+        page = self.feed()
+
+        self.assertEqual((page['next'], page['has_more'], page['changes']), (0, False, []))
+
+    def test_token_from_before_a_move_is_gone(self):
+        team = self.user.teams.create(name='Alpha')
+        token = self.feed()['next']
+        shard = shard_for_owner(self.user.pk)
+        rebalance_shards.Command().mark_moved(self.user.pk, shard, shard)
+
+        response = self.client.get(reverse('change_feed'), {'since': token})
+        self.assertEqual((response.status_code, response.data['next']), (410, 0))
+
+        page = self.feed(since=response.data['next'])
+        self.assertEqual([(change['type'], change['id']) for change in page['changes']], [('team', team.pk)])
+        self.assertEqual(self.feed(since=page['next'])['changes'], [])
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get(reverse('change_feed'), {'since': -1})
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(STATS_TOP_SIZE=2)
+class StatsTests(TestCase):
+    """ The stats endpoint aggregates the user's teams and members, cached until their data changes. """
+
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='owner@example.com')
+        self.client.force_login(self.user)
+        (self.alpha, self.beta, self.gamma), _ = create_fixture(
+            self.user,
+            {'Alpha': [{'email': 'a@one.io'}, {'email': 'b@one.io'}], 'Beta': [{'email': 'c@two.io'}], 'Gamma': []},
+            [{'email': 'd@one.io'}, {'email': 'e@three.io'}],
+        )
+        create_fixture(User.objects.create(email='other@example.com'), {'Foreign': [{'email': 'x@one.io'}]})
+
+    def test_stats_payload(self):
+        response = self.client.get(reverse('stats'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'teams_count': 3,
+            'members_count': 5,
+            'unassigned_members_count': 2,
+            'members_per_team': [{'size': 0, 'teams': 1}, {'size': 1, 'teams': 1}, {'size': 2, 'teams': 1}],
+            'largest_teams': [
+                {'id': self.alpha.pk, 'name': 'Alpha', 'members_count': 2},
+                {'id': self.beta.pk, 'name': 'Beta', 'members_count': 1},
+            ],
+            'email_domains': [{'domain': 'one.io', 'members': 3}, {'domain': 'three.io', 'members': 1}],
+        })
+
+    def test_cached_stats_follow_writes(self):
+        with mock.patch.object(stats, 'compute_stats', wraps=stats.compute_stats) as compute_stats:
+            first = self.client.get(reverse('stats')).data
+            cached = self.client.get(reverse('stats')).data
+            self.user.teams.create(name='Delta')
+            updated = self.client.get(reverse('stats')).data
+
+        self.assertEqual([first['teams_count'], cached['teams_count'], updated['teams_count']], [3, 3, 4])
+        self.assertEqual(compute_stats.call_count, 2)
+
+
+class RelayBackend:
+    """ Events backend relaying the events between the broadcasters of the test, as Redis does between processes. """
+
+    listening: list = []
+
+    def __init__(self, broadcaster: broadcast.Broadcaster) -> None:
+        self.broadcaster = broadcaster
+        self.listening.append(broadcaster)
+
+    def publish(self, user_id: int, event: dict) -> None:
+        for broadcaster in self.listening:
+            broadcaster.deliver(user_id, event)
+
+
+class EventBroadcastTests(TestCase):
+    """ Published events reach the streaming connections of their user, also across a lost Redis subscription. """
+
+    def test_published_event_is_delivered_to_the_users_connections(self):
+        async def scenario():
+            subscription = broadcaster.subscribe(1)
+            other = broadcaster.subscribe(2)
+            try:
+                broadcast.publish(1, 'team.created', {'id': 3, 'name': 'Alpha'})
+                return await subscription.get(timeout=1), await other.get(timeout=0.1)
+            finally:
+                broadcaster.unsubscribe(subscription)
+                broadcaster.unsubscribe(other)
+
+        broadcaster = broadcast.Broadcaster()
+        with mock.patch.object(broadcast, '_backend', broadcast.LocalBackend(broadcaster)):
+            delivered, not_delivered = asyncio.run(scenario())
+
+        self.assertEqual(delivered, {'type': 'team.created', 'data': {'id': 3, 'name': 'Alpha'}})
+        self.assertIsNone(not_delivered)
+
+    @override_settings(EVENTS_BACKEND='teams_app.tests.RelayBackend')
+    def test_process_that_never_published_receives_the_events_of_the_others(self):
+        async def scenario():
+            subscription = broadcast.broadcaster.subscribe(1)
+            try:
+                # Published by another process, through its own backend.
+                RelayBackend(broadcast.Broadcaster()).publish(1, {'type': 'team.created', 'data': {'id': 3}})
+                return await subscription.get(timeout=1)
+            finally:
+                broadcast.broadcaster.unsubscribe(subscription)
+
+        with mock.patch.object(broadcast, 'broadcaster', broadcast.Broadcaster()):
+            with mock.patch.object(broadcast, '_backend', None), mock.patch.object(RelayBackend, 'listening', []):
+                delivered = asyncio.run(scenario())
+
+        self.assertEqual(delivered, {'type': 'team.created', 'data': {'id': 3}})
+
+    @override_settings(EVENTS_REDIS_RECONNECT_BACKOFF=0.5, EVENTS_REDIS_RECONNECT_BACKOFF_MAX=30)
+    def test_lost_redis_subscription_is_made_again_with_backoff(self):
+        class Stop(BaseException):
+            """ Ends the listening loop of the test. """
+
+        message = {'channel': b'teams_app:events:7', 'data': json.dumps({'type': 'team.deleted', 'data': {'id': 1}})}
+        # What each new subscription does: fail to subscribe, or deliver messages and fail.
+        scripts = iter([
+            ConnectionError('refused'), ConnectionError('refused'), [message, ConnectionError('reset')], [Stop()],
+        ])
+
+        def pubsub(**kwargs):
+            script = next(scripts)
+            subscription = mock.Mock()
+            if isinstance(script, Exception):
+                subscription.psubscribe.side_effect = script
+            else:
+                subscription.listen.side_effect = lambda: replay(script)
+            return subscription
+
+        def replay(script):
+            for step in script:
+                if isinstance(step, BaseException):
+                    raise step
+                yield step
+
+        backend = broadcast.RedisBackend.__new__(broadcast.RedisBackend)
+        backend.broadcaster = mock.Mock(spec=broadcast.Broadcaster)
+        backend.client = mock.Mock(pubsub=pubsub)
+        with mock.patch.object(broadcast.time, 'sleep') as sleep, self.assertLogs(broadcast.logger, 'INFO') as logs:
+            with self.assertRaises(Stop):
+                backend._listen()
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 1.0, 0.5])
+        backend.broadcaster.deliver.assert_called_once_with(7, {'type': 'team.deleted', 'data': {'id': 1}})
+        resync = mock.call({'type': 'resync', 'data': {}})
+        self.assertEqual(backend.broadcaster.deliver_to_all.call_args_list, [resync, resync])
+        self.assertEqual(sum('reconnecting' in line for line in logs.output), 3)
+
+
+class CoalescingTests(TestCase):
+    """ Identical reads share one computation and never outlive the user's last write. """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com')
+        cls.team = Team.objects.create(name='Alpha', owner=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.user)
+
+    def test_concurrent_calls_share_one_computation(self):
+        flight = coalescing.SingleFlight()
+        calls = []
+        started, release = threading.Event(), threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'value'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('key', compute)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('key', compute))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 4)
+
+    def test_identical_requests_reuse_the_response_until_a_write(self):
+        url = reverse('team_detail', kwargs={'pk': self.team.pk})
+        first = self.client.get(url)
+        with contextlib.ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in settings.DATABASES]
+            second = self.client.get(url)
+        queries = [query['sql'] for context in captured for query in context.captured_queries]
+        self.client.post(reverse('member_create'), {'email': 'bob@example.com', 'full_name': 'Bob'})
+        self.client.post(reverse('add_member', kwargs={
+            'team_pk': self.team.pk, 'member_pk': self.user.members.get().pk,
+        }))
+        third = self.client.get(url)
+
+        self.assertEqual(second.json(), first.json())
+        self.assertFalse([sql for sql in queries if 'teams_app_team' in sql])
+        self.assertEqual((first.json()['members_count'], third.json()['members_count']), (0, 1))
+
+    def test_expired_entry_is_refreshed_by_one_caller(self):
+        coalescing._store('key', 'stale', timeout=0)
+
+        cache.add(coalescing._lock_key('key'), 1)
+        self.assertEqual(coalescing.coalesce('key', lambda: 'fresh', timeout=60), 'stale')
+        cache.delete(coalescing._lock_key('key'))
+        self.assertEqual(coalescing.coalesce('key', lambda: 'fresh', timeout=60), 'fresh')
+        self.assertEqual(coalescing.coalesce('key', lambda: 'newer', timeout=60), 'fresh')
+
+
+class AccessLogTests(TestCase):
+    """ Requests are logged as JSON lines by a background thread, without ever blocking on a full queue. """
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'access.log')
+
+    def read_records(self):
+        with open(self.path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_request_is_logged(self):
+        user = User.objects.create(email='owner@example.com')
+        team = Team.objects.create(name='Alpha', owner=user)
+        self.client.force_login(user)
+        with override_settings(ACCESS_LOG=self.path):
+            self.client.get(reverse('team_detail', kwargs={'pk': team.pk}))
+            access_log.get_writer(self.path).close()
+
+        [record] = self.read_records()
+        self.assertEqual(
+            {key: record[key] for key in ('method', 'url_name', 'status', 'user_id')},
+            {'method': 'GET', 'url_name': 'team_detail', 'status': 200, 'user_id': user.pk},
+        )
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['latency_ms'], 0)
+
+    def test_full_queue_drops_and_counts_records(self):
+        writer = access_log.AccessLogWriter(self.path)
+        writer._queue, writer._pid = queue.Queue(maxsize=1), os.getpid()
+        for index in range(3):
+            writer.put({'time': time.time(), 'index': index})
+        writer._thread = threading.Thread(target=writer._run, args=(writer._queue,))
+        writer._thread.start()
+        writer.close()
+
+        self.assertEqual(writer.dropped, 2)
+        self.assertEqual(
+            [record.get('index', record.get('event')) for record in self.read_records()],
+            [0, 'access_log.dropped'],
+        )
+        self.assertEqual(self.read_records()[1]['count'], 2)
+
+
+class AdmissionControlTests(TestCase):
+    """ Requests over the limits of the worker or of their endpoint class get a fast 503, reads keep priority. """
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.controller = self.enterContext(mock.patch.object(admission, 'controller', admission.AdmissionController()))
+        self.user = User.objects.create(email='owner@example.com')
+        self.client.force_login(self.user)
+
+    def occupy(self, endpoint_class, count=1):
+        for _ in range(count):
+            self.assertIsNone(self.controller.acquire(endpoint_class))
+            self.addCleanup(self.controller.release, endpoint_class)
+
+    def create_member(self):
+        return self.client.post(reverse('member_create'), {'full_name': 'Jane Doe', 'email': 'jane@example.com'})
+
+    @override_settings(ADMISSION_CLASS_LIMITS={'auth': 1, 'writes': 1, 'reads': 10})
+    def test_write_under_the_limits_is_served(self):
+        response = self.create_member()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self.user.members.filter(email='jane@example.com').exists())
+        self.assertEqual(self.controller.metrics(), {'in_flight': {'writes': 0}, 'admitted': {'writes': 1}, 'shed': {}})
+
+    @override_settings(ADMISSION_CLASS_LIMITS={'auth': 1, 'writes': 1, 'reads': 10})
+    def test_class_limit_sheds_writes_and_keeps_reads(self):
+        self.occupy('writes')
+
+        response = self.create_member()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.ADMISSION_RETRY_AFTER))
+        self.assertFalse(Member.objects.exists())
+        self.assertEqual(self.client.get(reverse('member_list')).status_code, 200)
+        self.assertEqual(self.controller.metrics()['shed'], {'writes/class_limit': 1})
+
+    @override_settings(ADMISSION_MAX_CONCURRENCY=4, ADMISSION_READ_RESERVE=2)
+    def test_reserved_slots_are_kept_for_reads(self):
+        self.occupy('reads', 2)
+
+        self.assertEqual(self.create_member().status_code, 503)
+        self.assertEqual(self.client.get(reverse('member_list')).status_code, 200)
+        self.occupy('reads', 2)
+        self.assertEqual(self.client.get(reverse('member_list')).status_code, 503)
+        self.assertEqual(
+            self.controller.metrics()['shed'], {'reads/concurrency': 1, 'writes/concurrency': 1},
+        )
+
+    def test_requests_queued_past_the_deadline_are_shed(self):
+        queued_at = time.time() - settings.ADMISSION_QUEUE_TIMEOUT - 1
+        late = self.client.get(reverse('member_list'), HTTP_X_REQUEST_START=f't={queued_at:.3f}')
+        recent = self.client.get(reverse('member_list'), HTTP_X_REQUEST_START=str(int(time.time() * 1000)))
+
+        self.assertEqual((late.status_code, recent.status_code), (503, 200))
+        self.assertEqual(self.controller.metrics()['shed'], {'reads/deadline': 1})
+        self.assertEqual(self.controller.in_flight['reads'], 0)
+
+
+class ServerConfigTests(unittest.TestCase):
+    """ The gunicorn settings follow the environment. """
+
+    path = os.path.join(settings.BASE_DIR, 'base', 'gunicorn.conf.py')
+    variables = ('SERVER_MODE', 'WEB_CONCURRENCY', 'GUNICORN_THREADS', 'GUNICORN_PRELOAD', 'GUNICORN_TIMEOUT')
+
+    def load(self, **environ) -> dict:
+        with mock.patch.dict(os.environ, environ):
+            for name in set(self.variables) - set(environ):
+                os.environ.pop(name, None)
+            return runpy.run_path(self.path)
+
+    def test_threaded_wsgi_workers_by_default(self):
+        config = self.load()
+
+        self.assertEqual(
+            (config['wsgi_app'], config['worker_class'], config['threads'], config['preload_app'], config['timeout']),
+            ('base.wsgi:application', 'gthread', 4, False, 30),
+        )
+        self.assertEqual(config['workers'], os.cpu_count() * 2 + 1)
+
+    def test_asgi_mode_and_overrides(self):
+        config = self.load(SERVER_MODE='asgi', WEB_CONCURRENCY='3', GUNICORN_PRELOAD='true', GUNICORN_TIMEOUT='60')
+
+        self.assertEqual(
+            (config['wsgi_app'], config['worker_class'], config['workers'], config['preload_app'], config['timeout']),
+            ('base.asgi:application', 'uvicorn_worker.UvicornWorker', 3, True, 60),
+        )
+        self.assertNotIn('threads', config)
+
+
+@unittest.skipUnless(shutil.which('sha256sum'), 'The entrypoint requires sha256sum.')
+class EntrypointTests(unittest.TestCase):
+    """ The entrypoint prepares the release only when its inputs changed, then hands over to gunicorn. """
+
+    def setUp(self):
+        self.project = self.enterContext(tempfile.TemporaryDirectory())
+        os.makedirs(os.path.join(self.project, 'base', 'docker'))
+        shutil.copy(os.path.join(settings.BASE_DIR, 'base', 'docker', 'entrypoint.sh'), self.docker_path())
+        self.write('app/migrations/0001_initial.py', 'operations = []\n')
+        self.write('app/static/app.css', 'body {}\n')
+        # Records the commands instead of running them.
+        self.log = os.path.join(self.project, 'commands.log')
+        for command in ('python', 'pip', 'gunicorn'):
+            self.write(f'bin/{command}', f'#!/bin/sh\necho "{command} $*" >> "{self.log}"\n', mode=0o755)
+
+    def docker_path(self) -> str:
+        return os.path.join(self.project, 'base', 'docker', 'entrypoint.sh')
+
+    def write(self, name: str, content: str, mode: int = 0o644) -> None:
+        path = os.path.join(self.project, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+        os.chmod(path, mode)
+
+    def run_entrypoint(self) -> list[str]:
+        if os.path.exists(self.log):
+            os.remove(self.log)
+        environ = {**os.environ, 'PATH': f'{os.path.join(self.project, "bin")}:{os.environ["PATH"]}'}
+        environ.pop('FORCE_SETUP', None)
+        subprocess.run(['sh', self.docker_path()], env=environ, check=True, capture_output=True)
+        with open(self.log) as file:
+            return [line.strip().removeprefix('python manage.py ') for line in file]
+
+    def test_release_steps_only_run_when_their_inputs_changed(self):
+        first = self.run_entrypoint()
+        second = self.run_entrypoint()
+        self.write('app/migrations/0002_more.py', 'operations = []\n')
+        third = self.run_entrypoint()
+
+        serve = ['create_admin', 'gunicorn --config base/gunicorn.conf.py']
+        self.assertEqual(
+            first,
+            ['pip freeze', 'collectstatic --noinput', 'migrate_shards --noinput', 'generate_openapi_schema', *serve],
+        )
+        self.assertEqual(second, ['pip freeze', *serve])
+        # A new migration is also new source code.
+        self.assertEqual(third, ['pip freeze', 'migrate_shards --noinput', 'generate_openapi_schema', *serve])
+
+
+# How much slower than `STARTUP_IMPORT_BUDGET` the test machine may import the app.
+STARTUP_BUDGET_TOLERANCE = 2
+
+
+class StartupTests(TestCase):
+    """ Workers start within the import budget and are warmed up before their first request. """
+
+    databases = '__all__'
+
+    def test_profile_reports_the_app_imports(self):
+        seconds, imports = startup.profile_imports()
+
+        self.assertIn('teams_app.views', [item.module for item in imports])
+        self.assertGreater(seconds, 0)
+
+    def test_startup_stays_within_the_budget(self):
+        # Wall-clock time: the best of a few runs, with room for a slower or busier machine than the budget's.
+        seconds = min(startup.profile_imports()[0] for _ in range(3))
+
+        self.assertLess(
+            seconds, settings.STARTUP_IMPORT_BUDGET * STARTUP_BUDGET_TOLERANCE, 'see `manage.py profile_startup`',
+        )
+
+    def test_drf_yasg_is_not_imported_without_the_docs(self):
+        _, imports = startup.profile_imports(env={'API_DOCS_ENABLED': 'false'})
+
+        modules = [item.module for item in imports]
+        self.assertIn('teams_app.views', modules)
+        self.assertFalse([module for module in modules if module.startswith('drf_yasg')])
+
+    def test_warm_up_builds_the_view_serializers(self):
+        summary = startup.warm_up()
+
+        self.assertGreater(summary['views'], 20)
+        self.assertGreaterEqual(summary['serializers'], 10)
+        self.assertEqual(summary['databases'], len(settings.DATABASES))
+
+    def test_warmed_up_connections_stay_open(self):
+        opened = {}
+
+        def warm_up():
+            startup.warm_up()
+            opened.update({alias: connections[alias].connection is not None for alias in settings.DATABASES})
+            connections.close_all()
+
+        thread = threading.Thread(target=warm_up)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(opened, {alias: True for alias in settings.DATABASES})
+
+    def test_every_thread_of_the_pool_opens_its_connections(self):
+        threads = set()
+
+        def open_connections():
+            threads.add(threading.get_ident())
+            connections.close_all()
+
+        with ThreadPoolExecutor(3) as pool, mock.patch.object(startup, 'open_connections', open_connections):
+            startup.open_connections_in(pool, 3)
+
+        self.assertEqual(len(threads), 3)
+
+
+class FastReadSerializerTests(TestCase):
+    """ The `values()` based read serializers must produce exactly the output of the model serializers. """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@example.com')
+        create_fixture(
+            cls.user,
+            {
+                'Big': [{'email': f'big{index}@example.com', 'first_name': f'Big {index}', 'last_name': 'Member'}
+                        for index in range(settings.TEAM_MEMBERS_PREVIEW_SIZE + 2)],
+                'Small': [{'email': 'small@example.com', 'first_name': 'Small'}],
+                'Empty': [],
+            },
+            [{'email': 'nameless@example.com'}, {'email': 'spaced@example.com', 'first_name': '', 'last_name': 'Only'}],
+        )
+        create_fixture(User.objects.create(email='other@example.com'), {'Big': [{'email': 'foreign@example.com'}]})
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.request = APIRequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_member_output_matches_member_serializer(self):
+        queryset = self.user.members.order_by('id')
+
+        expected = MemberSerializer(queryset, many=True).data
+        actual = MemberReadSerializer().serialize(MemberReadSerializer.values(queryset))
+
+        self.assertEqual(json.dumps(actual), json.dumps(expected))
+
+    def test_team_output_matches_team_serializer(self):
+        queryset = self.user.teams.order_by('id')
+        context = {'request': self.request}
+
+        expected = TeamSerializer(TeamSerializer.setup_eager_loading(queryset), many=True, context=context).data
+        actual = TeamReadSerializer(context=context).serialize(TeamReadSerializer.values(queryset))
+
+        self.assertEqual(json.dumps(actual), json.dumps(expected))
+
+    def test_list_views_serve_the_fast_output(self):
+        self.client.force_login(self.user)
+        cases = [
+            ('member_list', MemberSerializer, self.user.members.order_by('id')[:settings.PAGINATION_PAGE_SIZE]),
+            ('team_list', TeamSerializer, TeamSerializer.setup_eager_loading(self.user.teams.order_by('id'))),
+        ]
+        for url_name, serializer_class, queryset in cases:
+            with self.subTest(url_name=url_name):
+                response = self.client.get(reverse(url_name), {'ordering': 'id'})
+                request = response.wsgi_request
+                expected = serializer_class(queryset, many=True, context={'request': request}).data
+
+                self.assertEqual(json.dumps(response.json()['data']), json.dumps(expected))
+
+
+@unittest.skipUnless(len(settings.SHARD_DATABASES) >= 2, 'Run with SHARD_DATABASES=shard_0,shard_1 to test sharding.')
+class OwnerShardingTests(TestCase):
+    """ Teams and members live on the shard of their owner and stay reachable through the owner. """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create(email=f'user{index}@example.com') for index in range(20)]
+        cls.owners = {}
+        for user in users:
+            cls.owners.setdefault(shard_for_owner(user.pk), user)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def create_data(self, owner):
+        (team,), _ = create_fixture(owner, {'Alpha': [{'email': 'bob@example.com'}]}, [{'email': 'al@example.com'}])
+        return team
+
+    def test_rows_are_stored_on_the_owner_shard(self):
+        self.assertEqual(len(self.owners), len(settings.SHARD_DATABASES))
+        for shard, owner in self.owners.items():
+            with self.subTest(shard=shard):
+                team = self.create_data(owner)
+
+                self.assertEqual(team._state.db, shard)
+                self.assertEqual(list(owner.teams.values_list('name', 'members_count')), [('Alpha', 1)])
+                self.assertEqual(owner.members.count(), 2)
+                self.assertEqual(Change.objects.for_owner(owner.pk).count(), 3)
+                for database in set(all_databases()) - {shard}:
+                    self.assertFalse(Team.objects.using(database).filter(owner_id=owner.pk).exists())
+
+    def test_api_reads_and_writes_the_owner_shard(self):
+        shard, owner = next(iter(self.owners.items()))
+        self.client.force_login(owner)
+
+        self.client.post(reverse('team_create'), {'name': 'Beta'})
+        response = self.client.get(reverse('team_list'))
+
+        self.assertEqual([team['name'] for team in response.json()['data']], ['Beta'])
+        self.assertTrue(Team.objects.using(shard).filter(owner=owner, name='Beta').exists())
+
+    def test_deleting_the_owner_deletes_the_shard_rows(self):
+        for shard, owner in self.owners.items():
+            self.create_data(owner)
+            owner.delete()
+
+            self.assertFalse(Team.objects.using(shard).filter(owner_id=owner.pk).exists())
+            self.assertFalse(Member.objects.using(shard).filter(user_id=owner.pk).exists())
+
+    def test_rebalance_moves_owners_to_their_new_shard(self):
+        tokens = {}
+        for owner in self.owners.values():
+            team = self.create_data(owner)
+            AuditEvent.objects.create(
+                owner_id=owner.pk, action='team.created', team_id=team.pk, created_at=timezone.now(),
+            )
+            tokens[owner.pk] = Change.objects.for_owner(owner.pk).latest('seq').seq
+        target, *removed = settings.SHARD_DATABASES
+
+        with override_settings(SHARD_DATABASES=[target]):
+            call_command(
+                'rebalance_shards', *[f'--source={shard}' for shard in removed],
+                stdout=io.StringIO(), stderr=io.StringIO(),
+            )
+
+            for owner in self.owners.values():
+                self.assertEqual(list(owner.teams.values_list('name', 'members_count')), [('Alpha', 1)])
+                self.assertEqual(owner.members.filter(team__isnull=False).get().team.owner_id, owner.pk)
+                self.assertEqual(AuditEvent.objects.for_owner(owner.pk).get().team_id, owner.teams.get().pk)
+
+            # The feed tokens of the moved owners are answered with a resync, the others stay valid.
+            for shard, owner in self.owners.items():
+                self.client.force_login(owner)
+                response = self.client.get(reverse('change_feed'), {'since': tokens[owner.pk]})
+                self.assertEqual(response.status_code, 200 if shard == target else 410)
+                response = self.client.get(reverse('change_feed'), {'since': 0})
+                self.assertEqual(len(response.data['changes']), 3)
+        for database in removed:
+            self.assertFalse(Team.objects.using(database).exists())
+            self.assertFalse(Member.objects.using(database).exists())
+
+
+@unittest.skipUnless(
+    settings.DATABASE_REPLICAS and connection.vendor == 'sqlite',
+    'Run with REPLICA_DATABASES=default to test replica reads.',
+)
+class ReplicaReadTests(TransactionTestCase):
+    """ Read-only views are served by the replica, except for clients that just wrote. """
+
+    databases = '__all__'
+
+    def setUp(self):
+        # The transactions are committed for real, keep the audit events out of the shared writer.
+        self.enterContext(mock.patch.object(audit, '_writer', dormant_audit_writer()))
+        self.user = User.objects.create(email='owner@example.com')
+        self.primary = shard_for_owner(self.user.pk)
+        if self.primary not in settings.DATABASE_REPLICAS:
+            self.skipTest(f'Database "{self.primary}" has no replica.')
+        self.replica = settings.DATABASE_REPLICAS[self.primary][0]
+        self.team = Team.objects.create(name='Replicated', owner=self.user)
+        self.copy_to_replica()
+        self.user.teams.filter(pk=self.team.pk).update(name='Primary')
+        self.client.force_login(self.user)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        replicas._down_until.clear()
+        self.addCleanup(replicas._down_until.clear)
+
+    def copy_to_replica(self):
+        for alias in (self.primary, self.replica):
+            connections[alias].ensure_connection()
+        connections[self.primary].connection.backup(connections[self.replica].connection)
+
+    def team_names(self):
+        response = self.client.get(reverse('team_list'))
+        self.assertEqual(response.status_code, 200)
+        return [team['name'] for team in response.json()['data']]
+
+    def test_reads_are_served_by_the_replica(self):
+        self.assertEqual(self.team_names(), ['Replicated'])
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.client.post(reverse('team_create'), {'name': 'New'})
+
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertCountEqual(self.team_names(), ['Primary', 'New'])
+
+    def test_replica_failure_falls_back_to_the_primary(self):
+        with connections[self.replica].cursor() as cursor:
+            cursor.execute('DROP TABLE teams_app_team')
+
+        self.assertEqual(self.team_names(), ['Primary'])
+        self.assertEqual(self.team_names(), ['Primary'])
@@ -1,11 +1,14 @@
 from django.urls import path, include
 
-from teams_app import views
+from teams_app import streams, views
 
 
 teams_crud = [
     path('', views.TeamListAPIView.as_view(), name="team_list"),
     path('<int:pk>/', views.TeamDetailAPIView.as_view(), name="team_detail"),
+    path('batch/', views.TeamBatchAPIView.as_view(), name="team_batch"),
+    path('<int:pk>/members/', views.TeamMembersAPIView.as_view(), name="team_members"),
+    path('<int:pk>/audit/', views.TeamAuditAPIView.as_view(), name="team_audit"),
     path('create/', views.TeamCreateAPIView.as_view(), name="team_create"),
     path('update/<int:pk>/', views.TeamUpdateAPIView.as_view(), name="team_update"),
     path('delete/<int:pk>/', views.TeamDeleteAPIView.as_view(), name="team_delete"),
@@ -14,8 +17,13 @@ teams_crud = [
 members_crud = [
     path('', views.MemberListAPIView.as_view(), name="member_list"),
     path('<int:pk>/', views.MemberDetailAPIView.as_view(), name="member_detail"),
+    path('batch/', views.MemberBatchAPIView.as_view(), name="member_batch"),
+    path('<int:pk>/audit/', views.MemberAuditAPIView.as_view(), name="member_audit"),
     path('create/', views.MemberCreateAPIView.as_view(), name="member_create"),
     path('update/<int:pk>/', views.MemberUpdateAPIView.as_view(), name="member_update"),
+    path('bulk-update/', views.MemberBulkUpdateAPIView.as_view(), name="member_bulk_update"),
+    path('export/', views.MemberExportAPIView.as_view(), name="member_export"),
+    path('import/', views.MemberImportAPIView.as_view(), name="member_import"),
     path('delete/<int:pk>/', views.MemberDeleteAPIView.as_view(), name="member_delete"),
 ]
 
@@ -37,4 +45,13 @@ members = [
     ]))
 ]
 
-urlpatterns = [] + teams + members
+stats = [
+    path('stats/', views.StatsAPIView.as_view(), name="stats"),
+]
+
+sync = [
+    path('changes/', views.ChangeFeedAPIView.as_view(), name="change_feed"),
+    path('events/', streams.EventStreamView.as_view(), name="event_stream"),
+]
+
+urlpatterns = [] + teams + members + stats + sync
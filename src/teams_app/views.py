@@ -1,4 +1,5 @@
 from django.db import DatabaseError
+from django.shortcuts import get_object_or_404
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView, DestroyAPIView, GenericAPIView
 from rest_framework.views import APIView
@@ -6,12 +7,21 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework import status, permissions, filters, mixins
 from django.conf import settings
-
-from base.mixins import ListMixin
-from .models import Team, Member
+from django_filters.rest_framework import DjangoFilterBackend
+
+from base.mixins import CoalescedReadMixin, ListMixin, MultiGetMixin
+from jobs.queue import enqueue
+from jobs.views import job_accepted_response
+from .bulk import bulk_update_members
+from .filters import MemberFilterSet, TeamFilterSet
+from .idempotency import idempotent
+from .models import AuditEvent, Change, Team, Member
 from .serializers import TeamSerializer, TeamCreateSerializer, MemberCreateSerializer, MemberSerializer, \
-    MemberUpdateSerializer, TeamUpdateSerializer
+    MemberUpdateSerializer, TeamUpdateSerializer, ChangeFeedInputSerializer, ChangeTeamSerializer, MemberReadSerializer, \
+    TeamReadSerializer, AuditEventSerializer, MemberImportSerializer
 from base.exception_handlers import RetryExceptionHandlerMixin
+from .signals import publish_on_commit
+from .stats import data_version, get_stats
 
 from retrying import retry
 
@@ -32,6 +42,7 @@ class TeamCreateAPIView(RetryExceptionHandlerMixin, CreateAPIView):
         wait_fixed=settings.RETRY_WAIT_FIXED,
         retry_on_exception=lambda ex: isinstance(ex, DatabaseError),
     )
+    @idempotent
     def create(self, request: Request, *args, **kwargs) -> Response:
         """ Create a new team """
         serializer = self.get_serializer(data=request.data)
@@ -45,11 +56,15 @@ class TeamCreateAPIView(RetryExceptionHandlerMixin, CreateAPIView):
         return Response({'message': f'Team {serializer.data.get("name")} created'}, status=status.HTTP_201_CREATED)
 
 
-class TeamListAPIView(ListMixin, ListAPIView):
+class TeamListAPIView(CoalescedReadMixin, ListMixin, ListAPIView):
     """ List all teams """
 
+    replica_reads = True
+    data_version = staticmethod(data_version)
     serializer_class = TeamSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    read_serializer_class = TeamReadSerializer
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_class = TeamFilterSet
     search_fields = ['name']
     ordering_fields = '__all__'
     allowed_methods = ['GET']
@@ -60,15 +75,48 @@ class TeamListAPIView(ListMixin, ListAPIView):
         return super().list(request, *args, **kwargs)
 
 
-class TeamDetailAPIView(RetrieveAPIView):
+class TeamDetailAPIView(CoalescedReadMixin, RetrieveAPIView):
     """ Get details of a team """
+    replica_reads = True
+    data_version = staticmethod(data_version)
     serializer_class = TeamSerializer
     lookup_field = 'pk'
     allowed_methods = ['GET']
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self) -> list[Team]:
-        queryset = self.request.user.teams.all().prefetch_related('members')
+        queryset = TeamSerializer.setup_eager_loading(self.request.user.teams.all())
+        self.queryset = queryset
+        return queryset
+
+
+class TeamBatchAPIView(CoalescedReadMixin, MultiGetMixin, GenericAPIView):
+    """ Get details of several teams, e.g. `?ids=1,2,3` """
+
+    replica_reads = True
+    data_version = staticmethod(data_version)
+    serializer_class = TeamSerializer
+    read_serializer_class = TeamReadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['GET']
+
+    def get_queryset(self) -> list[Team]:
+        queryset = self.request.user.teams.all()
+        self.queryset = queryset
+        return queryset
+
+
+class TeamMembersAPIView(ListMixin, ListAPIView):
+    """ List all members of a team """
+
+    replica_reads = True
+    serializer_class = TeamSerializer.TeamMemberSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['GET']
+
+    def get_queryset(self) -> list[Member]:
+        team = get_object_or_404(self.request.user.teams.all(), pk=self.kwargs.get('pk'))
+        queryset = team.members.order_by('id')
         self.queryset = queryset
         return queryset
 
@@ -120,12 +168,16 @@ class TeamDeleteAPIView(RetryExceptionHandlerMixin, DestroyAPIView):
         retry_on_exception=lambda ex: isinstance(ex, DatabaseError),
     )
     def delete(self, request: Request, *args, **kwargs) -> Response:
-        """ Delete a team """
+        """ Queue the deletion of a team, releasing its members, poll the returned job for its completion """
         instance = self.get_object()
         if not instance:
             return Response({'message': 'Team not found'}, status=status.HTTP_404_NOT_FOUND)
-        self.perform_destroy(instance)
-        return Response({'message': 'Team deleted'}, status=status.HTTP_200_OK)
+        queued = enqueue(
+            'teams_app.delete_teams',
+            {'owner_id': request.user.id, 'team_ids': [instance.pk], 'actor_id': request.user.id},
+            owner=request.user,
+        )
+        return job_accepted_response(request, queued, 'Team deletion queued')
 
 
 """  MEMBER API ENDPOINTS """
@@ -144,6 +196,7 @@ class MemberCreateAPIView(RetryExceptionHandlerMixin, CreateAPIView):
         wait_fixed=settings.RETRY_WAIT_FIXED,
         retry_on_exception=lambda ex: isinstance(ex, DatabaseError),
     )
+    @idempotent
     def create(self, request: Request, *args, **kwargs) -> Response:
         """ Create a new member """
         serializer = self.get_serializer(data=request.data)
@@ -162,9 +215,12 @@ class MemberCreateAPIView(RetryExceptionHandlerMixin, CreateAPIView):
 class MemberListAPIView(ListMixin, ListAPIView):
     """ List all members """
 
+    replica_reads = True
     serializer_class = MemberSerializer
+    read_serializer_class = MemberReadSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_class = MemberFilterSet
     search_fields = ['first_name', 'last_name', 'email']
     ordering_fields = '__all__'
     allowed_methods = ['GET']
@@ -178,6 +234,7 @@ class MemberListAPIView(ListMixin, ListAPIView):
 class MemberDetailAPIView(RetrieveAPIView):
     """ Get details of a member """
 
+    replica_reads = True
     serializer_class = MemberSerializer
     lookup_field = 'pk'
     allowed_methods = ['GET']
@@ -189,6 +246,21 @@ class MemberDetailAPIView(RetrieveAPIView):
         return queryset
 
 
+class MemberBatchAPIView(MultiGetMixin, GenericAPIView):
+    """ Get details of several members, e.g. `?ids=1,2,3` """
+
+    replica_reads = True
+    serializer_class = MemberSerializer
+    read_serializer_class = MemberReadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['GET']
+
+    def get_queryset(self) -> list[Member]:
+        queryset = self.request.user.members.all()
+        self.queryset = queryset
+        return queryset
+
+
 class MemberUpdateAPIView(RetryExceptionHandlerMixin, mixins.UpdateModelMixin, GenericAPIView):
     """Update user details. """
 
@@ -217,6 +289,60 @@ class MemberUpdateAPIView(RetryExceptionHandlerMixin, mixins.UpdateModelMixin, G
         return Response({"message": message}, status=status_code)
 
 
+class MemberBulkUpdateAPIView(RetryExceptionHandlerMixin, APIView):
+    """ Update several members at once """
+
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['PATCH']
+
+    @retry(
+        stop_max_attempt_number=settings.RETRY_MAX_ATTEMPTS,
+        wait_fixed=settings.RETRY_WAIT_FIXED,
+        retry_on_exception=lambda ex: isinstance(ex, DatabaseError),
+    )
+    def patch(self, request: Request, *args, **kwargs) -> Response:
+        """ Apply a list of `{"id": ..., "changes": {"email": ..., "full_name": ...}}` items """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            message = 'Expected a list of {id, changes} objects'
+            return Response({'message': message}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.MEMBER_BULK_UPDATE_MAX_ITEMS:
+            message = f'At most {settings.MEMBER_BULK_UPDATE_MAX_ITEMS} members can be updated at once'
+            return Response({'message': message}, status=status.HTTP_400_BAD_REQUEST)
+        results = bulk_update_members(request.user, items)
+        updated = sum(1 for result in results if result['status'] == status.HTTP_200_OK)
+        return Response({'message': f'{updated} members updated', 'results': results}, status=status.HTTP_200_OK)
+
+
+class MemberExportAPIView(APIView):
+    """ Export all members, the job result holds them """
+
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['POST']
+
+    def post(self, request: Request, *args, **kwargs) -> Response:
+        """ Queue the export of the user's members """
+        queued = enqueue('teams_app.export_members', {'owner_id': request.user.id}, owner=request.user, priority=1)
+        return job_accepted_response(request, queued, 'Members export queued')
+
+
+class MemberImportAPIView(APIView):
+    """ Import a list of members """
+
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['POST']
+
+    def post(self, request: Request, *args, **kwargs) -> Response:
+        """ Validate a list of `{"email": ..., "full_name": ...}` items and queue their creation """
+        serializer = MemberImportSerializer(data=request.data, many=True, allow_empty=False,
+                                            max_length=settings.MEMBER_IMPORT_MAX_ITEMS)
+        if not serializer.is_valid():
+            return Response({'message': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        payload = {'owner_id': request.user.id, 'members': serializer.validated_data, 'actor_id': request.user.id}
+        queued = enqueue('teams_app.import_members', payload, owner=request.user)
+        return job_accepted_response(request, queued, 'Members import queued')
+
+
 class MemberDeleteAPIView(RetryExceptionHandlerMixin, DestroyAPIView):
     """ Delete a member """
 
@@ -258,6 +384,7 @@ class AddMemberAPIView(APIView):
         wait_fixed=settings.RETRY_WAIT_FIXED,
         retry_on_exception=lambda ex: isinstance(ex, DatabaseError),
     )
+    @idempotent
     def post(self, request: Request, *args, **kwargs) -> Response:
         """ Add a member to a team """
         team = request.user.teams.all().filter(pk=kwargs.get('team_pk')).first()
@@ -272,6 +399,9 @@ class AddMemberAPIView(APIView):
             return Response({'message': message}, status=status_code)
         member.team = team
         member.save()
+        publish_on_commit(
+            request.user.id, 'membership.added', {'team': team.pk, 'member': member.pk}, member._state.db,
+        )
         return Response({'message': 'Member added to the team'}, status=status.HTTP_200_OK)
 
 
@@ -300,4 +430,119 @@ class RemoveMemberAPIView(APIView):
             return Response({'message': message}, status=status_code)
         member.team = None
         member.save()
+        publish_on_commit(
+            request.user.id, 'membership.removed', {'team': team.pk, 'member': member.pk}, member._state.db,
+        )
         return Response({'message': 'Member removed from the team'}, status=status.HTTP_200_OK)
+
+
+""" STATS API ENDPOINTS """
+
+
+class StatsAPIView(APIView):
+    """ Get statistics of the user's teams and members """
+
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['GET']
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        """ Get statistics of the user's teams and members """
+        return Response(get_stats(request.user), status=status.HTTP_200_OK)
+
+
+""" AUDIT API ENDPOINTS """
+
+
+class TeamAuditAPIView(ListMixin, ListAPIView):
+    """ Audit history of a team, latest first """
+
+    replica_reads = True
+    serializer_class = AuditEventSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['GET']
+    audit_field = 'team_id'
+
+    def get_queryset(self) -> list[AuditEvent]:
+        """ Events are written in batches, the latest second may be missing. Deleted objects keep their history. """
+        queryset = (
+            AuditEvent.objects.for_owner(self.request.user.id)
+            .filter(**{self.audit_field: self.kwargs.get('pk')})
+            .order_by('-id')
+        )
+        self.queryset = queryset
+        return queryset
+
+
+class MemberAuditAPIView(TeamAuditAPIView):
+    """ Audit history of a member, latest first """
+
+    audit_field = 'member_id'
+
+
+""" SYNC API ENDPOINTS """
+
+
+class ChangeFeedAPIView(APIView):
+    """ List the user's team and member changes after a `since` token """
+
+    permission_classes = [permissions.IsAuthenticated]
+    allowed_methods = ['GET']
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        """
+        Return the teams and members created, updated or deleted after `since`.
+
+        Every object is reported once, in its current state or as a tombstone. `next` is the token for the
+        following call and `has_more` tells whether another page is already available. A token issued before the
+        data was moved to another shard is answered with 410 and `next` 0: the client syncs again from scratch.
+        """
+        input_serializer = ChangeFeedInputSerializer(data=request.GET)
+        input_serializer.is_valid(raise_exception=True)
+        since = input_serializer.validated_data['since']
+        limit = input_serializer.validated_data['limit']
+
+        changes = list(
+            Change.objects.for_owner(request.user.id).filter(seq__gt=since)
+            .order_by('seq')
+            .values_list('seq', 'kind', 'object_id')[:limit + 1]
+        )
+        if since and any(kind == Change.KIND_OWNER for seq, kind, object_id in changes):
+            # The token was issued by the shard the data was moved from, its ids are gone.
+            return Response(
+                {'message': 'The data was moved, drop the local copy and sync again from next', 'next': 0},
+                status=status.HTTP_410_GONE,
+            )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        latest = {}
+        for seq, kind, object_id in changes:
+            if kind == Change.KIND_OWNER:
+                continue
+            latest.pop((kind, object_id), None)
+            latest[(kind, object_id)] = seq
+
+        team_ids = [object_id for kind, object_id in latest if kind == Change.KIND_TEAM]
+        member_ids = [object_id for kind, object_id in latest if kind == Change.KIND_MEMBER]
+        teams = {team.pk: team for team in request.user.teams.filter(pk__in=team_ids)}
+        members = {member.pk: member for member in request.user.members.filter(pk__in=member_ids).select_related('team')}
+        serializer_classes = {Change.KIND_TEAM: ChangeTeamSerializer, Change.KIND_MEMBER: MemberSerializer}
+        instances = {Change.KIND_TEAM: teams, Change.KIND_MEMBER: members}
+
+        data = []
+        for (kind, object_id), seq in latest.items():
+            instance = instances[kind].get(object_id)
+            data.append({
+                'seq': seq,
+                'type': kind,
+                'id': object_id,
+                'deleted': instance is None,
+                'data': serializer_classes[kind](instance).data if instance is not None else None,
+            })
+
+        response_data = {
+            'next': changes[-1][0] if changes else since,
+            'has_more': has_more,
+            'changes': data,
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
@@ -1,5 +1,15 @@
 from django.contrib import admin
+
+from base.admin import EstimatedCountPaginator, IndexedSearchMixin
 from .models import User
 
 
-admin.site.register(User)
+@admin.register(User)
+class UserAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ['id', 'email', 'first_name', 'last_name', 'registration_method', 'is_staff']
+    list_filter = ['registration_method']
+    search_fields = ['email']
+    search_lookups = ('email',)
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,174 @@
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def b64url_decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def b64url_int(value: str) -> int:
+    return int.from_bytes(b64url_decode(value), 'big')
+
+
+def rsa_sha256_verify(message: bytes, signature: bytes, key: rsa.RSAPublicKey) -> bool:
+    """ Verifies an RSASSA-PKCS1-v1_5 SHA-256 (RS256) signature. """
+    try:
+        key.verify(signature, message, padding.PKCS1v15(), hashes.SHA256())
+    except InvalidSignature:
+        return False
+    return True
+
+
+class SigningKeys:
+    """
+    RSA signing keys of a JWKS endpoint, cached in process.
+
+    A background thread fetches them again `GOOGLE_JWKS_REFRESH_MARGIN` seconds before the `max-age` of the
+    previous response runs out, so logins do not wait for the endpoint. A key id that is not cached yet (the keys
+    were rotated, or the first fetch failed) makes the caller fetch them at most every
+    `GOOGLE_JWKS_MIN_REFRESH_INTERVAL` seconds, the logins in between fail fast. When a refresh fails, the previous
+    keys are kept.
+    """
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self._keys: Dict[str, rsa.RSAPublicKey] = {}
+        self._expires_at = 0.0
+        self._fetched_at = float('-inf')
+        self._lock = threading.Lock()
+        self._refresher_pid: Optional[int] = None
+
+    def get(self, kid: str) -> Optional[rsa.RSAPublicKey]:
+        """ Returns the public key of the key id. """
+        if kid not in self._keys:
+            with self._lock:
+                # Another login may have fetched the keys while this one waited for the lock.
+                if kid not in self._keys:
+                    if self._can_fetch():
+                        self._refresh()
+                    elif not self._keys:
+                        raise ValidationError('The Google signing keys are not available yet, retry later.')
+        if self._refresher_pid != os.getpid():
+            self._start_refresher()
+        return self._keys.get(kid)
+
+    def _can_fetch(self) -> bool:
+        return time.monotonic() - self._fetched_at >= settings.GOOGLE_JWKS_MIN_REFRESH_INTERVAL
+
+    def refresh(self) -> None:
+        """ Fetches the keys, raises ValidationError when it fails and no keys are cached. """
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        try:
+            self._fetch()
+        except (requests.RequestException, ValueError, KeyError, TypeError) as error:
+            logger.warning('Failed to fetch the signing keys from %s: %s', self.url, error)
+            if not self._keys:
+                raise ValidationError('Failed to obtain the Google signing keys.')
+
+    def _fetch(self) -> None:
+        self._fetched_at = time.monotonic()
+        response = requests.get(self.url, timeout=settings.REQUEST_TIMEOUT)
+        response.raise_for_status()
+        keys = {
+            key['kid']: rsa.RSAPublicNumbers(b64url_int(key['e']), b64url_int(key['n'])).public_key()
+            for key in response.json()['keys']
+            if key.get('kty') == 'RSA'
+        }
+        max_age = MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+        max_age = int(max_age.group(1)) if max_age else settings.GOOGLE_JWKS_DEFAULT_MAX_AGE
+        self._keys = keys
+        self._expires_at = self._fetched_at + max_age
+
+    def _start_refresher(self) -> None:
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            # Also restarts the thread in a forked worker, threads do not survive a fork.
+            threading.Thread(target=self._refresh_forever, name='signing-keys', daemon=True).start()
+            self._refresher_pid = os.getpid()
+
+    def _refresh_forever(self) -> None:
+        while True:
+            refresh_at = max(
+                self._expires_at - settings.GOOGLE_JWKS_REFRESH_MARGIN,
+                self._fetched_at + settings.GOOGLE_JWKS_MIN_REFRESH_INTERVAL,
+            )
+            time.sleep(max(refresh_at - time.monotonic(), 0))
+            try:
+                self.refresh()
+            except ValidationError:
+                pass
+
+
+_signing_keys: Dict[str, SigningKeys] = {}
+_signing_keys_lock = threading.Lock()
+
+
+def get_signing_keys(url: str) -> SigningKeys:
+    with _signing_keys_lock:
+        if url not in _signing_keys:
+            _signing_keys[url] = SigningKeys(url)
+        return _signing_keys[url]
+
+
+def verify_id_token(id_token: str) -> Dict[str, Any]:
+    """
+    Verifies a Google ID token locally, against the cached `GOOGLE_JWKS_URL` keys.
+
+    Args:
+        id_token (str): The `id_token` of the token endpoint response.
+
+    Returns:
+        Dict[str, Any]: The claims of the token, including the user's email, given and family name.
+
+    Raises:
+        ValidationError: If the signature or a claim is invalid, or the email is not verified.
+    """
+    try:
+        header_part, claims_part, signature_part = id_token.split('.')
+        header = json.loads(b64url_decode(header_part))
+        claims = json.loads(b64url_decode(claims_part))
+        signature = b64url_decode(signature_part)
+    except ValueError:
+        raise ValidationError('Malformed ID token.')
+    if not isinstance(header, dict) or not isinstance(claims, dict) or header.get('alg') != 'RS256':
+        raise ValidationError('Malformed ID token.')
+
+    key = get_signing_keys(settings.GOOGLE_JWKS_URL).get(header.get('kid'))
+    if key is None:
+        raise ValidationError('ID token signed with an unknown key.')
+    if not rsa_sha256_verify(f'{header_part}.{claims_part}'.encode(), signature, key):
+        raise ValidationError('Invalid ID token signature.')
+
+    now, leeway = time.time(), settings.GOOGLE_ID_TOKEN_LEEWAY
+    if claims.get('iss') not in settings.GOOGLE_ID_TOKEN_ISSUERS:
+        raise ValidationError('ID token issued by another issuer.')
+    if claims.get('aud') != settings.GOOGLE_OAUTH2_CLIENT_ID:
+        raise ValidationError('ID token issued for another client.')
+    if not isinstance(claims.get('exp'), (int, float)) or claims['exp'] + leeway < now:
+        raise ValidationError('Expired ID token.')
+    if not isinstance(claims.get('iat'), (int, float)) or claims['iat'] - leeway > now:
+        raise ValidationError('ID token issued in the future.')
+    if not claims.get('email') or claims.get('email_verified') not in (True, 'true'):
+        raise ValidationError('Google account email is not verified.')
+    return claims
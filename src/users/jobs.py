@@ -0,0 +1,10 @@
+from jobs.models import Job
+from jobs.queue import job
+from .models import User
+
+
+@job('users.refresh_google_profile')
+def refresh_google_profile(running: Job, *, user_id: int, first_name: str, last_name: str) -> dict:
+    """ Updates the names of a user from the verified ID token claims of their latest Google login. """
+    updated = User.objects.filter(pk=user_id).update(first_name=first_name, last_name=last_name)
+    return {'updated': updated}
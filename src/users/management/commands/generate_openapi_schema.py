@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from base.schema import write_artifacts
+
+
+class Command(BaseCommand):
+    help = 'Generates the OpenAPI schema once and stores it as the artifact served by the docs endpoints.'
+
+    def handle(self, *args, **options):
+        for path in write_artifacts():
+            self.stderr.write(self.style.SUCCESS(f'OpenAPI schema written to {path}'))
@@ -0,0 +1,515 @@
+import http.client
+import importlib.util
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+from typing import Callable, NamedTuple
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.urls import reverse
+
+PASSWORD = 'load-test-password'
+# Seconds a setup call shed by the admission control of the server is sent again for.
+SETUP_RETRY_TIMEOUT = 60
+
+DEFAULT_MIX = {
+    'login': 2,
+    'team_list': 20,
+    'team_detail': 10,
+    'team_members': 5,
+    'team_create': 2,
+    'team_update': 2,
+    'member_list': 20,
+    'member_detail': 10,
+    'member_create': 5,
+    'member_update': 5,
+    'add_member': 5,
+    'remove_member': 4,
+    'stats': 5,
+    'change_feed': 5,
+}
+
+
+class Call(NamedTuple):
+    method: str
+    path: str
+    body: dict | None = None
+    anonymous: bool = False
+    on_success: Callable[[dict | None], None] | None = None
+
+
+class Sample(NamedTuple):
+    url_name: str
+    started: float
+    latency: float
+    status: int | None
+
+
+class VirtualUser:
+    """
+    A client with its own account, session and keep-alive connection.
+
+    The operations are picked by a random generator seeded with the run seed and the user index, so every run
+    replays the same sequence. The ids the operations work on are learned from the change feed, like a real
+    client syncing its data.
+    """
+
+    def __init__(self, index: int, host: str, port: int, seed: int, tag: str) -> None:
+        self.index = index
+        self.host, self.port = host, port
+        self.rng = random.Random(f'{seed}:{index}')
+        self.email = f'vu{index}-{tag}@loadtest.example.com'
+        self.tag = tag
+        self.connection: http.client.HTTPConnection | None = None
+        self.cookies: dict[str, str] = {}
+        self.teams: dict[int, None] = {}
+        self.members: dict[int, int | None] = {}
+        self.since = 0
+        self.counter = 0
+        self.retry_after = 1.0
+
+    def next_name(self, prefix: str) -> str:
+        self.counter += 1
+        return f'{prefix} {self.index}-{self.counter}'
+
+    def request(self, call: Call) -> tuple[int | None, dict | None, float]:
+        """ Sends the call, returns the status (None when the connection failed), the JSON body and the latency. """
+        headers = {'Accept': 'application/json'}
+        payload = None
+        if call.body is not None:
+            payload = json.dumps(call.body).encode()
+            headers['Content-Type'] = 'application/json'
+        if not call.anonymous and self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+            if settings.CSRF_COOKIE_NAME in self.cookies:
+                headers['X-CSRFToken'] = self.cookies[settings.CSRF_COOKIE_NAME]
+
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.connection.request(call.method, call.path, payload, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return None, None, time.perf_counter() - started
+        latency = time.perf_counter() - started
+
+        for header in response.msg.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel.value and morsel['max-age'] != '0':
+                    self.cookies[name] = morsel.value
+                else:
+                    self.cookies.pop(name, None)
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        if response.status == 503:
+            self.retry_after = float(response.getheader('Retry-After') or 1)
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        return response.status, data, latency
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def setup(self, teams: int, members: int) -> None:
+        """ Registers and logs the user in, creates its teams and members and puts half of the members in teams. """
+        self.expect(Call('POST', reverse('register'), {'email': self.email, 'password': PASSWORD}, anonymous=True), 201)
+        self.expect(self.call_login(), 200)
+        for _ in range(teams):
+            self.expect(self.call_team_create(), 201)
+        for _ in range(members):
+            self.expect(self.call_member_create(), 201)
+        self.sync()
+        team_ids = list(self.teams)
+        for position, member_id in enumerate(list(self.members)[::2]):
+            if team_ids:
+                self.expect(self.add_member_call(team_ids[position % len(team_ids)], member_id), 200)
+
+    def expect(self, call: Call, expected_status: int) -> None:
+        """ Sends a setup call, again after `Retry-After` (with jitter) while the server sheds it. """
+        deadline = time.monotonic() + SETUP_RETRY_TIMEOUT
+        response_status, data, _ = self.request(call)
+        while response_status == 503 and time.monotonic() < deadline:
+            # Not the seeded generator, the retries must not change the replayed sequence.
+            time.sleep(self.retry_after * (1 + random.random()))
+            response_status, data, _ = self.request(call)
+        if response_status != expected_status:
+            raise CommandError(f'Setup of {self.email} failed: {call.method} {call.path} -> {response_status} {data}')
+        if call.on_success is not None:
+            call.on_success(data)
+
+    def sync(self) -> None:
+        """ Reads the whole change feed """
+        has_more = True
+        while has_more:
+            response_status, data, _ = self.request(self.call_change_feed())
+            if response_status != 200:
+                raise CommandError(f'Change feed of {self.email} failed: {response_status} {data}')
+            self.apply_changes(data)
+            has_more = data['has_more']
+
+    def apply_changes(self, data: dict) -> None:
+        for change in data['changes']:
+            if change['type'] == 'team':
+                if change['deleted']:
+                    self.teams.pop(change['id'], None)
+                else:
+                    self.teams[change['id']] = None
+            elif change['deleted']:
+                self.members.pop(change['id'], None)
+            else:
+                team = change['data']['team']
+                self.members[change['id']] = team['id'] if team else None
+        self.since = data['next']
+
+    def run(self, mix: dict[str, int], deadline: float, samples: list[Sample]) -> None:
+        """ Replays operations of the mix until the deadline """
+        names, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            for url_name in self.rng.choices(names, weights, k=len(names)):
+                call = getattr(self, f'call_{url_name}')()
+                if call is not None:
+                    break
+            else:
+                url_name, call = 'team_list', self.call_team_list()
+            started = time.monotonic()
+            response_status, data, latency = self.request(call)
+            samples.append(Sample(url_name, started, latency, response_status))
+            if response_status is not None and response_status < 300 and call.on_success is not None:
+                call.on_success(data)
+        self.close()
+
+    def page(self, count: int) -> str:
+        pages = max(math.ceil(count / settings.PAGINATION_PAGE_SIZE), 1)
+        return urlencode({'page': self.rng.randint(1, pages)})
+
+    """ OPERATIONS, one per URL name, None when the user has nothing to run it on """
+
+    def call_login(self) -> Call:
+        return Call('POST', reverse('login'), {'email': self.email, 'password': PASSWORD}, anonymous=True)
+
+    def call_team_list(self) -> Call:
+        return Call('GET', f'{reverse("team_list")}?{self.page(len(self.teams))}')
+
+    def call_team_detail(self) -> Call | None:
+        if self.teams:
+            return Call('GET', reverse('team_detail', kwargs={'pk': self.rng.choice(list(self.teams))}))
+
+    def call_team_members(self) -> Call | None:
+        if self.teams:
+            return Call('GET', reverse('team_members', kwargs={'pk': self.rng.choice(list(self.teams))}))
+
+    def call_team_create(self) -> Call:
+        return Call('POST', reverse('team_create'), {'name': self.next_name('Team')})
+
+    def call_team_update(self) -> Call | None:
+        if self.teams:
+            team_id = self.rng.choice(list(self.teams))
+            return Call('PUT', reverse('team_update', kwargs={'pk': team_id}), {'name': self.next_name('Team')})
+
+    def call_member_list(self) -> Call:
+        return Call('GET', f'{reverse("member_list")}?{self.page(len(self.members))}')
+
+    def call_member_detail(self) -> Call | None:
+        if self.members:
+            return Call('GET', reverse('member_detail', kwargs={'pk': self.rng.choice(list(self.members))}))
+
+    def call_member_create(self) -> Call:
+        self.counter += 1
+        email = f'member{self.counter}-{self.index}-{self.tag}@loadtest.example.com'
+        return Call('POST', reverse('member_create'), {'email': email, 'full_name': f'Member {self.counter}'})
+
+    def call_member_update(self) -> Call | None:
+        if self.members:
+            member_id = self.rng.choice(list(self.members))
+            body = {'full_name': self.next_name('Member')}
+            return Call('PUT', reverse('member_update', kwargs={'pk': member_id}), body)
+
+    def call_add_member(self) -> Call | None:
+        free_members = [member_id for member_id, team_id in self.members.items() if team_id is None]
+        if self.teams and free_members:
+            return self.add_member_call(self.rng.choice(list(self.teams)), self.rng.choice(free_members))
+
+    def add_member_call(self, team_id: int, member_id: int) -> Call:
+        kwargs = {'team_pk': team_id, 'member_pk': member_id}
+        return Call('POST', reverse('add_member', kwargs=kwargs), on_success=self.set_team(member_id, team_id))
+
+    def call_remove_member(self) -> Call | None:
+        team_members = [(member_id, team_id) for member_id, team_id in self.members.items() if team_id is not None]
+        if team_members:
+            member_id, team_id = self.rng.choice(team_members)
+            kwargs = {'team_pk': team_id, 'member_pk': member_id}
+            return Call('POST', reverse('remove_member', kwargs=kwargs), on_success=self.set_team(member_id, None))
+
+    def set_team(self, member_id: int, team_id: int | None) -> Callable[[dict | None], None]:
+        def on_success(data: dict | None) -> None:
+            self.members[member_id] = team_id
+        return on_success
+
+    def call_stats(self) -> Call:
+        return Call('GET', reverse('stats'))
+
+    def call_change_feed(self) -> Call:
+        query = urlencode({'since': self.since, 'limit': settings.CHANGE_FEED_MAX_LIMIT})
+        return Call('GET', f'{reverse("change_feed")}?{query}', on_success=self.apply_changes)
+
+
+def percentile(latencies: list[float], rank: float) -> float:
+    """ Nearest-rank percentile of sorted latencies """
+    return latencies[max(math.ceil(rank / 100 * len(latencies)) - 1, 0)]
+
+
+def summarize(samples: list[Sample], duration: float) -> dict:
+    latencies = sorted(sample.latency for sample in samples)
+    if not latencies:
+        return {
+            'requests': 0, 'rps': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'rejected': 0, 'shed': 0, 'errors': 0,
+        }
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / duration, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'rejected': sum(1 for sample in samples if sample.status is not None and 400 <= sample.status < 500
+                        and sample.status != 417),
+        # Refused by the admission control of the server.
+        'shed': sum(1 for sample in samples if sample.status == 503),
+        # Connection failures, server errors and database failures (417).
+        'errors': sum(1 for sample in samples if sample.status is None or sample.status == 417
+                      or (sample.status >= 500 and sample.status != 503)),
+    }
+
+
+def git_revision() -> dict:
+    def git(*args: str) -> str | None:
+        try:
+            result = subprocess.run(['git', *args], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return result.stdout.strip()
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(status) if status is not None else None}
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the app under gunicorn on throw-away SQLite files, replays a traffic mix of URL names with concurrent '
+        'virtual users and reports the throughput and the p50/p95/p99 latency per endpoint. The mix, the seed and '
+        'the data are fixed, so runs of different commits can be compared with `--output` and `--compare`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=16, help='Concurrent virtual users.')
+        parser.add_argument('--duration', type=float, default=30.0, help='Measured seconds.')
+        parser.add_argument('--warmup', type=float, default=5.0, help='Seconds run before measuring.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+            help='Comma separated `url_name=weight` pairs, or a path to a JSON object of them.',
+        )
+        parser.add_argument('--teams', type=int, default=5, help='Teams created per virtual user before the run.')
+        parser.add_argument('--members', type=int, default=20, help='Members created per virtual user before the run.')
+        parser.add_argument('--server-mode', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=8, help='Threads per worker in wsgi mode.')
+        parser.add_argument('--url', help='Load an already running server instead of starting one.')
+        parser.add_argument('--output', help='Write the results as JSON to this path.')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare with.')
+
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options['mix'])
+        with tempfile.TemporaryDirectory(prefix='load-test-') as directory:
+            if options['url']:
+                parts = urlsplit(options['url'])
+                host, port, server = parts.hostname, parts.port or 80, None
+            else:
+                host, port = '127.0.0.1', self.free_port()
+                server = self.start_server(options, directory, port)
+            try:
+                results = self.run(options, mix, host, port)
+            finally:
+                if server is not None:
+                    self.stop_server(server)
+
+        self.report(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stderr.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def parse_mix(self, value: str) -> dict[str, int]:
+        if os.path.isfile(value):
+            with open(value) as file:
+                mix = json.load(file)
+        else:
+            try:
+                mix = {name.strip(): int(weight) for name, weight in (pair.split('=') for pair in value.split(','))}
+            except ValueError:
+                raise CommandError(f'Invalid mix "{value}", expected `url_name=weight` pairs.')
+        unknown = [name for name in mix if not hasattr(VirtualUser, f'call_{name}')]
+        if unknown:
+            raise CommandError(f'Unsupported URL names {unknown}, the mix supports {list(DEFAULT_MIX)}.')
+        mix = {name: weight for name, weight in mix.items() if weight > 0}
+        if not mix:
+            raise CommandError('The mix has no URL name with a positive weight.')
+        return mix
+
+    def free_port(self) -> int:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def start_server(self, options: dict, directory: str, port: int) -> subprocess.Popen:
+        if importlib.util.find_spec('gunicorn') is None:
+            raise CommandError('gunicorn is not installed, install base/docker/requirements-server.txt.')
+
+        env = {
+            **os.environ,
+            'SQLITE_DIR': directory,
+            'SERVER_MODE': options['server_mode'],
+            'WEB_CONCURRENCY': str(options['workers']),
+            'GUNICORN_THREADS': str(options['threads']),
+            'GUNICORN_BIND': f'127.0.0.1:{port}',
+        }
+        # Replicas would be empty copies of the fresh databases.
+        env.pop('REPLICA_DATABASES', None)
+        log = open(os.path.join(directory, 'server.log'), 'w')
+        migrate = subprocess.run(
+            [sys.executable, 'manage.py', 'migrate_shards', '--noinput'],
+            cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        if migrate.returncode:
+            raise CommandError(f'Migration failed:\n{self.tail(log)}')
+
+        self.stderr.write(f'Starting gunicorn ({options["server_mode"]}) on 127.0.0.1:{port}')
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'base/gunicorn.conf.py'],
+            cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + 30
+        while True:
+            if server.poll() is not None:
+                raise CommandError(f'The server exited with {server.returncode}:\n{self.tail(log)}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', reverse('team_list'))
+                connection.getresponse().read()
+                connection.close()
+                return server
+            except (OSError, http.client.HTTPException):
+                if time.monotonic() > deadline:
+                    self.stop_server(server)
+                    raise CommandError(f'The server did not start in 30s:\n{self.tail(log)}')
+                time.sleep(0.2)
+
+    def stop_server(self, server: subprocess.Popen) -> None:
+        server.terminate()
+        try:
+            server.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    def tail(self, log) -> str:
+        log.flush()
+        with open(log.name) as file:
+            return ''.join(file.readlines()[-20:])
+
+    def run(self, options: dict, mix: dict[str, int], host: str, port: int) -> dict:
+        tag = uuid.uuid4().hex[:8]
+        users = [VirtualUser(index, host, port, options['seed'], tag) for index in range(options['users'])]
+
+        self.stderr.write(f'Creating {len(users)} users with {options["teams"]} teams, {options["members"]} members each')
+        errors = []
+        self.in_threads(users, lambda user: self.collect_errors(errors, user.setup, options['teams'], options['members']))
+        if errors:
+            raise CommandError(errors[0])
+
+        self.stderr.write(f'Running for {options["warmup"]:g}s warm-up + {options["duration"]:g}s')
+        samples: list[list[Sample]] = [[] for _ in users]
+        started = time.monotonic()
+        measured_from = started + options['warmup']
+        deadline = measured_from + options['duration']
+        self.in_threads(users, lambda user: user.run(mix, deadline, samples[user.index]))
+        measured = [sample for user_samples in samples for sample in user_samples if sample.started >= measured_from]
+        duration = max(time.monotonic(), deadline) - measured_from
+
+        by_url_name: dict[str, list[Sample]] = {name: [] for name in mix}
+        for sample in measured:
+            by_url_name[sample.url_name].append(sample)
+        return {
+            **git_revision(),
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'options': {
+                'users': options['users'], 'duration': options['duration'], 'warmup': options['warmup'],
+                'seed': options['seed'], 'mix': mix, 'teams': options['teams'], 'members': options['members'],
+                'server': options['url'] or {
+                    'mode': options['server_mode'], 'workers': options['workers'], 'threads': options['threads'],
+                    'settings': os.environ.get('DJANGO_SETTINGS_MODULE'),
+                },
+            },
+            'total': summarize(measured, duration),
+            'endpoints': {name: summarize(url_samples, duration) for name, url_samples in by_url_name.items()},
+        }
+
+    def in_threads(self, users: list[VirtualUser], target: Callable[[VirtualUser], None]) -> None:
+        threads = [threading.Thread(target=target, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def collect_errors(self, errors: list, func: Callable, *args) -> None:
+        try:
+            func(*args)
+        except CommandError as error:
+            errors.append(str(error))
+
+    def report(self, results: dict, compare: str | None) -> None:
+        baseline = {}
+        if compare:
+            with open(compare) as file:
+                baseline = json.load(file)
+            self.stdout.write(f'Compared with {baseline.get("commit") or compare} (req/s and p95 change)')
+
+        self.stdout.write(
+            f'{"endpoint":<14} {"requests":>8} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+            f'{"4xx":>5} {"shed":>5} {"errors":>6}'
+        )
+        rows = [*results['endpoints'].items(), ('total', results['total'])]
+        for name, stats in rows:
+            line = (
+                f'{name:<14} {stats["requests"]:>8} {stats["rps"]:>8} {stats["p50_ms"] or "-":>8} '
+                f'{stats["p95_ms"] or "-":>8} {stats["p99_ms"] or "-":>8} {stats["rejected"]:>5} {stats["shed"]:>5} {stats["errors"]:>6}'
+            )
+            before = baseline.get('total') if name == 'total' else baseline.get('endpoints', {}).get(name)
+            if before:
+                line += f'  {self.change(before["rps"], stats["rps"])} {self.change(before["p95_ms"], stats["p95_ms"])}'
+            self.stdout.write(line)
+        commit = results['commit'] or 'unknown commit'
+        self.stdout.write(f'{commit}{" (uncommitted changes)" if results["dirty"] else ""}')
+
+    def change(self, before: float | None, after: float | None) -> str:
+        if not before or after is None:
+            return '-'
+        return f'{(after - before) / before * 100:+.1f}%'
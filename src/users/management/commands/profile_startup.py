@@ -0,0 +1,43 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from base.startup import profile_imports
+
+
+class Command(BaseCommand):
+    help = (
+        'Profiles what a fresh worker imports before its first request (`python -X importtime`) and reports the '
+        'slowest packages and modules against STARTUP_IMPORT_BUDGET.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='base.wsgi', help='Application module, e.g. base.asgi.')
+        parser.add_argument('--top', type=int, default=15, help='Number of packages and modules listed.')
+
+    def handle(self, *args, **options):
+        try:
+            seconds, imports = profile_imports(options['module'])
+        except RuntimeError as error:
+            raise CommandError(str(error))
+
+        packages = defaultdict(int)
+        for item in imports:
+            packages[item.module.split('.')[0]] += item.self_us
+        total_us = sum(packages.values())
+
+        self.stdout.write(f'{"package":<30} {"ms":>8} {"share":>6}  (own import time of its modules)')
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'{package:<30} {self_us / 1000:>8.1f} {self_us / total_us:>6.1%}')
+        self.stdout.write('')
+        self.stdout.write(f'{"module":<50} {"self ms":>8} {"cumul ms":>9}')
+        for item in sorted(imports, key=lambda item: -item.self_us)[:options['top']]:
+            self.stdout.write(f'{item.module:<50} {item.self_us / 1000:>8.1f} {item.cumulative_us / 1000:>9.1f}')
+        self.stdout.write('')
+        self.stdout.write(f'{len(imports)} modules imported, drf_yasg {"loaded" if "drf_yasg" in packages else "not loaded"}')
+
+        message = f'Startup took {seconds:.2f}s, the budget is {settings.STARTUP_IMPORT_BUDGET:.2f}s'
+        if seconds > settings.STARTUP_IMPORT_BUDGET:
+            raise CommandError(message)
+        self.stderr.write(self.style.SUCCESS(message))
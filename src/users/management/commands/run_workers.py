@@ -0,0 +1,86 @@
+import logging
+import os
+import signal
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections, connection
+
+from jobs import queue
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Runs background job workers that process the database-backed job queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOBS_WORKERS, help='Number of concurrent workers.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL,
+            help='Seconds to sleep when the queue is empty.',
+        )
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is drained.')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        handlers = {signum: signal.signal(signum, self.shutdown) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            self.start_workers(options)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def start_workers(self, options) -> None:
+        # Fails until the database is migrated, the process manager starts the command again.
+        requeued = queue.requeue_stale(timedelta(seconds=settings.JOBS_STALE_TIMEOUT))
+        if requeued:
+            self.stderr.write(self.style.WARNING(f'Re-queued {requeued} stale job(s).'))
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(f'{prefix}:{index}', options['poll_interval'], options['burst']),
+                daemon=True,
+            )
+            for index in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stderr.write(self.style.SUCCESS(f'Started {len(threads)} worker(s).'))
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+        self.stderr.write(self.style.SUCCESS('Workers stopped.'))
+
+    def shutdown(self, signum, frame) -> None:
+        """ Lets running jobs finish and stops claiming new ones. """
+        self.stop.set()
+
+    def work(self, worker_id: str, poll_interval: float, burst: bool) -> None:
+        """ Claims and executes jobs until stopped. """
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                try:
+                    claimed = queue.claim(worker_id)
+                    if claimed is not None:
+                        queue.execute(claimed)
+                except Exception:
+                    # The worker must survive a locked or unavailable database, `requeue_stale` puts back a job
+                    # left running.
+                    logger.exception('Worker %s failed to claim or record a job', worker_id)
+                    self.stop.wait(poll_interval)
+                    continue
+                if claimed is None:
+                    if burst:
+                        return
+                    self.stop.wait(poll_interval)
+                    continue
+                self.stdout.write(f'[{worker_id}] job {claimed.pk} ({claimed.name}): {claimed.status}')
+        finally:
+            connection.close()
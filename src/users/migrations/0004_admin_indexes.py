@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_rename_registration_way_user_registration_method'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['registration_method'], name='users_user_reg_method_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:57
+
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Lower, Trim
+
+
+def duplicate_address(User, email: str, pk: int) -> str:
+    """ A free address for an account whose email only differs by case from another one's, e.g. a+duplicate-7@b.io """
+    local, _, domain = email.rpartition('@')
+    candidate, suffix = f'{local}+duplicate-{pk}@{domain}', 0
+    while User.objects.filter(email=candidate).exists():
+        suffix += 1
+        candidate = f'{local}+duplicate-{pk}-{suffix}@{domain}'
+    return candidate
+
+
+def normalize_emails(apps, schema_editor):
+    """
+    Lowercases the emails. Of the accounts whose emails only differ by case, the one already using the lowercase
+    address keeps it (the oldest one when none does) and the others get a `+duplicate-<id>` address, so that no
+    account is lost and they can be merged by hand.
+    """
+    User = apps.get_model('users', 'User')
+    normalized = Lower(Trim('email'))
+    to_normalize = set(User.objects.exclude(email=normalized).values_list(normalized, flat=True).distinct())
+    accounts = (
+        User.objects.annotate(normalized=normalized).filter(normalized__in=to_normalize)
+        .order_by('id').values_list('id', 'email', 'normalized')
+    )
+    groups = {}
+    for pk, email, address in accounts:
+        groups.setdefault(address, []).append((pk, email))
+
+    for address, group in groups.items():
+        group.sort(key=lambda account: (account[1] != address, account[0]))
+        for index, (pk, email) in enumerate(group):
+            new_email = address if index == 0 else duplicate_address(User, address, pk)
+            if new_email != email:
+                User.objects.filter(pk=pk).update(email=new_email)
+    User.objects.exclude(username=F('email')).update(username=F('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0004_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_emails, migrations.RunPython.noop),
+    ]
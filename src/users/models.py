@@ -3,14 +3,34 @@ from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
 
+def normalize_email(value: str | None) -> str | None:
+    """Returns the canonical, lowercase form of an email address."""
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
 class LowercaseEmailField(models.EmailField):
     """
-    A custom EmailField that converts email addresses to lowercase.
+    A custom EmailField that stores email addresses in lowercase.
+
+    The address is normalised when it is assigned through forms, when the instance is saved and when it is used
+    as a query parameter, so lookups can always be plain indexed `email = %s` matches.
     """
 
-    def get_prep_value(self, value: str) -> str:
+    def to_python(self, value: str | None) -> str | None:
+        """Normalise the address coming from forms and deserialisation."""
+        return normalize_email(super().to_python(value))
+
+    def pre_save(self, model_instance: models.Model, add: bool) -> str | None:
+        """Normalise the address on the instance before it is written."""
+        value = normalize_email(getattr(model_instance, self.attname))
+        setattr(model_instance, self.attname, value)
+        return value
+
+    def get_prep_value(self, value: str | None) -> str | None:
         """Convert email address to lowercase."""
-        return value.lower()
+        return normalize_email(super().get_prep_value(value))
 
 
 class User(AbstractUser):
@@ -27,6 +47,11 @@ class User(AbstractUser):
         null=False,
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['registration_method'], name='users_user_reg_method_idx'),
+        ]
+
     @property
     def full_name(self) -> str:
         return f'{self.first_name} {self.last_name}'.strip()
@@ -46,6 +71,7 @@ class User(AbstractUser):
 
     def save(self, *args, **kwargs) -> None:
         """ Override the save method to set the email as the username. """
+        self.email = normalize_email(self.email)
         self.username = self.email
         super().save(*args, **kwargs)
 
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import User
+from .models import User, normalize_email
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -18,6 +18,10 @@ class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
     password = serializers.CharField(required=True)
 
+    def validate_email(self, value: str) -> str:
+        """ Normalise the email, so that it matches the stored one exactly. """
+        return normalize_email(value)
+
 
 class UserEditSerializer(serializers.ModelSerializer):
     fullName = serializers.CharField(source="full_name", required=False)
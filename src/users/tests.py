@@ -1,3 +1,253 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
 
-# Create your tests here.
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from jobs import queue
+from .management.commands.load_test import DEFAULT_MIX
+from .models import User
+
+CLIENT_ID = 'test-client-id'
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64url_int(value: int) -> str:
+    return b64url(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+
+
+class RSAKey:
+    """ Locally generated RS256 signing key, with its JWK. """
+
+    def __init__(self, kid: str) -> None:
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    @property
+    def jwk(self) -> dict:
+        numbers = self.private_key.public_key().public_numbers()
+        return {'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': self.kid,
+                'n': b64url_int(numbers.n), 'e': b64url_int(numbers.e)}
+
+    def sign(self, claims: dict) -> str:
+        header = b64url(json.dumps({'alg': 'RS256', 'kid': self.kid, 'typ': 'JWT'}).encode())
+        payload = b64url(json.dumps(claims).encode())
+        signature = self.private_key.sign(f'{header}.{payload}'.encode(), padding.PKCS1v15(), hashes.SHA256())
+        return f'{header}.{payload}.{b64url(signature)}'
+
+
+class StubGoogle:
+    """ Local token and JWKS endpoints, counting the requests they receive. """
+
+    def __init__(self) -> None:
+        self.keys: list[RSAKey] = []
+        self.id_token = ''
+        self.hits = {'token': 0, 'certs': 0}
+        self.certs_status = 200
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits['certs'] += 1
+                self.reply(
+                    {'keys': [key.jwk for key in stub.keys]}, {'Cache-Control': 'public, max-age=3600'},
+                    stub.certs_status,
+                )
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.hits['token'] += 1
+                self.reply({'access_token': 'access-token', 'id_token': stub.id_token, 'token_type': 'Bearer'})
+
+            def reply(self, data: dict, headers: dict = None, status: int = 200) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class GoogleIdTokenLoginTests(TestCase):
+    """ Google login verifies the ID token of the token response locally, without a user info request. """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = RSAKey('key-1')
+        cls.rotated_key = RSAKey('key-2')
+
+    def setUp(self):
+        self.google = StubGoogle()
+        self.addCleanup(self.google.close)
+        self.google.keys = [self.key]
+        self.enterContext(override_settings(
+            GOOGLE_OAUTH2_CLIENT_ID=CLIENT_ID,
+            GOOGLE_ACCESS_TOKEN_OBTAIN_URL=f'{self.google.url}/token',
+            # A new URL per test, so that every test starts with an empty key cache.
+            GOOGLE_JWKS_URL=f'{self.google.url}/certs',
+            GOOGLE_JWKS_MIN_REFRESH_INTERVAL=0,
+        ))
+
+    def claims(self, **overrides) -> dict:
+        now = int(time.time())
+        return {
+            'iss': 'https://accounts.google.com', 'aud': CLIENT_ID, 'sub': '1234', 'iat': now, 'exp': now + 3600,
+            'email': 'Jane.Doe@Example.com', 'email_verified': True, 'given_name': 'Jane', 'family_name': 'Doe',
+            **overrides,
+        }
+
+    def login(self, id_token: str):
+        self.google.id_token = id_token
+        return self.client.get(reverse('google_login'), {'code': 'auth-code'})
+
+    def test_login_creates_the_user_from_the_id_token(self):
+        response = self.login(self.key.sign(self.claims()))
+        self.client.logout()
+        second = self.login(self.key.sign(self.claims()))
+
+        self.assertEqual((response.status_code, second.status_code), (200, 200))
+        user = User.objects.get()
+        self.assertEqual((user.email, user.first_name, user.last_name), ('jane.doe@example.com', 'Jane', 'Doe'))
+        self.assertEqual(user.registration_method, 'google')
+        # One token request per login, the signing keys are fetched once.
+        self.assertEqual(self.google.hits, {'token': 2, 'certs': 1})
+
+    def test_changed_names_are_refreshed_in_the_background(self):
+        self.login(self.key.sign(self.claims()))
+        self.client.logout()
+
+        response = self.login(self.key.sign(self.claims(given_name='Janet', family_name='Smith')))
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get()
+        self.assertEqual((user.first_name, user.last_name), ('Jane', 'Doe'))
+        queue.execute(queue.claim('test'))
+        user.refresh_from_db()
+        self.assertEqual((user.first_name, user.last_name), ('Janet', 'Smith'))
+
+    def test_invalid_tokens_are_rejected(self):
+        valid = self.key.sign(self.claims())
+        header, payload, signature = valid.split('.')
+        forged_payload = b64url(json.dumps(self.claims(email='admin@example.com')).encode())
+        cases = {
+            'forged claims': f'{header}.{forged_payload}.{signature}',
+            'other audience': self.key.sign(self.claims(aud='another-client')),
+            'other issuer': self.key.sign(self.claims(iss='https://evil.example.com')),
+            'expired': self.key.sign(self.claims(exp=int(time.time()) - 3600)),
+            'unverified email': self.key.sign(self.claims(email_verified=False)),
+            'unknown key': RSAKey('key-3').sign(self.claims()),
+            'malformed': 'not-a-token',
+        }
+        for case, id_token in cases.items():
+            with self.subTest(case):
+                self.assertEqual(self.login(id_token).status_code, 403)
+        self.assertFalse(User.objects.exists())
+
+    @override_settings(GOOGLE_JWKS_MIN_REFRESH_INTERVAL=60)
+    def test_unavailable_keys_are_not_fetched_on_every_login(self):
+        self.google.certs_status = 500
+        id_token = self.key.sign(self.claims())
+
+        with self.assertLogs('users.google_id_token', 'WARNING'):
+            responses = [self.login(id_token) for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [403, 403, 403])
+        self.assertEqual(responses[-1].data['message'], 'The Google signing keys are not available yet, retry later.')
+        self.assertEqual(self.google.hits['certs'], 1)
+
+    def test_rotated_keys_are_fetched_again(self):
+        self.assertEqual(self.login(self.key.sign(self.claims())).status_code, 200)
+        self.client.logout()
+        self.google.keys = [self.key, self.rotated_key]
+
+        self.assertEqual(self.login(self.rotated_key.sign(self.claims())).status_code, 200)
+        self.assertEqual(self.google.hits['certs'], 2)
+
+
+class NormalizeEmailsMigrationTests(TestCase):
+    """ The email backfill lowercases the emails, also of the accounts whose emails only differ by case. """
+
+    def create_raw(self, email: str) -> User:
+        """ Stores the email as is, the model would lowercase it. """
+        user = User.objects.create(email=f'placeholder-{email.lower()}')
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE users_user SET email = %s, username = %s WHERE id = %s', [email, email, user.pk])
+        return user
+
+    def test_accounts_differing_by_case_are_kept_apart(self):
+        upper = self.create_raw('Jane@Example.com')
+        lower = self.create_raw('jane@example.com')
+        shouting = self.create_raw(' JANE@EXAMPLE.COM')
+        alone = self.create_raw('Bob@Example.com')
+
+        import_module('users.migrations.0005_normalize_emails').normalize_emails(apps, None)
+
+        emails = dict(User.objects.values_list('pk', 'email'))
+        self.assertEqual(emails, {
+            upper.pk: f'jane+duplicate-{upper.pk}@example.com',
+            lower.pk: 'jane@example.com',
+            shouting.pk: f'jane+duplicate-{shouting.pk}@example.com',
+            alone.pk: 'bob@example.com',
+        })
+        self.assertFalse(User.objects.exclude(username=F('email')).exists())
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    """ The load test replays its mix against a running server and reports, and compares, the results. """
+
+    databases = '__all__'
+
+    def load_test(self, **options) -> str:
+        stdout = io.StringIO()
+        call_command(
+            'load_test', url=self.live_server_url, users=2, duration=0.5, warmup=0, teams=1, members=2,
+            stdout=stdout, stderr=io.StringIO(), **options,
+        )
+        return stdout.getvalue()
+
+    def test_short_run_is_reported_and_compared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            self.load_test(output=output)
+            with open(output) as file:
+                results = json.load(file)
+            report = self.load_test(compare=output)
+
+        self.assertGreater(results['total']['requests'], 0)
+        self.assertEqual((results['total']['errors'], results['total']['rejected']), (0, 0))
+        self.assertEqual(set(results['endpoints']), set(DEFAULT_MIX))
+        self.assertIn('Compared with', report)
+        self.assertRegex(report, r'\ntotal +\d+')
+
+    def test_unknown_url_names_are_refused(self):
+        with self.assertRaisesMessage(CommandError, 'Unsupported URL names'):
+            self.load_test(mix='team_list=1,unknown=1')
@@ -2,6 +2,7 @@ from urllib.parse import urlencode
 from django.conf import settings
 from django.contrib.auth import login, logout
 from django.contrib.auth.hashers import make_password, check_password
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import DatabaseError
 from django.shortcuts import redirect
 from rest_framework import status, permissions, filters, mixins, serializers
@@ -14,10 +15,12 @@ from rest_framework.views import APIView
 
 from base.exception_handlers import RetryExceptionHandlerMixin
 from base.mixins import ListMixin
-from .google_oauth_utils import google_get_access_token, google_get_user_info
+from jobs.queue import enqueue
+from .google_id_token import verify_id_token
+from .google_oauth_utils import google_get_tokens
 from .permissions import DeleteUserPermission
 from .serializers import UserSerializer, LoginSerializer, UserEditSerializer, ChangePasswordSerializer
-from .models import User
+from .models import User, normalize_email
 
 from retrying import retry
 
@@ -184,7 +187,7 @@ class UserLoginAPIView(RetryExceptionHandlerMixin, CreateAPIView):
         password = data.get('password')
 
         try:
-            user = User.objects.get(email__iexact=email)
+            user = User.objects.get(email=email)
         except User.DoesNotExist:
             return Response({'message': 'Invalid Credentials'}, status=status.HTTP_403_FORBIDDEN)
 
@@ -236,22 +239,32 @@ class GoogleLoginApiView(RetryExceptionHandlerMixin, APIView):
         code = validated_data.get('code')
 
         redirect_uri = f'{settings.BASE_URL}{reverse("google_login_callback")}'
-        access_token = google_get_access_token(code=code, redirect_uri=redirect_uri)
+        tokens = google_get_tokens(code=code, redirect_uri=redirect_uri)
 
-        user_data = google_get_user_info(access_token=access_token)
         try:
-            user = User.objects.get(email=user_data.get('email'))
+            user_data = verify_id_token(tokens.get('id_token', ''))
+        except DjangoValidationError as error:
+            return Response({'message': error.messages[0]}, status=status.HTTP_403_FORBIDDEN)
+        email = normalize_email(user_data.get('email'))
+        first_name = user_data.get('given_name', '')
+        last_name = user_data.get('family_name', '')
+        try:
+            user = User.objects.get(email=email)
         except User.DoesNotExist:
-            email = user_data.get('email')
-            first_name = user_data.get('given_name', '')
-            last_name = user_data.get('family_name', '')
-
             user = User.objects.create(
                 email=email,
                 first_name=first_name,
                 last_name=last_name,
                 registration_method='google',
             )
+        else:
+            if user.registration_method == 'google' and (user.first_name, user.last_name) != (first_name, last_name):
+                # The profile changed on Google's side, the update does not hold the login.
+                enqueue(
+                    'users.refresh_google_profile',
+                    {'user_id': user.pk, 'first_name': first_name, 'last_name': last_name},
+                    owner=user, priority=-1,
+                )
         login(request, user)
 
         response_data = {'message': 'Login Successful'}